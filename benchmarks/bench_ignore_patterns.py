@@ -0,0 +1,75 @@
+"""
+microbenchmark of should_exclude_from_stats on a realistic path corpus
+
+    python -m benchmarks.bench_ignore_patterns
+
+compares the previous implementation, which tries each regex in turn, with the
+combined regex, with and without the per path cache. paths repeat across commits,
+so the corpus is sampled with a skewed distribution from a smaller set of paths.
+"""
+import random
+import re
+import timeit
+
+from indexer.utils import (
+    _IGNORE_PATTERNS_,
+    _is_ignored_,
+    ignore_patterns,
+    should_exclude_from_stats,
+)
+
+_N_PATHS_ = 20000
+_N_LOOKUPS_ = 200000
+
+_TEMPLATES_ = [
+    "src/main/java/com/company/{module}/service/{name}Service.java",
+    "src/test/java/com/company/{module}/{name}Test.java",
+    "src/main/resources/{module}/application-{name}.yaml",
+    "app/src/components/{module}/{name}.tsx",
+    "app/src/styles/_{name}.scss",
+    "vendor/github.com/{module}/{name}/{name}.go",
+    "ios/Pods/{module}/Sources/{name}.h",
+    "ios/{module}.xcodeproj/project.pbxproj",
+    "web/node_modules/{module}/lib/{name}.js",
+    "web/package-lock.json",
+    "go.sum",
+    "docs/{module}/{name}.md",
+]
+_WORDS_ = ["account", "payment", "ledger", "customer", "card", "loan", "auth", "notify", "report", "audit"]
+
+
+def path_corpus(rng: random.Random) -> list[str]:
+    paths = []
+    for _ in range(_N_PATHS_):
+        template = rng.choice(_TEMPLATES_)
+        paths.append(template.format(module=rng.choice(_WORDS_), name=rng.choice(_WORDS_) + str(rng.randint(0, 200))))
+    # a few files change in most commits, most files change rarely
+    weights = [1.0 / (rank + 1) for rank in range(len(paths))]
+    return rng.choices(paths, weights=weights, k=_N_LOOKUPS_)
+
+
+def main() -> None:
+    lookups = path_corpus(random.Random(42))
+    regexes = [re.compile(pattern) for pattern in _IGNORE_PATTERNS_]
+    combined = re.compile("|".join(f"(?:{pattern})" for pattern in ignore_patterns()))
+
+    def one_by_one() -> None:
+        for path in lookups:
+            any(regex.match(path) for regex in regexes)
+
+    def single_pass() -> None:
+        for path in lookups:
+            combined.match(path)
+
+    def cached() -> None:
+        for path in lookups:
+            should_exclude_from_stats(path)
+
+    print(f"{len(lookups):,} lookups of {len(set(lookups)):,} distinct paths")
+    for name, func in [("regex by regex", one_by_one), ("single pass", single_pass), ("single pass + cache", cached)]:
+        seconds = min(timeit.repeat(func, setup=_is_ignored_.cache_clear, number=1, repeat=5))
+        print(f"{name:>20}: {seconds * 1e9 / len(lookups):8.0f} ns/path")
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,100 @@
+"""
+throughput of index_commits on synthetic repositories
+
+    python -m benchmarks.bench_index_commits --commits 1000 --files 5 --branches 10 --vendor-ratio 0.3
+
+generates a repository with benchmarks.synthetic, then indexes it into an empty sqlite
+database, unless --database-url is given, and reports commits/sec, peak RSS and the
+number of queries for:
+
+    full         indexing the repository for the first time
+    incremental  indexing --incremental new commits added afterwards
+    unchanged    indexing again when nothing changed
+
+peak RSS is the peak of the process so far, so it never goes down between the runs.
+use --json to save the results for comparison between releases.
+"""
+import argparse
+import json
+import os
+import tempfile
+from typing import Any
+
+import django
+
+from benchmarks.synthetic import RepoSpec, add_commits, create_repo
+
+
+def main() -> None:
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--commits", type=int, default=500)
+    parser.add_argument("--files", type=int, default=5, help="files changed per commit")
+    parser.add_argument("--branches", type=int, default=10)
+    parser.add_argument("--vendor-ratio", type=float, default=0.3, help="share of changed files that are vendored")
+    parser.add_argument("--incremental", type=int, default=50, help="commits added before the incremental run")
+    parser.add_argument("--workers", type=int, default=1)
+    parser.add_argument("--queue-size", type=int, default=0)
+    parser.add_argument("--skip-ignored-diffs", action="store_true", default=False)
+    parser.add_argument("--seed", type=int, default=42)
+    parser.add_argument("--database-url", default="")
+    parser.add_argument("--json", default="", help="write the results to this file")
+    args = parser.parse_args()
+
+    spec = RepoSpec(args.commits, args.files, args.branches, args.vendor_ratio, args.seed)
+    with tempfile.TemporaryDirectory(prefix="bench_index_") as tmp_dir:
+        os.environ["DATABASE_URL"] = args.database_url or f"sqlite:///{tmp_dir}/bench.db"
+        os.environ.setdefault("DJANGO_SETTINGS_MODULE", "crawler.settings")
+        django.setup()
+
+        from django.core.management import call_command
+
+        call_command("migrate", verbosity=0)
+
+        repo_path = os.path.join(tmp_dir, "synthetic")
+        create_repo(repo_path, spec)
+
+        results: dict[str, Any] = {"spec": spec.__dict__, "runs": {}}
+        results["runs"]["full"] = run(repo_path, args)
+        add_commits(repo_path, spec, args.incremental, start=args.commits)
+        results["runs"]["incremental"] = run(repo_path, args)
+        results["runs"]["unchanged"] = run(repo_path, args)
+
+    print(f"\n{args.commits} commits, {args.files} files per commit, {args.branches} branches")
+    print(f"{'run':>12} {'commits':>8} {'seconds':>8} {'commits/s':>10} {'queries':>8} {'peak RSS':>9}")
+    for name, result in results["runs"].items():
+        print(
+            f"{name:>12} {result['commits']:8} {result['seconds']:8.2f} {result['commits_per_sec']:10.1f} "
+            f"{result['queries']:8} {result['peak_rss_mb']:6} MB"
+        )
+
+    if args.json:
+        with open(args.json, "w") as f:
+            json.dump(results, f, indent=2)
+
+
+def run(repo_path: str, args: argparse.Namespace) -> dict:
+    from indexer.extract import ExtractOptions
+    from indexer.metrics import IndexMetrics
+    from indexer.worker import index_commits
+
+    metrics = IndexMetrics("index_commits", repo_path)
+    n_commits = index_commits(
+        repo_path,
+        "local",
+        n_workers=args.workers,
+        queue_size=args.queue_size,
+        options=ExtractOptions(skip_ignored_diffs=args.skip_ignored_diffs),
+        metrics=metrics,
+    )
+    return {
+        "commits": n_commits,
+        "seconds": round(metrics.elapsed, 3),
+        "commits_per_sec": round(n_commits / metrics.elapsed, 1) if metrics.elapsed else 0.0,
+        "queries": metrics.counters["db_queries"],
+        "peak_rss_mb": metrics.peak_rss_mb,
+        "phases": {name: round(seconds, 3) for name, seconds in metrics.phases.items()},
+    }
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,130 @@
+"""
+latency of the search page, export_all_data and update_commit_stats on a seeded dataset
+
+    python -m benchmarks.bench_search --commits 100000 --files-per-commit 8
+
+seeds an empty sqlite database with the seed command, unless --database-url points to an
+existing database, then reports:
+
+    update_commit_stats   duration of updating the stats of all commits
+    search <type>         p50/p95 latency and queries of the search page by hash, email and repository
+    export                duration, rows and size of export_all_data
+
+with --database-url, the database is seeded only when --seed-data is given.
+"""
+import argparse
+import json
+import os
+import statistics
+import tempfile
+from time import perf_counter
+
+import django
+
+
+def main() -> None:
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--authors", type=int, default=200)
+    parser.add_argument("--repos", type=int, default=100)
+    parser.add_argument("--commits", type=int, default=20000)
+    parser.add_argument("--files-per-commit", type=int, default=8)
+    parser.add_argument("--repeat", type=int, default=20, help="requests per query type")
+    parser.add_argument("--database-url", default="")
+    parser.add_argument("--seed-data", action="store_true", default=False)
+    parser.add_argument("--json", default="", help="write the results to this file")
+    args = parser.parse_args()
+
+    with tempfile.TemporaryDirectory(prefix="bench_search_") as tmp_dir:
+        os.environ["DATABASE_URL"] = args.database_url or f"sqlite:///{tmp_dir}/bench.db"
+        os.environ.setdefault("DJANGO_SETTINGS_MODULE", "crawler.settings")
+        django.setup()
+
+        from django.core.management import call_command
+
+        call_command("migrate", verbosity=0)
+        if args.seed_data or not args.database_url:
+            call_command(
+                "seed",
+                n_authors=args.authors,
+                n_repos=args.repos,
+                n_commits=args.commits,
+                files_per_commit=args.files_per_commit,
+                skip_stats=True,
+            )
+
+        results = {"update_commit_stats": time_update_commit_stats(), "search": time_search(args.repeat)}
+        results["export"] = time_export(os.path.join(tmp_dir, "export.csv"))
+
+    print(f"\n{'update_commit_stats':>24} {results['update_commit_stats']['seconds']:8.2f} s")
+    for query_type, result in results["search"].items():
+        print(
+            f"{'search ' + query_type:>24} {result['p50_ms']:8.1f} ms p50 {result['p95_ms']:8.1f} ms p95 "
+            f"{result['queries']:5} queries"
+        )
+    export = results["export"]
+    print(f"{'export':>24} {export['seconds']:8.2f} s {export['rows']:,} rows {export['mb']:,.1f} MB")
+
+    if args.json:
+        with open(args.json, "w") as f:
+            json.dump(results, f, indent=2)
+
+
+def time_update_commit_stats() -> dict:
+    from indexer.worker import update_commit_stats
+
+    start_t = perf_counter()
+    update_commit_stats()
+    return {"seconds": round(perf_counter() - start_t, 3)}
+
+
+def time_search(repeat: int) -> dict:
+    from django.db import connection
+    from django.db.models import Count
+    from django.test import Client
+    from django.test.utils import CaptureQueriesContext
+
+    from indexer.models import Author, Commit, Repository
+
+    # the busiest author and repository, the worst case for the search
+    author = Author.objects.annotate(n_commits=Count("commits")).order_by("-n_commits").first()
+    repo = Repository.objects.annotate(n_commits=Count("commits")).order_by("-n_commits").first()
+    commit = Commit.objects.filter(author=author).first()
+    assert author is not None and repo is not None and commit is not None, "the database has no commits"
+    queries: dict[str, str] = {
+        "hash": commit.sha,
+        "email": author.real_email,
+        "repository": repo.repo_name,
+        "not found": "no-such-repository",
+    }
+
+    client, results = Client(), {}
+    for query_type, query in queries.items():
+        latencies = []
+        for _ in range(repeat):
+            with CaptureQueriesContext(connection) as captured:
+                start_t = perf_counter()
+                response = client.get("/indexer/search", {"query": query})
+                latencies.append((perf_counter() - start_t) * 1000)
+            assert response.status_code == 200
+        latencies.sort()
+        results[query_type] = {
+            "p50_ms": round(statistics.median(latencies), 2),
+            "p95_ms": round(latencies[min(len(latencies) - 1, int(len(latencies) * 0.95))], 2),
+            "queries": len(captured.captured_queries),
+        }
+    return results
+
+
+def time_export(csv_file: str) -> dict:
+    from indexer.worker import export_all_data
+
+    start_t = perf_counter()
+    export_all_data(csv_file)
+    seconds = perf_counter() - start_t
+    with open(csv_file) as f:
+        n_rows = sum(1 for _ in f) - 1
+    return {"seconds": round(seconds, 3), "rows": n_rows, "mb": round(os.path.getsize(csv_file) / 1048576, 2)}
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,85 @@
+"""
+generate synthetic git repositories for benchmarks
+
+commits are written with git fast-import, so that a repository with thousands of
+commits is created in seconds. the content and timestamps only depend on the
+parameters and the seed, so the same parameters always produce the same hashes.
+"""
+import random
+import subprocess
+from dataclasses import dataclass
+
+_EPOCH_ = 1672531200  # 2023-01-01
+_AUTHORS_ = [("Alice", "alice@example.com"), ("Bob", "bob@example.com"), ("Carol", "carol@example.com")]
+_MODULES_ = ["account", "payment", "ledger", "customer", "card", "loan", "auth", "notify"]
+
+
+@dataclass
+class RepoSpec:
+    n_commits: int = 500
+    files_per_commit: int = 5
+    n_branches: int = 10
+    # share of the changed files that are vendored and excluded from stats
+    vendor_ratio: float = 0.3
+    seed: int = 42
+
+
+def create_repo(path: str, spec: RepoSpec) -> None:
+    subprocess.run(["git", "init", "-q", "-b", "main", path], check=True)
+    add_commits(path, spec, spec.n_commits, start=0)
+
+    # branches point to commits along the history, so older commits are on more branches
+    refs = []
+    for seq in range(spec.n_branches):
+        prefix = ["feature", "bugfix", "release", "hotfix"][seq % 4]
+        mark = 1 + (seq * spec.n_commits) // max(spec.n_branches, 1)
+        refs.append(f"reset refs/heads/{prefix}/branch-{seq}\nfrom :{mark}\n\n")
+    _fast_import_(path, "".join(refs), marks=True)
+
+
+def add_commits(path: str, spec: RepoSpec, n_commits: int, start: int) -> None:
+    """add n_commits to main, numbered from start so that new commits differ from the existing ones"""
+    rng = random.Random(spec.seed + start)
+    source_files = [f"src/{module}/{module}_{seq}.py" for module in _MODULES_ for seq in range(10)]
+    vendor_files = [f"vendor/github.com/{module}/lib_{seq}.go" for module in _MODULES_ for seq in range(10)]
+
+    stream = []
+    for seq in range(start, start + n_commits):
+        name, email = rng.choice(_AUTHORS_)
+        timestamp = _EPOCH_ + seq * 600
+        stream.append(f"commit refs/heads/main\nmark :{seq + 1}\n")
+        stream.append(f"author {name} <{email}> {timestamp} +0000\n")
+        stream.append(f"committer {name} <{email}> {timestamp} +0000\n")
+        stream.append(_data_(f"commit {seq}"))
+        if seq == start and start > 0:
+            stream.append("from refs/heads/main^0\n")
+
+        n_vendor = sum(1 for _ in range(spec.files_per_commit) if rng.random() < spec.vendor_ratio)
+        changed = rng.sample(source_files, spec.files_per_commit - n_vendor) + rng.sample(vendor_files, n_vendor)
+        for file_path in changed:
+            stream.append(f"M 100644 inline {file_path}\n")
+            stream.append(_data_(_source_(file_path, seq, rng)))
+        stream.append("\n")
+
+    _fast_import_(path, "".join(stream), marks=start == 0)
+
+
+def _source_(file_path: str, seq: int, rng: random.Random) -> str:
+    n_funcs = rng.randint(3, 30)
+    if file_path.endswith(".go"):
+        return "package lib\n\n" + "".join(f"func F{i}() int {{ return {i + seq} }}\n" for i in range(n_funcs))
+    body = "def func_{i}(value):\n    if value > {i}:\n        return {seq}\n    return value\n\n"
+    return "".join(body.format(i=i, seq=seq) for i in range(n_funcs))
+
+
+def _data_(text: str) -> str:
+    data = text.encode()
+    return f"data {len(data)}\n{text}\n"
+
+
+def _fast_import_(path: str, stream: str, marks: bool) -> None:
+    # the marks file maps mark numbers to commits of the first import, used to create branches later
+    args = ["git", "fast-import", "--quiet"]
+    if marks:
+        args += ["--import-marks-if-exists=.git/bench-marks", "--export-marks=.git/bench-marks"]
+    subprocess.run(args, cwd=path, input=stream.encode(), check=True)
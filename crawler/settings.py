@@ -45,6 +45,7 @@ MIDDLEWARE = [
     "django.contrib.auth.middleware.AuthenticationMiddleware",
     "django.contrib.messages.middleware.MessageMiddleware",
     "django.middleware.clickjacking.XFrameOptionsMiddleware",
+    "indexer.middleware.QueryCountMiddleware",
 ]
 
 ROOT_URLCONF = "crawler.urls"
@@ -120,3 +121,20 @@ STATIC_URL = "static/"
 DEFAULT_AUTO_FIELD = "django.db.models.BigAutoField"
 
 CSRF_TRUSTED_ORIGINS = ["http://localhost:8080"]
+
+# file with one regular expression per line, files matching any of them are
+# excluded from commit stats. the defaults in indexer/utils.py are used when empty
+INDEXER_IGNORE_PATTERNS_FILE = os.getenv("INDEXER_IGNORE_PATTERNS_FILE", "")
+
+# shared secret of the gitlab and github webhooks, webhooks are rejected when empty
+INDEXER_WEBHOOK_SECRET = os.getenv("INDEXER_WEBHOOK_SECRET", "")
+# seconds to wait after a webhook event before indexing, events arriving meanwhile are indexed together
+INDEXER_WEBHOOK_DEBOUNCE = int(os.getenv("INDEXER_WEBHOOK_DEBOUNCE", "60"))
+
+# queries slower than this are logged with their call site, -1 disables the log
+INDEXER_SLOW_QUERY_MS = float(os.getenv("INDEXER_SLOW_QUERY_MS", "500"))
+# requests running more queries than this are logged, usually a sign of a N+1 query
+INDEXER_REQUEST_QUERY_BUDGET = int(os.getenv("INDEXER_REQUEST_QUERY_BUDGET", "20"))
+
+# keep all_commit_data in an indexed table refreshed after each index run, exports read the table
+INDEXER_MATERIALIZE_COMMIT_DATA = os.getenv("INDEXER_MATERIALIZE_COMMIT_DATA", "") == "1"
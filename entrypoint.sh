@@ -11,6 +11,17 @@ if [ $? -ne 0 ]; then
     python manage.py migrate
 fi
 
+if [ "$RUN_MODE" = "enqueue" ]; then
+    PYTHONUNBUFFERED=1 python manage.py index --source gitlab --query "$QUERY" --filter "$FILTER" --enqueue
+    exit $?
+fi
+
+if [ "$RUN_MODE" = "worker" ]; then
+    # any number of containers can drain the job queue concurrently
+    PYTHONUNBUFFERED=1 python manage.py worker $WORKER_ARGS
+    exit $?
+fi
+
 if [ "$RUN_MODE" != "index" ]; then
     gunicorn -w 1 crawler.wsgi --access-logfile - --bind 0.0.0.0:8000
     exit 0
@@ -0,0 +1,159 @@
+"""
+sql to load an export from a staging table into the all_commit_data table without emptying it.
+
+rows are matched on (committed_file_id, repo_id), the key of all_commit_data. matched rows are
+updated and new rows are inserted. rows of the target missing from the staging table are deleted,
+but only within the scope of the export: all rows for a full export, the month or repository group
+named by the file for a partition written by `index --export-dir`, also when the file has no rows.
+months are in UTC, as the export partitions them.
+
+the statements are generated by a dialect, BigQueryDialect for the cloud function and
+SQLiteDialect to run the same logic locally against an embedded database.
+"""
+import re
+from typing import Optional
+from urllib.parse import unquote
+
+KEY = ["committed_file_id", "repo_id"]
+# the column of all_commit_data each kind of partition is scoped by
+SCOPES = ["month", "repo_group"]
+
+_PARTITION_FILE_ = re.compile(r"^all_commit_data-(?P<name>.+)\.csv\.gz$")
+_MONTH_ = re.compile(r"^(\d{4}-\d{2}|no-date)$")
+_FULL_FILES_ = ["all_commit_data.csv", "all_commit_data.csv.gz"]
+
+
+class Dialect:
+    """the statements of a load, run in one transaction"""
+
+    def quote(self, table: str) -> str:
+        raise NotImplementedError
+
+    def literal(self, value: str) -> str:
+        raise NotImplementedError
+
+    def month(self, column: str) -> str:
+        raise NotImplementedError
+
+    def upsert(self, target: str, staging: str, columns: list[str]) -> list[str]:
+        raise NotImplementedError
+
+    def transaction(self, statements: list[str]) -> list[str]:
+        return ["BEGIN TRANSACTION"] + statements + ["COMMIT TRANSACTION"]
+
+    def scope(self, scope: str, alias: str) -> str:
+        if scope == "month":
+            expr = self.month(f"{alias}.commit_date")
+        elif scope == "repo_group":
+            expr = f"{alias}.repo_group"
+        else:
+            raise ValueError(f"scope must be one of {', '.join(SCOPES)}")
+        # rows without a date or group are a partition too
+        return f"COALESCE({expr}, '')"
+
+    def delete_missing(self, target: str, staging: str, scope: Optional[str], partition: Optional[str] = None) -> str:
+        matched = " AND ".join(f"s.{column} = t.{column}" for column in KEY)
+        sql = (
+            f"DELETE FROM {self.quote(target)} AS t"
+            f" WHERE NOT EXISTS (SELECT 1 FROM {self.quote(staging)} s WHERE {matched})"
+        )
+        if scope is not None:
+            if partition is None:
+                raise ValueError(f"the {scope} of the partition is missing")
+            # named by the file, so that an empty partition clears its rows
+            sql += f" AND {self.scope(scope, 't')} = {self.literal(partition)}"
+        return sql
+
+    def load(
+        self,
+        target: str,
+        staging: str,
+        columns: list[str],
+        scope: Optional[str] = None,
+        partition: Optional[str] = None,
+    ) -> list[str]:
+        return self.transaction(
+            self.upsert(target, staging, columns) + [self.delete_missing(target, staging, scope, partition)]
+        )
+
+
+class BigQueryDialect(Dialect):
+    def quote(self, table: str) -> str:
+        return f"`{table}`"
+
+    def literal(self, value: str) -> str:
+        escaped = value.replace("\\", "\\\\").replace("'", "\\'").replace("\n", "\\n").replace("\r", "\\r")
+        return f"'{escaped}'"
+
+    def month(self, column: str) -> str:
+        return f"FORMAT_TIMESTAMP('%Y-%m', {column})"
+
+    def upsert(self, target: str, staging: str, columns: list[str]) -> list[str]:
+        matched = " AND ".join(f"t.{column} = s.{column}" for column in KEY)
+        updates = ", ".join(f"{column} = s.{column}" for column in columns if column not in KEY)
+        return [
+            f"MERGE {self.quote(target)} t USING {self.quote(staging)} s ON {matched}"
+            f" WHEN MATCHED THEN UPDATE SET {updates}"
+            f" WHEN NOT MATCHED THEN INSERT ({', '.join(columns)}) VALUES ({', '.join(f's.{c}' for c in columns)})"
+        ]
+
+
+class SQLiteDialect(Dialect):
+    def quote(self, table: str) -> str:
+        return f'"{table}"'
+
+    def literal(self, value: str) -> str:
+        return "'" + value.replace("'", "''") + "'"
+
+    def month(self, column: str) -> str:
+        return f"strftime('%Y-%m', {column})"
+
+    def transaction(self, statements: list[str]) -> list[str]:
+        return ["BEGIN"] + statements + ["COMMIT"]
+
+    def upsert(self, target: str, staging: str, columns: list[str]) -> list[str]:
+        # sqlite has no MERGE, an upsert needs a unique index on the key
+        updates = ", ".join(f"{column} = excluded.{column}" for column in columns if column not in KEY)
+        index = f"{target}_{'_'.join(KEY)}"
+        return [
+            f"CREATE UNIQUE INDEX IF NOT EXISTS {self.quote(index)} ON {self.quote(target)} ({', '.join(KEY)})",
+            f"INSERT INTO {self.quote(target)} ({', '.join(columns)})"
+            f" SELECT {', '.join(columns)} FROM {self.quote(staging)} WHERE true"
+            f" ON CONFLICT ({', '.join(KEY)}) DO UPDATE SET {updates}",
+        ]
+
+
+def scope_of(file_name: str) -> Optional[str]:
+    """
+    the scope replaced by loading an export file, None for a full export.
+    raises ValueError for files that are not an export of all_commit_data
+    """
+    name = _partition_name_(file_name)
+    if name is None:
+        return None
+    return "month" if _MONTH_.match(name) else "repo_group"
+
+
+def partition_of(file_name: str) -> Optional[str]:
+    """
+    the month (YYYY-MM) or repository group replaced by loading a partition, '' for the rows without
+    a date or group, None for a full export. raises ValueError for files that are not an export of
+    all_commit_data
+    """
+    name = _partition_name_(file_name)
+    if name is None:
+        return None
+    if name in ["no-date", "no-group"]:
+        return ""
+    # the export percent encodes the names of the groups
+    return name if _MONTH_.match(name) else unquote(name)
+
+
+def _partition_name_(file_name: str) -> Optional[str]:
+    base_name = file_name.split("/")[-1]
+    if base_name in _FULL_FILES_:
+        return None
+    match = _PARTITION_FILE_.match(base_name)
+    if match is None:
+        raise ValueError(f"{file_name} is not an export of all_commit_data")
+    return match["name"]
@@ -0,0 +1,226 @@
+"""
+read-only json api. results are streamed as newline delimited json, one object per line,
+ordered by primary key. when there are more results, the Link header has the url of the
+next page, which continues after the last key of this page.
+
+    GET /indexer/api/commits?repo=<repo_name>&author=<email>&since=2023-01-01&until=2023-02-01&branch=main
+    GET /indexer/api/files?...
+    GET /indexer/api/merge_requests?repo=<repo_name>&since=...&until=...
+    GET /indexer/api/rollups?repo=<repo_name>&author=<email>&since=...&until=...
+
+since is inclusive and until is exclusive, either a date or an ISO 8601 timestamp.
+branch is one of utils.BRANCH_CATEGORIES. limit is the page size, at most 10000.
+"""
+import json
+from datetime import date, datetime, time
+from typing import Callable, Iterable, Iterator, Optional
+
+from django.core.serializers.json import DjangoJSONEncoder
+from django.db.models import F, QuerySet
+from django.http import HttpRequest, JsonResponse, QueryDict, StreamingHttpResponse
+from django.http.response import HttpResponseBase
+from django.utils.dateparse import parse_date, parse_datetime
+from django.utils.timezone import is_aware, make_aware
+from django.views.decorators.http import require_GET
+
+from .models import (
+    Commit,
+    CommittedFile,
+    DailyRollup,
+    MergeRequest,
+    RepositoryCommitLink,
+)
+from .utils import BRANCH_CATEGORIES, branch_masks_including
+
+_DEFAULT_LIMIT_ = 1000
+_MAX_LIMIT_ = 10000
+_CHUNK_SIZE_ = 500
+
+_COMMIT_FIELDS_ = [
+    "sha",
+    "created_at",
+    "branches",
+    "is_merge",
+    "n_lines",
+    "n_files",
+    "n_insertions",
+    "n_deletions",
+    "n_lines_changed",
+    "n_lines_ignored",
+    "n_files_changed",
+    "n_files_ignored",
+]
+_FILE_FIELDS_ = [
+    "id",
+    "commit_sha",
+    "change_type",
+    "file_path",
+    "file_name",
+    "file_type",
+    "n_lines_added",
+    "n_lines_deleted",
+    "n_lines_changed",
+    "n_lines_of_code",
+    "n_methods",
+    "n_methods_changed",
+    "is_on_exclude_list",
+    "is_superfluous",
+]
+_MERGE_REQUEST_FIELDS_ = [
+    "id",
+    "request_id",
+    "title",
+    "state",
+    "source_branch",
+    "target_branch",
+    "source_sha",
+    "merge_sha",
+    "created_at",
+    "merged_at",
+    "updated_at",
+    "is_merged",
+    "merged_by_username",
+]
+_ROLLUP_FIELDS_ = [
+    "id",
+    "day",
+    "file_type",
+    "n_commits",
+    "n_files_changed",
+    "n_files_ignored",
+    "n_lines_changed",
+    "n_lines_ignored",
+]
+
+# a query for a page, the primary key, the fields and the fields of related objects by their name in the result
+Query = tuple[QuerySet, str, list[str], dict[str, str]]
+
+
+@require_GET
+def commits(request: HttpRequest) -> HttpResponseBase:
+    return _api_(request, _commits_)
+
+
+@require_GET
+def files(request: HttpRequest) -> HttpResponseBase:
+    return _api_(request, _files_)
+
+
+@require_GET
+def merge_requests(request: HttpRequest) -> HttpResponseBase:
+    return _api_(request, _merge_requests_)
+
+
+@require_GET
+def rollups(request: HttpRequest) -> HttpResponseBase:
+    return _api_(request, _rollups_)
+
+
+def _api_(request: HttpRequest, query: Callable[[QueryDict], Query]) -> HttpResponseBase:
+    params = request.GET
+    try:
+        queryset, key, fields, related = query(params)
+        limit = int(params.get("limit", _DEFAULT_LIMIT_))
+        if not 0 < limit <= _MAX_LIMIT_:
+            raise ValueError(f"limit must be between 1 and {_MAX_LIMIT_}")
+        if after := params.get("after"):
+            queryset = queryset.filter(**{f"{key}__gt": after})
+        queryset = queryset.order_by(key)
+        # the key of the last row of the page, and whether there are more rows after it
+        last_keys = [str(value) for value in queryset.values_list(key, flat=True)[limit - 1 : limit + 1]]
+    except ValueError as e:
+        return JsonResponse({"error": str(e)}, status=400)
+
+    rows = queryset.values(*fields, **{name: F(path) for name, path in related.items()})[:limit]
+    response = StreamingHttpResponse(_ndjson_(rows), content_type="application/x-ndjson")
+    if len(last_keys) == 2:
+        next_params = params.copy()
+        next_params["after"] = last_keys[0]
+        response["Link"] = f'<{request.path}?{next_params.urlencode()}>; rel="next"'
+    return response
+
+
+def _ndjson_(rows: QuerySet) -> Iterator[str]:
+    for row in rows.iterator(chunk_size=_CHUNK_SIZE_):
+        yield json.dumps(row, cls=DjangoJSONEncoder) + "\n"
+
+
+def _commits_(params: QueryDict) -> Query:
+    queryset = Commit.objects.all()
+    if repo := params.get("repo"):
+        queryset = queryset.filter(sha__in=_shas_in_repo_(repo))
+    if author := params.get("author"):
+        queryset = queryset.filter(author__real_email=author)
+    if branch := params.get("branch"):
+        queryset = queryset.filter(branch_mask__in=_branch_masks_(branch))
+    queryset = queryset.filter(**_date_range_(params, "created_at"))
+    return queryset, "sha", _COMMIT_FIELDS_, {"author_email": "author__real_email"}
+
+
+def _files_(params: QueryDict) -> Query:
+    queryset = CommittedFile.objects.all()
+    if repo := params.get("repo"):
+        queryset = queryset.filter(commit_id__in=_shas_in_repo_(repo))
+    if author := params.get("author"):
+        queryset = queryset.filter(commit__author__real_email=author)
+    if branch := params.get("branch"):
+        queryset = queryset.filter(commit__branch_mask__in=_branch_masks_(branch))
+    queryset = queryset.filter(**_date_range_(params, "commit__created_at"))
+    return queryset, "id", _FILE_FIELDS_, {"created_at": "commit__created_at"}
+
+
+def _merge_requests_(params: QueryDict) -> Query:
+    _unsupported_(params, ["author", "branch"], "merge requests")
+    queryset = MergeRequest.objects.all()
+    if repo := params.get("repo"):
+        queryset = queryset.filter(repo__repo_name=repo)
+    queryset = queryset.filter(**_date_range_(params, "created_at"))
+    return queryset, "id", _MERGE_REQUEST_FIELDS_, {"repo_name": "repo__repo_name"}
+
+
+def _rollups_(params: QueryDict) -> Query:
+    _unsupported_(params, ["branch"], "rollups")
+    queryset = DailyRollup.objects.all()
+    if repo := params.get("repo"):
+        queryset = queryset.filter(repo__repo_name=repo)
+    if author := params.get("author"):
+        queryset = queryset.filter(author__real_email=author)
+    queryset = queryset.filter(**{k: v.date() for k, v in _date_range_(params, "day").items()})
+    return queryset, "id", _ROLLUP_FIELDS_, {"author_email": "author__real_email", "repo_name": "repo__repo_name"}
+
+
+def _shas_in_repo_(repo_name: str) -> QuerySet:
+    # a subquery, so that a commit linked to several repositories of the same name is returned once
+    return RepositoryCommitLink.objects.filter(repo__repo_name=repo_name).values("commit_id")
+
+
+def _branch_masks_(category: str) -> list[int]:
+    if category not in BRANCH_CATEGORIES:
+        raise ValueError(f"branch must be one of {', '.join(BRANCH_CATEGORIES)}")
+    return branch_masks_including(category)
+
+
+def _date_range_(params: QueryDict, field: str) -> dict[str, datetime]:
+    xfilter = {}
+    for param, lookup in [("since", "gte"), ("until", "lt")]:
+        value = _parse_timestamp_(params.get(param))
+        if value is not None:
+            xfilter[f"{field}__{lookup}"] = value
+    return xfilter
+
+
+def _parse_timestamp_(value: Optional[str]) -> Optional[datetime]:
+    if not value:
+        return None
+    parsed: Optional[datetime | date] = parse_datetime(value) or parse_date(value)
+    if parsed is None:
+        raise ValueError(f"{value} is not a date or timestamp")
+    if not isinstance(parsed, datetime):
+        parsed = datetime.combine(parsed, time.min)
+    return parsed if is_aware(parsed) else make_aware(parsed)
+
+
+def _unsupported_(params: QueryDict, names: Iterable[str], resource: str) -> None:
+    for name in names:
+        if params.get(name):
+            raise ValueError(f"{resource} cannot be filtered by {name}")
@@ -0,0 +1,201 @@
+"""
+export all_commit_data as one gzip compressed csv file per month or per repository group,
+written in parallel by worker processes. manifest.json lists the rows and the sha256 of each
+partition. a partition is only uploaded when its hash differs from the previous manifest, and
+the manifest marks it as changed, so that loaders can skip the unchanged partitions. a partition
+of the previous manifest without rows now is written with the header only, so that loading it
+clears its rows. the file names are the partition names the loader scopes the rows by.
+"""
+import csv
+import hashlib
+import json
+import multiprocessing
+import os
+import re
+from concurrent.futures import ProcessPoolExecutor, as_completed
+from dataclasses import dataclass, field
+from datetime import datetime, timezone
+from typing import Any
+from urllib.parse import quote
+
+import django
+from django.db import connection, connections
+
+from .models import Commit, Repository
+from .utils import log, upload_file
+from .worker import write_all_data
+
+MANIFEST = "manifest.json"
+PARTITION_BY = ["month", "repo_group"]
+# names the loader reads as a month partition or the rows without a group
+_RESERVED_NAME_ = re.compile(r"^(\d{4}-\d{2}|no-date|no-group)$")
+# set by every index run, also when there are no new commits, left out of the hash of a partition
+_VOLATILE_COLUMNS_ = ["last_indexed_at"]
+
+
+@dataclass
+class Partition:
+    name: str
+    # condition on all_commit_data with placeholders for params
+    where: str
+    params: list[Any] = field(default_factory=list)
+
+    @property
+    def file_name(self) -> str:
+        return f"all_commit_data-{self.name}.csv.gz"
+
+
+def partitions(partition_by: str) -> list[Partition]:
+    if partition_by == "month":
+        result = [
+            Partition(
+                month.strftime("%Y-%m"),
+                "commit_date >= %s and commit_date < %s",
+                # raw sql, the timestamps must be in the format the database stores them
+                [connection.ops.adapt_datetimefield_value(value) for value in (month, _next_month_(month))],
+            )
+            # months in UTC, as the loader derives them from commit_date
+            for month in Commit.objects.filter(created_at__isnull=False).datetimes(
+                "created_at", "month", tzinfo=timezone.utc
+            )
+        ]
+        if Commit.objects.filter(created_at__isnull=True).exists():
+            result.append(Partition("no-date", "commit_date is null"))
+        return result
+
+    if partition_by == "repo_group":
+        groups = set(Repository.objects.values_list("repo_group", flat=True).distinct())
+        result = [Partition(_group_name_(group), "repo_group = %s", [group]) for group in sorted(filter(None, groups))]
+        if None in groups or "" in groups:
+            # the loader does not tell an empty group from none
+            result.append(Partition("no-group", "COALESCE(repo_group, '') = ''"))
+        return result
+
+    raise ValueError(f"partition_by must be one of {', '.join(PARTITION_BY)}")
+
+
+def export_partitioned(
+    output_dir: str, partition_by: str = "month", n_jobs: int = 1, upload: bool = False
+) -> list[dict[str, Any]]:
+    """
+    write one file per partition to output_dir and replace the manifest there, returns the manifest entries.
+    with upload, the changed partitions are uploaded to <basename of output_dir>/, then the manifest.
+    when a partition cannot be written, the export fails before anything is uploaded and the previous
+    manifest and files are left as they were.
+    """
+    os.makedirs(output_dir, exist_ok=True)
+    previous = _read_manifest_(os.path.join(output_dir, MANIFEST), partition_by)
+    todo = partitions(partition_by)
+    names = {partition.name for partition in todo}
+    # the partitions that have no rows left, e.g. after a repository is removed
+    todo += [Partition(name, "1 = 0") for name in sorted(previous) if name not in names]
+
+    entries = []
+    if n_jobs <= 1:
+        entries = [_write_partition_(output_dir, partition) for partition in todo]
+    else:
+        # connections cannot be shared with the child processes
+        connections.close_all()
+        context = multiprocessing.get_context("spawn")
+        with ProcessPoolExecutor(max_workers=n_jobs, mp_context=context, initializer=django.setup) as executor:
+            futures = {executor.submit(_write_partition_, output_dir, partition): partition for partition in todo}
+            failed = []
+            for future in as_completed(futures):
+                try:
+                    entries.append(future.result())
+                except Exception as e:
+                    print(f"Exception exporting partition {futures[future].name} => {str(e)}")
+                    failed.append(futures[future].name)
+        if failed:
+            # a manifest without the partition would tell loaders that its rows are gone
+            raise RuntimeError(f"failed to export partitions {', '.join(sorted(failed))} to {output_dir}")
+
+    entries.sort(key=lambda entry: entry["name"])
+    for entry in entries:
+        entry["changed"] = previous.get(entry["name"]) != entry["sha256"]
+
+    prefix = os.path.basename(os.path.normpath(output_dir))
+    if upload:
+        for entry in entries:
+            if entry["changed"] and not upload_file(
+                os.path.join(output_dir, entry["file"]), f"{prefix}/{entry['file']}"
+            ):
+                # uploaded again by the next export
+                entry["changed"], entry["sha256"] = True, ""
+
+    manifest_file = os.path.join(output_dir, MANIFEST)
+    with open(manifest_file, "w") as f:
+        json.dump(
+            {
+                "created_at": datetime.now(timezone.utc).isoformat(),
+                "partition_by": partition_by,
+                "partitions": entries,
+            },
+            f,
+            indent=2,
+        )
+    if upload:
+        upload_file(manifest_file, f"{prefix}/{MANIFEST}")
+
+    n_changed = sum(1 for entry in entries if entry["changed"])
+    log(f"exported {len(entries)} partitions by {partition_by} to {output_dir}, {n_changed} changed")
+    return entries
+
+
+def _write_partition_(output_dir: str, partition: Partition) -> dict[str, Any]:
+    path = os.path.join(output_dir, partition.file_name)
+    # the file of the previous export is only replaced once the partition is written completely
+    partial = f"{path}.partial"
+    digest = _RowDigest_()
+    try:
+        with open(partial, "wb") as f:
+            n_rows = write_all_data(f, compress=True, where=partition.where, params=partition.params, on_rows=digest)
+    except BaseException:
+        os.remove(partial)
+        raise
+    os.replace(partial, path)
+    return {"name": partition.name, "file": partition.file_name, "rows": n_rows, "sha256": digest.hexdigest()}
+
+
+class _RowDigest_:
+    """sha256 of the rows of a partition as csv, without the volatile columns"""
+
+    def __init__(self) -> None:
+        self._sha256 = hashlib.sha256()
+        self._writer = csv.writer(self)
+        self._keep: list[int] = []
+
+    def __call__(self, columns: list[str], rows: list[tuple]) -> None:
+        if not self._keep:
+            self._keep = [i for i, column in enumerate(columns) if column not in _VOLATILE_COLUMNS_]
+        self._writer.writerows([row[i] for i in self._keep] for row in rows)
+
+    def write(self, text: str) -> None:
+        self._sha256.update(text.encode("utf-8"))
+
+    def hexdigest(self) -> str:
+        return self._sha256.hexdigest()
+
+
+def _read_manifest_(path: str, partition_by: str) -> dict[str, str]:
+    """sha256 of each partition in a manifest, empty if there is none or it is partitioned differently"""
+    if not os.path.isfile(path):
+        return {}
+    with open(path) as f:
+        manifest = json.load(f)
+    if manifest.get("partition_by") != partition_by:
+        return {}
+    return {entry["name"]: entry["sha256"] for entry in manifest.get("partitions", [])}
+
+
+def _next_month_(month: datetime) -> datetime:
+    return month.replace(year=month.year + 1, month=1) if month.month == 12 else month.replace(month=month.month + 1)
+
+
+def _group_name_(group: str) -> str:
+    # percent encoded, so that the loader can tell the group from the file name
+    name = quote(group, safe="")
+    if _RESERVED_NAME_.match(name):
+        # the first character is encoded too, so that the group is not taken for a month or no group
+        name = f"%{ord(name[0]):02X}{name[1:]}"
+    return name
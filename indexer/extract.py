@@ -0,0 +1,372 @@
+import hashlib
+import json
+import os
+import shutil
+import sqlite3
+import tempfile
+import threading
+import zlib
+from contextlib import contextmanager
+from dataclasses import astuple, dataclass, field, fields
+from datetime import datetime
+from typing import ClassVar, Iterator, List, Optional
+
+from git import NULL_TREE, Git, Repo
+from pydriller import Repository as PyDrillerRepository
+from pydriller.domain.commit import Commit as PyDrillerCommit
+from pydriller.domain.commit import ModifiedFile
+from pydriller.utils.conf import Conf
+
+from .utils import ignore_patterns, normalize_branches, should_exclude_from_stats
+
+#
+# extraction of commit information from git
+#
+# the records produced here do not hold any reference to git or database objects,
+# which allow them to be pickled and passed between processes. they are turned into
+# database rows by worker.py. nothing in this module should touch the database.
+#
+
+# hash of the empty tree, used to diff the first commit of a repository
+_EMPTY_TREE_ = "4b825dc642cb6eb9a060e54bf8d69288fbee4904"
+_MAX_PATHSPECS_ = 1000
+# increase when the extraction logic changes, to invalidate ExtractCache
+_EXTRACT_VERSION_ = 2
+# git diff --name-status letters to pydriller ModificationType names
+_CHANGE_TYPES_ = {"A": "ADD", "D": "DELETE", "M": "MODIFY", "T": "MODIFY", "R": "RENAME", "C": "COPY"}
+
+
+@dataclass
+class FileRecord:
+    change_type: str
+    file_path: str
+    file_name: str
+    n_lines_added: int = 0
+    n_lines_deleted: int = 0
+    n_lines_of_code: int = 0
+    n_methods: int = 0
+    n_methods_changed: int = 0
+
+
+@dataclass
+class CommitRecord:
+    sha: str
+    created_at: datetime
+    branches: str = ""
+    message: str = ""
+    author_name: str = ""
+    author_email: str = ""
+    is_merge: bool = False
+    n_lines: int = 0
+    n_files: int = 0
+    n_insertions: int = 0
+    n_deletions: int = 0
+    # files are counted with numstat only, see ExtractOptions.max_files
+    stats_only: bool = False
+    # None when only sha, created_at and branches are extracted
+    files: Optional[List[FileRecord]] = field(default=None)
+
+
+@dataclass
+class ExtractOptions:
+    # files matching the ignore patterns are counted with git diff --numstat only,
+    # without loading their diff or calculating code metrics with lizard
+    skip_ignored_diffs: bool = False
+    # commits that change more files or lines than these limits, e.g. a vendored SDK import,
+    # are extracted with numstat only and flagged, so that they can be analyzed later.
+    # 0 means no limit
+    max_files: int = 0
+    max_lines: int = 0
+    # path to an ExtractCache database, empty for no cache
+    cache_path: str = ""
+
+    @property
+    def tier(self) -> str:
+        """identifies the kind of metrics extracted with these options, part of the cache key"""
+        if not self.skip_ignored_diffs:
+            return f"{_EXTRACT_VERSION_}:full"
+        # the ignore patterns decide which diffs are skipped, records extracted with other patterns differ
+        patterns = hashlib.sha1(json.dumps(ignore_patterns()).encode()).hexdigest()[:12]
+        return f"{_EXTRACT_VERSION_}:skip_ignored:{patterns}"
+
+    def is_too_large(self, n_files: int, n_lines: int) -> bool:
+        return (self.max_files > 0 and n_files > self.max_files) or (self.max_lines > 0 and n_lines > self.max_lines)
+
+
+def commit_record(
+    git_commit: PyDrillerCommit, full: bool = True, options: Optional[ExtractOptions] = None
+) -> CommitRecord:
+    """
+    convert a pydriller commit into a CommitRecord
+    when full is False, only the branches are extracted, which avoids the expensive diff
+    """
+    options = options or ExtractOptions()
+    record = CommitRecord(
+        sha=git_commit.hash,
+        created_at=git_commit.committer_date,
+        branches=normalize_branches(git_commit.branches),
+    )
+    if not full:
+        return record
+
+    cache = ExtractCache.shared(options.cache_path) if options.cache_path else None
+    if cache:
+        cached = cache.get(record.sha, options.tier)
+        if cached:
+            # branches change over time and are never cached
+            cached.branches = record.branches
+            return cached
+
+    record.message = git_commit.msg[:2048]  # some commits has super long message, e.g. squash merge
+    record.author_name = git_commit.committer.name.lower()
+    record.author_email = git_commit.committer.email.lower()
+    record.is_merge = git_commit.merge
+
+    # pydriller runs git diff --numstat again for each of lines, files, insertions and deletions
+    total = git_commit._c_object.stats.total
+    record.n_lines = total["lines"]
+    record.n_files = total["files"]
+    record.n_insertions = total["insertions"]
+    record.n_deletions = total["deletions"]
+
+    if options.is_too_large(record.n_files, record.n_lines):
+        record.stats_only = True
+        record.files = _files_stats_only_(git_commit)
+    elif options.skip_ignored_diffs:
+        record.files = _files_skip_ignored_(git_commit)
+    else:
+        record.files = [_file_record_(mod) for mod in git_commit.modified_files]
+
+    if cache and not record.stats_only:
+        cache.put(record, options.tier)
+    return record
+
+
+def _file_record_(mod: ModifiedFile) -> FileRecord:
+    return FileRecord(
+        change_type=str(mod.change_type).split(".")[1],  # enum ModificationType.ADD => "ADD"
+        file_path=mod.new_path or mod.old_path,
+        file_name=mod.filename,
+        n_lines_added=mod.added_lines,
+        n_lines_deleted=mod.deleted_lines,
+        n_lines_of_code=mod.nloc if mod.nloc else 0,
+        n_methods=len(mod.methods),
+        n_methods_changed=len(mod.changed_methods),
+    )
+
+
+def _files_stats_only_(git_commit: PyDrillerCommit) -> List[FileRecord]:
+    """the files of the commit from numstat, without diffs and code metrics"""
+    if git_commit.merge:
+        return []
+    c_object = git_commit._c_object
+    return numstat(c_object.repo.git, c_object.parents[0].hexsha if c_object.parents else _EMPTY_TREE_, c_object.hexsha)
+
+
+def _files_skip_ignored_(git_commit: PyDrillerCommit) -> List[FileRecord]:
+    """
+    same as the modified files of the commit, but the diff is only requested from git
+    for files that are not excluded from stats, by passing their paths as pathspecs.
+    excluded files, e.g. vendored dependencies, are recorded from the numstat output
+    """
+    if git_commit.merge:
+        # pydriller does not return modified files for merge commits either
+        return []
+
+    # pydriller does not expose the underlying GitPython commit
+    c_object = git_commit._c_object
+    parent = c_object.parents[0] if c_object.parents else None
+    stats, old_paths = _numstat_(c_object.repo.git, parent.hexsha if parent else _EMPTY_TREE_, c_object.hexsha)
+
+    files = [stat for stat in stats if should_exclude_from_stats(stat.file_path)]
+    if not files:
+        return [_file_record_(mod) for mod in git_commit.modified_files]
+
+    included = [stat.file_path for stat in stats if not should_exclude_from_stats(stat.file_path)]
+    if included:
+        # both paths of a rename are needed for git to detect it
+        pathspecs = included + [old_paths[path] for path in included if path in old_paths]
+        # very long path lists can exceed the command line limit, diff everything in that case
+        paths = [f":(literal){path}" for path in pathspecs] if len(pathspecs) <= _MAX_PATHSPECS_ else None
+        if parent:
+            diff_index = parent.diff(other=c_object, paths=paths, create_patch=True)
+        else:
+            diff_index = c_object.diff(NULL_TREE, paths=paths, create_patch=True)
+        for diff in diff_index:
+            mod = ModifiedFile(diff=diff)
+            if not should_exclude_from_stats(mod.new_path or mod.old_path):
+                files.append(_file_record_(mod))
+    return files
+
+
+def numstat(git: Git, from_rev: str, to_rev: str) -> List[FileRecord]:
+    """
+    list the files changed between 2 revisions with number of lines added and deleted,
+    using git diff --numstat and --name-status, which do not need to produce the diff text.
+    renames are detected like in the diffs pydriller uses, a renamed file is one RENAME record
+    """
+    return _numstat_(git, from_rev, to_rev)[0]
+
+
+def _numstat_(git: Git, from_rev: str, to_rev: str) -> tuple[List[FileRecord], dict[str, str]]:
+    """numstat, and the old paths of renamed and copied files by their new path"""
+    change_types, old_paths = {}, {}
+    # output of -z is status\0path\0 for each file, status\0old path\0new path\0 for renames and copies
+    tokens = git.diff(from_rev, to_rev, "--name-status", "-M", "-z").split("\0")
+    i = 0
+    while i < len(tokens) - 1:
+        status = tokens[i]
+        n_paths = 2 if status[:1] in ("R", "C") else 1
+        change_types[tokens[i + n_paths]] = _CHANGE_TYPES_.get(status[:1], "UNKNOWN")
+        if n_paths == 2:
+            old_paths[tokens[i + 2]] = tokens[i + 1]
+        i += 1 + n_paths
+
+    files = []
+    # output of -z is added\tdeleted\tpath\0 for each file, added\tdeleted\t\0old path\0new path\0
+    # for renames. added and deleted are - for binary files
+    tokens = git.diff(from_rev, to_rev, "--numstat", "-M", "-z").split("\0")
+    i = 0
+    while i < len(tokens) - 1:
+        added, deleted, path = tokens[i].split("\t", 2)
+        if path:
+            i += 1
+        else:
+            path = tokens[i + 2]
+            i += 3
+        files.append(
+            FileRecord(
+                change_type=change_types.get(path, "UNKNOWN"),
+                file_path=path,
+                file_name=os.path.basename(path),
+                n_lines_added=int(added) if added.isdigit() else 0,
+                n_lines_deleted=int(deleted) if deleted.isdigit() else 0,
+            )
+        )
+    return files, old_paths
+
+
+def traverse(path_to_repo: str, since: datetime) -> Iterator[PyDrillerCommit]:
+    """traverse commits on all branches, including remote ones"""
+    yield from PyDrillerRepository(
+        path_to_repo,
+        include_refs=True,
+        include_remotes=True,
+        since=since,
+    ).traverse_commits()
+
+
+def extract_chunk(
+    path_to_repo: str, shas: List[str], full: bool, options: Optional[ExtractOptions] = None
+) -> List[CommitRecord]:
+    """
+    extract a list of commits from a local repository.
+    entry point for worker processes, see worker.index_commits
+
+    the commits are looked up directly instead of using PyDrillerRepository, which
+    would traverse the whole history and write to the git config of the repository
+    every time it is opened, which fails when several processes do it at once.
+    """
+    conf = Conf({"path_to_repo": path_to_repo, "include_refs": True, "include_remotes": True})
+    repo = Repo(path_to_repo)
+    try:
+        return [commit_record(PyDrillerCommit(repo.commit(sha), conf), full, options) for sha in shas]
+    finally:
+        repo.close()
+
+
+def partition(items: List[str], n_chunks: int) -> List[List[str]]:
+    """split a list into at most n_chunks contiguous, disjoint chunks of similar size"""
+    if not items:
+        return []
+    size = -(-len(items) // max(n_chunks, 1))  # ceiling division
+    return [items[i : i + size] for i in range(0, len(items), size)]
+
+
+@contextmanager
+def local_clone(clone_url: str) -> Iterator[str]:
+    """
+    yields a local path to the repository. remote repositories are cloned into
+    a temporary directory that is removed on exit, so that multiple processes
+    can read from a single clone
+    """
+    if os.path.isdir(os.path.expanduser(clone_url)):
+        yield clone_url
+        return
+
+    tmp_dir = tempfile.mkdtemp()
+    try:
+        repo_dir = os.path.join(tmp_dir, "repo")
+        Repo.clone_from(url=clone_url, to_path=repo_dir, no_checkout=True)
+        yield repo_dir
+    finally:
+        shutil.rmtree(tmp_dir, ignore_errors=True)
+
+
+class ExtractCache:
+    """
+    local cache of extracted commits, so that rebuilding the database does not need
+    to diff every commit again.
+
+    records are keyed by commit hash and ExtractOptions.tier. each record is stored as a
+    zlib compressed JSON document, with the files stored column by column. the cache is
+    a SQLite database, which can be shared by threads and worker processes.
+    """
+
+    _COMMIT_FIELDS_ = [f.name for f in fields(CommitRecord) if f.name not in ("sha", "branches", "files", "created_at")]
+    _FILE_FIELDS_ = [f.name for f in fields(FileRecord)]
+
+    _instances_: ClassVar[dict[str, "ExtractCache"]] = {}
+    _instances_lock_ = threading.Lock()
+
+    def __init__(self, path: str) -> None:
+        self.path = os.path.abspath(os.path.expanduser(path))
+        self._local = threading.local()
+        self._conn().execute(
+            "create table if not exists commits (sha text, tier text, data blob, primary key (sha, tier))"
+        )
+
+    @classmethod
+    def shared(cls, path: str) -> "ExtractCache":
+        """return the cache for the path, shared within the process"""
+        with cls._instances_lock_:
+            if path not in cls._instances_:
+                cls._instances_[path] = ExtractCache(path)
+            return cls._instances_[path]
+
+    def get(self, sha: str, tier: str) -> Optional[CommitRecord]:
+        row = self._conn().execute("select data from commits where sha = ? and tier = ?", (sha, tier)).fetchone()
+        return self._decode_(sha, row[0]) if row else None
+
+    def put(self, record: CommitRecord, tier: str) -> None:
+        with self._conn() as conn:
+            conn.execute(
+                "insert or replace into commits (sha, tier, data) values (?, ?, ?)",
+                (record.sha, tier, self._encode_(record)),
+            )
+
+    def _conn(self) -> sqlite3.Connection:
+        # sqlite connections cannot be shared between threads
+        conn = getattr(self._local, "conn", None)
+        if conn is None:
+            conn = sqlite3.connect(self.path, timeout=60)
+            conn.execute("pragma journal_mode=wal")
+            self._local.conn = conn
+        return conn
+
+    def _encode_(self, record: CommitRecord) -> bytes:
+        files = record.files or []
+        doc = {
+            "commit": [getattr(record, name) for name in self._COMMIT_FIELDS_],
+            "created_at": record.created_at.isoformat(),
+            "files": [list(column) for column in zip(*[astuple(f) for f in files])],
+        }
+        return zlib.compress(json.dumps(doc, separators=(",", ":")).encode())
+
+    def _decode_(self, sha: str, data: bytes) -> CommitRecord:
+        doc = json.loads(zlib.decompress(data))
+        record = CommitRecord(sha=sha, created_at=datetime.fromisoformat(doc["created_at"]))
+        for name, value in zip(self._COMMIT_FIELDS_, doc["commit"]):
+            setattr(record, name, value)
+        record.files = [FileRecord(*values) for values in zip(*doc["files"])]
+        return record
@@ -0,0 +1,272 @@
+import os
+import socket
+import threading
+import time
+import traceback
+from datetime import datetime, timedelta, timezone
+from typing import Iterable, Optional
+
+import gitlab
+from django.db import connection
+from django.db.models import Exists, F, OuterRef, Q
+from github import Auth, Github
+
+from .ledger import finish_run, record_repo, start_run
+from .metrics import IndexMetrics
+from .models import IndexJob, Repository
+from .utils import display_url, log
+from .worker import (
+    index_commits,
+    index_github_pull_requests,
+    index_gitlab_merge_requests,
+    load_known_shas,
+    update_commit_stats,
+)
+
+_LEASE_SECONDS_ = 600
+_MAX_ATTEMPTS_ = 3
+_RETRY_BACKOFF_SECONDS_ = 300
+_CLAIM_CANDIDATES_ = 10
+# outcomes of the indexers that complete a job, any other outcome is retried
+_DONE_OUTCOMES_ = ["ok", "inactive"]
+
+
+def default_owner() -> str:
+    return f"{socket.gethostname()}:{os.getpid()}"
+
+
+def enqueue_jobs(repos: Iterable[Repository], kind: str = "commits") -> int:
+    """create a pending job for each repository, unless one is already pending or running"""
+    if kind not in IndexJob.KINDS:
+        raise ValueError(f"kind must be one of {IndexJob.KINDS}")
+
+    n_jobs = 0
+    for repo in repos:
+        if not IndexJob.objects.filter(repo=repo, kind=kind, status__in=["pending", "running"]).exists():
+            IndexJob.objects.create(repo=repo, kind=kind)
+            n_jobs += 1
+    return n_jobs
+
+
+def schedule_job(repo: Repository, kind: str = "commits", delay_seconds: int = 0) -> IndexJob:
+    """
+    create a pending job that is not claimed before delay_seconds from now. events arriving
+    before it is claimed are covered by the same job, so a burst of pushes is indexed once.
+    an event arriving while a job is running gets a pending job, claimed once the running one ends.
+    """
+    job = IndexJob.objects.filter(repo=repo, kind=kind, status="pending").first()
+    if job is None:
+        job = IndexJob.objects.create(repo=repo, kind=kind, not_before=_now_() + timedelta(seconds=delay_seconds))
+    return job
+
+
+def claim_job(owner: str, lease_seconds: int = _LEASE_SECONDS_) -> Optional[IndexJob]:
+    """
+    claim the most stale repository's job that is pending, or running under an expired lease.
+    repositories never indexed come first, then the ones indexed longest ago. a job is not claimed
+    while another job of the same kind is running for the repository, so that they do not overlap.
+    the claim is a conditional update, so that only one of the workers racing for the same job wins.
+    """
+    now = _now_()
+    claimable = Q(status="pending") | Q(status="running", lease_expires_at__lt=now)
+    claimable &= Q(not_before__isnull=True) | Q(not_before__lte=now)
+    running = _running_(now).filter(repo=OuterRef("repo"), kind=OuterRef("kind")).exclude(id=OuterRef("id"))
+    claimable &= ~Q(Exists(running))
+
+    candidates = (
+        IndexJob.objects.filter(claimable)
+        .order_by(
+            F("repo__last_indexed_at").asc(nulls_first=True),
+            F("repo__last_commit_at").desc(nulls_last=True),
+            "id",
+        )
+        .values_list("id", flat=True)[:_CLAIM_CANDIDATES_]
+    )
+    for job_id in list(candidates):
+        claimed = IndexJob.objects.filter(claimable, id=job_id).update(
+            status="running",
+            lease_owner=owner,
+            lease_expires_at=now + timedelta(seconds=lease_seconds),
+            heartbeat_at=now,
+            attempts=F("attempts") + 1,
+            updated_at=now,
+        )
+        if not claimed:
+            continue
+        job = IndexJob.objects.select_related("repo").get(id=job_id)
+        # workers claiming two jobs of the same repository at once both pass the check, the later job yields
+        if _running_(now).filter(repo_id=job.repo_id, kind=job.kind, id__lt=job.id).exists():
+            IndexJob.objects.filter(id=job.id, lease_owner=owner).update(
+                status="pending", lease_owner="", lease_expires_at=None, attempts=F("attempts") - 1
+            )
+            continue
+        return job
+
+    return None
+
+
+def _running_(now: datetime):
+    # jobs held by a worker under a lease that has not expired
+    return IndexJob.objects.filter(status="running", lease_expires_at__gte=now)
+
+
+def renew_lease(job: IndexJob, owner: str, lease_seconds: int = _LEASE_SECONDS_) -> bool:
+    """extend the lease, returns False when the job has been claimed by another worker"""
+    now = _now_()
+    renewed = IndexJob.objects.filter(id=job.id, status="running", lease_owner=owner).update(
+        lease_expires_at=now + timedelta(seconds=lease_seconds),
+        heartbeat_at=now,
+    )
+    return renewed == 1
+
+
+def complete_job(job: IndexJob, owner: str, error: str = "") -> None:
+    """mark the job done, or failed after too many attempts. failed attempts are retried after a back off"""
+    updates: dict = {"lease_owner": "", "lease_expires_at": None, "last_error": error[-2048:]}
+    if not error:
+        updates["status"] = "done"
+    elif job.attempts >= _MAX_ATTEMPTS_:
+        updates["status"] = "failed"
+    else:
+        updates["status"] = "pending"
+        updates["not_before"] = _now_() + timedelta(seconds=_RETRY_BACKOFF_SECONDS_ * job.attempts)
+
+    # only the lease owner can complete the job
+    IndexJob.objects.filter(id=job.id, lease_owner=owner).update(updated_at=_now_(), **updates)
+
+
+class Heartbeat:
+    """renew the lease of a job in a background thread while the job is running"""
+
+    def __init__(self, job: IndexJob, owner: str, lease_seconds: int = _LEASE_SECONDS_) -> None:
+        self.job = job
+        self.owner = owner
+        self.lease_seconds = lease_seconds
+        self._stop = threading.Event()
+        self._thread = threading.Thread(target=self._run, daemon=True)
+
+    def __enter__(self) -> "Heartbeat":
+        self._thread.start()
+        return self
+
+    def __exit__(self, *args) -> None:
+        self._stop.set()
+        self._thread.join()
+
+    def _run(self) -> None:
+        try:
+            while not self._stop.wait(self.lease_seconds / 3):
+                if not renew_lease(self.job, self.owner, self.lease_seconds):
+                    log(f"### lost the lease of {self.job}")
+                    return
+        except Exception as e:
+            print(f"Exception renewing the lease of {self.job} => {str(e)}")
+        finally:
+            # django opens one connection per thread
+            connection.close()
+
+
+def run_job(job: IndexJob, metrics: Optional[IndexMetrics] = None, **kwargs) -> int:
+    repo = job.repo
+    if job.kind == "commits":
+        return index_commits(authenticated_clone_url(repo), repo.repo_type, metrics=metrics, **kwargs)
+    elif repo.repo_type.startswith("gitlab"):
+        return index_gitlab_merge_requests(gitlab_project(repo.clone_url), metrics=metrics)
+    elif repo.repo_type == "github":
+        return index_github_pull_requests(github_repo(repo.clone_url), metrics=metrics)
+    else:
+        raise ValueError(f"don't know how to index merge_request for {repo.repo_type}")
+
+
+def run_worker(
+    owner: str = "",
+    lease_seconds: int = _LEASE_SECONDS_,
+    max_jobs: int = 0,
+    wait: bool = False,
+    poll_seconds: int = 30,
+    **kwargs,
+) -> int:
+    """
+    claim and run jobs until the queue is empty, or forever when wait is True.
+    kwargs are passed to index_commits. returns the number of jobs run.
+    """
+    owner = owner or default_owner()
+    n_jobs, n_commits = 0, 0
+    # loaded for the second commits job, a single job only looks up the commits of its repository
+    known_shas, n_commit_jobs = None, 0
+    run = start_run("worker", f"--owner {owner}")
+
+    while max_jobs == 0 or n_jobs < max_jobs:
+        job = claim_job(owner, lease_seconds)
+        if job is None:
+            if not wait:
+                break
+            time.sleep(poll_seconds)
+            continue
+
+        log(f"{owner} running {job.kind} job {job.id} for {display_url(job.repo.clone_url)}")
+        error = ""
+        metrics = IndexMetrics(f"index_{job.kind}", job.repo.clone_url)
+        with Heartbeat(job, owner, lease_seconds):
+            try:
+                if job.kind == "commits":
+                    if known_shas is None and n_commit_jobs > 0:
+                        known_shas = load_known_shas()
+                    n_commit_jobs += 1
+                    n_commits += run_job(job, metrics, known_shas=known_shas, **kwargs)
+                else:
+                    run_job(job, metrics)
+            except Exception as e:
+                error = f"{str(e)}\n{traceback.format_exc()}"
+                print(f"Exception running {job} => {error}")
+        if not error and metrics.outcome not in _DONE_OUTCOMES_:
+            # the indexers print their errors and record them in the outcome instead of raising them
+            error = f"indexing {job.kind} ended with outcome {metrics.outcome or 'unknown'}"
+        complete_job(job, owner, error)
+        if metrics.outcome:
+            record_repo(run, metrics)
+        n_jobs += 1
+
+    finish_run(run, n_jobs, n_commits)
+    if n_commits:
+        update_commit_stats()
+
+    log(f"{owner} finished {n_jobs} jobs, indexed {n_commits} commits")
+    return n_jobs
+
+
+def authenticated_clone_url(repo: Repository) -> str:
+    """clone_url is stored without credentials, add the token from the environment back"""
+    if repo.repo_type.startswith("gitlab"):
+        token = os.environ.get("GITLAB_TOKEN")
+        if token:
+            return repo.clone_url.replace("://", f"://oauth2:{token}@")
+    elif repo.repo_type == "github":
+        token = os.environ.get("GITHUB_TOKEN")
+        if token:
+            return repo.clone_url.replace("://", f"://{token}:@")
+    return repo.clone_url
+
+
+def gitlab_project(clone_url: str):
+    base_url, path = _split_url_(clone_url)
+    gl = gitlab.Gitlab(base_url, private_token=os.environ.get("GITLAB_TOKEN"))
+    return gl.projects.get(path)
+
+
+def github_repo(clone_url: str):
+    _, path = _split_url_(clone_url)
+    access_token = os.environ.get("GITHUB_TOKEN")
+    gh = Github(auth=Auth.Token(access_token)) if access_token else Github()
+    return gh.get_repo(path)
+
+
+def _split_url_(clone_url: str) -> tuple[str, str]:
+    # https://gitlab.com/group/project.git => https://gitlab.com, group/project
+    parts = clone_url.split("/")
+    path = "/".join(parts[3:])
+    return "/".join(parts[:3]), path[:-4] if path.endswith(".git") else path
+
+
+def _now_() -> datetime:
+    return datetime.now(timezone.utc)
@@ -0,0 +1,101 @@
+import socket
+import statistics
+from dataclasses import dataclass
+from datetime import timedelta
+from itertools import groupby
+
+from django.utils import timezone
+
+from .metrics import IndexMetrics
+from .models import IndexRun, IndexRunRepo
+
+# runs shorter than this are too noisy to be flagged as regressions
+_MIN_REGRESSION_SECONDS_ = 10.0
+_MIN_HISTORY_ = 3
+
+
+@dataclass
+class RepoSummary:
+    repo_id: int
+    clone_url: str
+    n_runs: int
+    n_failed: int
+    last_outcome: str
+    last_duration: float
+    median_duration: float
+    p95_duration: float
+    is_regression: bool = False
+
+
+def start_run(command: str, arguments: str = "") -> IndexRun:
+    return IndexRun.objects.create(command=command, arguments=arguments[:1024], host=socket.gethostname())
+
+
+def record_repo(run: IndexRun, metrics: IndexMetrics) -> IndexRunRepo:
+    counters = metrics.counters
+    return IndexRunRepo.objects.create(
+        run=run,
+        repo_id=metrics.repo_id,
+        kind=metrics.name,
+        outcome=metrics.outcome,
+        duration=metrics.elapsed,
+        n_new_commits=counters.get("commits", 0) + counters.get("linked", 0),
+        n_branch_updates=counters.get("branch_updates", 0),
+        n_files=counters.get("files", 0),
+        n_merge_requests=counters.get("merge_requests", 0),
+        n_db_queries=counters.get("db_queries", 0),
+        peak_rss_mb=metrics.peak_rss_mb,
+    )
+
+
+def finish_run(run: IndexRun, n_repos: int, n_commits: int) -> None:
+    run.finished_at = timezone.now()
+    run.n_repos = n_repos
+    run.n_commits = n_commits
+    run.save()
+
+
+def summarize(days: int = 30, threshold: float = 2.0, kind: str = "index_commits") -> list[RepoSummary]:
+    """
+    summarize the runs of each repository in the last days. the latest successful run is a regression
+    when it took more than threshold times the median of the successful runs before it, failed runs
+    after it do not hide a regression.
+    """
+    rows = (
+        IndexRunRepo.objects.filter(kind=kind, created_at__gte=timezone.now() - timedelta(days=days))
+        .exclude(repo__isnull=True)
+        .exclude(outcome="inactive")
+        .order_by("repo_id", "created_at")
+        .values_list("repo_id", "repo__clone_url", "outcome", "duration")
+    )
+
+    summaries = []
+    for (repo_id, clone_url), group in groupby(rows, key=lambda row: (row[0], row[1])):
+        runs = [(outcome, duration) for _, _, outcome, duration in group]
+        durations = [duration for outcome, duration in runs if outcome == "ok"]
+        last_outcome, last_duration = runs[-1]
+        summary = RepoSummary(
+            repo_id=repo_id,
+            clone_url=clone_url,
+            n_runs=len(runs),
+            n_failed=sum(1 for outcome, _ in runs if outcome != "ok"),
+            last_outcome=last_outcome,
+            last_duration=last_duration,
+            median_duration=statistics.median(durations) if durations else 0.0,
+            p95_duration=_percentile_(durations, 95),
+        )
+
+        if durations:
+            last_ok, earlier = durations[-1], durations[:-1]
+            if len(earlier) >= _MIN_HISTORY_ and last_ok >= _MIN_REGRESSION_SECONDS_:
+                summary.is_regression = last_ok > threshold * statistics.median(earlier)
+        summaries.append(summary)
+
+    return summaries
+
+
+def _percentile_(values: list[float], percent: int) -> float:
+    if not values:
+        return 0.0
+    ordered = sorted(values)
+    return ordered[min(len(ordered) - 1, int(len(ordered) * percent / 100))]
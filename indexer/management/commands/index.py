@@ -1,23 +1,38 @@
 import os
+from contextlib import nullcontext
 from functools import partial
 from typing import Iterator
 
-from django.core.management.base import BaseCommand
+from django.core.management.base import BaseCommand, CommandError
 
+from indexer.export import PARTITION_BY, export_partitioned
+from indexer.extract import ExtractOptions
+from indexer.jobs import enqueue_jobs
+from indexer.ledger import finish_run, record_repo, start_run
+from indexer.metrics import IndexMetrics, write_prometheus
+from indexer.models import ensure_repository
+from indexer.profiling import profile_name, profiled
+from indexer.rollups import export_rollups
+from indexer.schedule import index_largest_first
 from indexer.utils import (
     enumerate_github_repos,
     enumerate_gitlab_repos,
     enumerate_local_repos,
     log,
     match_any,
+    redact_http_url,
     upload_file,
+    upload_stream,
 )
 from indexer.worker import (
+    analyze_stats_only_commits,
     export_all_data,
     index_commits,
     index_github_pull_requests,
     index_gitlab_merge_requests,
+    load_known_shas,
     update_commit_stats,
+    write_all_data,
 )
 
 
@@ -29,6 +44,12 @@ def enumberate_from_file(source_file: str, query: str) -> Iterator[str]:
                 yield line.strip()
 
 
+def profiled_if(options: dict, repo_url: str):
+    if options["profile"]:
+        return profiled(profile_name(repo_url), options["profile_dir"], options["profile_top"])
+    return nullcontext()
+
+
 class Command(BaseCommand):
     requires_migrations_checks = True
     help = "Index the git repositories and extract commit information"  # noqa: A003,VNE003,E501
@@ -49,6 +70,61 @@ class Command(BaseCommand):
             action="store_true",
             default=False,
         )
+        parser.add_argument(
+            "--workers",
+            dest="workers",
+            type=int,
+            default=1,
+            help="Number of processes used to extract commits from a single repository",
+        )
+        parser.add_argument(
+            "--jobs",
+            dest="jobs",
+            type=int,
+            default=1,
+            help="Number of repositories indexed at the same time, the ones with the most work are started first",
+        )
+        parser.add_argument(
+            "--queue-size",
+            dest="queue_size",
+            type=int,
+            default=0,
+            help="Extract commits in a background thread, up to this many commits ahead of database writes",
+        )
+        parser.add_argument(
+            "--skip-ignored-diffs",
+            dest="skip_ignored_diffs",
+            action="store_true",
+            default=False,
+            help="Count files excluded from stats, e.g. vendored dependencies, without diffing them",
+        )
+        parser.add_argument(
+            "--max-files",
+            dest="max_files",
+            type=int,
+            default=0,
+            help="Index commits changing more files than this with line counts only, 0 for no limit",
+        )
+        parser.add_argument(
+            "--max-lines",
+            dest="max_lines",
+            type=int,
+            default=0,
+            help="Index commits changing more lines than this with line counts only, 0 for no limit",
+        )
+        parser.add_argument(
+            "--analyze-stats-only",
+            dest="analyze_stats_only",
+            action="store_true",
+            default=False,
+            help="Run the full analysis on commits previously indexed with line counts only",
+        )
+        parser.add_argument(
+            "--cache",
+            dest="cache",
+            default="",
+            help="SQLite file to cache extracted commits, reused when re-indexing from scratch",
+        )
         parser.add_argument(
             "--filter",
             dest="filter",
@@ -80,12 +156,63 @@ class Command(BaseCommand):
             "--export-csv",
             dest="export_csv",
             default="",
-            help="Export index result to CSV file",
+            help="Export index result to CSV file, gzip compressed when the name ends with .gz",
+        )
+        parser.add_argument(
+            "--export-dir",
+            dest="export_dir",
+            default="",
+            help="Export index result to one gzip compressed CSV file per partition in this directory",
+        )
+        parser.add_argument(
+            "--partition-by",
+            dest="partition_by",
+            choices=PARTITION_BY,
+            default="month",
+            help="Partition the export to --export-dir by commit month or repository group",
+        )
+        parser.add_argument(
+            "--export-rollups",
+            dest="export_rollups",
+            default="",
+            help="Export the daily rollups per author, repository and file type to CSV file",
+        )
+        parser.add_argument(
+            "--profile",
+            action="store_true",
+            default=False,
+            help="Profile the cpu time and memory allocations of indexing each repository, this slows indexing down",
+        )
+        parser.add_argument(
+            "--profile-dir",
+            dest="profile_dir",
+            default="profiles",
+            help="Directory for the profile of each repository",
+        )
+        parser.add_argument(
+            "--profile-top",
+            dest="profile_top",
+            type=int,
+            default=25,
+            help="Number of functions and allocation sites in the profile summaries",
+        )
+        parser.add_argument(
+            "--metrics-file",
+            dest="metrics_file",
+            default="",
+            help="Write the timing and counters of each repository to this file in Prometheus text format",
+        )
+        parser.add_argument(
+            "--enqueue",
+            action="store_true",
+            default=False,
+            help="Add the matching repositories to the job queue for the worker command instead of indexing them",
         )
         parser.add_argument(
             "--upload",
             action="store_true",
             default=False,
+            help="Upload the exports to Google Cloud Storage, the commit data is streamed without a local file",
         )
 
     def handle(self, *args, **options):
@@ -106,26 +233,99 @@ class Command(BaseCommand):
             print(f"don't know how to index {source}")
             return
 
+        if options["enqueue"]:
+            kind = "merge_requests" if options["merge_requests_only"] else "commits"
+            repo_type = "other" if source == "list" else source
+            repo_urls = [repo_url for repo_url, _ in enumerator(query) if match_any(repo_url, options["filter"])]
+            if options["dry_run"]:
+                log(f"would enqueue {kind} jobs for {len(repo_urls)} repositories")
+            else:
+                repos = [ensure_repository(repo_url, repo_type) for repo_url in repo_urls]
+                log(f"enqueued {enqueue_jobs(repos, kind)} {kind} jobs for {len(repos)} repositories")
+            return
+
         # speical undocumented query string for update the stats only
         # do not index any repos
         if query != "_stats_":
+            # loaded once the run turns out to index more than one repository, then shared by
+            # all of them, so that commits shared between forks and mirrors are extracted only once
+            known_shas = None
+            extract_options = ExtractOptions(
+                skip_ignored_diffs=options["skip_ignored_diffs"],
+                max_files=options["max_files"],
+                max_lines=options["max_lines"],
+                cache_path=options["cache"],
+            )
+            scheduled: list[str] = []
+            all_metrics: list[IndexMetrics] = []
+            run = start_run("index", f"--source {source} --query {query} --filter {options['filter']}")
             for repo_url, project in enumerator(query):
                 if match_any(repo_url, options["filter"]):
                     if not options["dry_run"]:
                         source = "other" if source == "list" else source
+                        metrics = IndexMetrics(
+                            "index_merge_requests" if options["merge_requests_only"] else "index_commits",
+                            redact_http_url(repo_url),
+                        )
                         if options["merge_requests_only"]:
                             if source == "gitlab":
-                                n_merge_quests += index_gitlab_merge_requests(project, show_progress=True)
+                                n_merge_quests += index_gitlab_merge_requests(
+                                    project, show_progress=True, metrics=metrics
+                                )
                             elif source == "github":
-                                n_merge_quests += index_github_pull_requests(project, show_progress=True)
+                                n_merge_quests += index_github_pull_requests(
+                                    project, show_progress=True, metrics=metrics
+                                )
                             else:
                                 print(f"don't know how to index merge_request for {source}")
+                        elif options["analyze_stats_only"]:
+                            n_commits += analyze_stats_only_commits(repo_url, source)
+                        elif options["jobs"] > 1:
+                            # dispatched after all repositories are enumerated
+                            scheduled.append(repo_url)
                         else:
-                            n_commits += index_commits(
-                                repo_url, source, show_progress=True, index_all=options["index_all_commits"]
-                            )
+                            if known_shas is None and n_repos > 0:
+                                known_shas = load_known_shas()
+                            with profiled_if(options, repo_url):
+                                n_commits += index_commits(
+                                    repo_url,
+                                    source,
+                                    show_progress=True,
+                                    index_all=options["index_all_commits"],
+                                    n_workers=options["workers"],
+                                    queue_size=options["queue_size"],
+                                    known_shas=known_shas,
+                                    options=extract_options,
+                                    metrics=metrics,
+                                )
+                        if metrics.outcome:
+                            all_metrics.append(metrics)
+                            record_repo(run, metrics)
                         n_repos += 1
 
+            if scheduled:
+                n_recorded = len(all_metrics)
+                n_commits += index_largest_first(
+                    scheduled,
+                    source,
+                    options["jobs"],
+                    all_metrics=all_metrics,
+                    profile_dir=options["profile_dir"] if options["profile"] else "",
+                    profile_top=options["profile_top"],
+                    show_progress=True,
+                    index_all=options["index_all_commits"],
+                    n_workers=options["workers"],
+                    queue_size=options["queue_size"],
+                    known_shas=load_known_shas() if len(scheduled) > 1 else None,
+                    options=extract_options,
+                )
+                for metrics in all_metrics[n_recorded:]:
+                    record_repo(run, metrics)
+
+            finish_run(run, n_repos, n_commits)
+            if options["metrics_file"]:
+                write_prometheus(options["metrics_file"], all_metrics)
+
         if n_commits or query == "_stats_":
             update_commit_stats()
 
@@ -133,7 +333,26 @@ class Command(BaseCommand):
 
         csv_file = options["export_csv"]
         if csv_file:
-            export_all_data(csv_file)
+            write = partial(write_all_data, compress=csv_file.endswith(".gz"))
+            # stream straight to the bucket, the local file is only written when uploading is not configured
+            try:
+                uploaded = options["upload"] and upload_stream(os.path.basename(csv_file), write)
+            except Exception as e:
+                # the export may not fit on the local disk, a failed upload is not retried into a file
+                raise CommandError(f"failed to upload {csv_file}: {e}") from e
+            if not uploaded:
+                export_all_data(csv_file)
+
+        if options["export_dir"]:
+            # the partitions are written in parallel, the unchanged ones are not uploaded again
+            try:
+                export_partitioned(options["export_dir"], options["partition_by"], options["jobs"], options["upload"])
+            except Exception as e:
+                raise CommandError(f"failed to export to {options['export_dir']}: {e}") from e
+
+        rollups_file = options["export_rollups"]
+        if rollups_file:
+            export_rollups(rollups_file)
 
-            if options["upload"] and os.path.exists(csv_file) and os.stat(csv_file).st_size > 0:
-                upload_file(csv_file, os.path.basename(csv_file))
+            if options["upload"] and os.path.exists(rollups_file) and os.stat(rollups_file).st_size > 0:
+                upload_file(rollups_file, os.path.basename(rollups_file))
@@ -0,0 +1,47 @@
+from django.core.management.base import BaseCommand
+
+from indexer.ledger import summarize
+from indexer.utils import display_url
+
+
+class Command(BaseCommand):
+    requires_migrations_checks = True
+    help = "Summarize the recent index runs of each repository and flag the ones getting slower"  # noqa: A003,VNE003
+
+    def add_arguments(self, parser):
+        parser.add_argument(
+            "--days",
+            dest="days",
+            type=int,
+            default=30,
+            help="Summarize the runs in this many days",
+        )
+        parser.add_argument(
+            "--threshold",
+            dest="threshold",
+            type=float,
+            default=2.0,
+            help="Flag a repository when its last run took this many times its median duration",
+        )
+        parser.add_argument(
+            "--regressions-only",
+            dest="regressions_only",
+            action="store_true",
+            default=False,
+        )
+
+    def handle(self, *args, **options):
+        summaries = summarize(days=options["days"], threshold=options["threshold"])
+        if options["regressions_only"]:
+            summaries = [summary for summary in summaries if summary.is_regression]
+
+        # slowest first, they decide how long a run takes
+        summaries.sort(key=lambda summary: summary.p95_duration, reverse=True)
+        print(f"{'repository':64} {'runs':>5} {'failed':>6} {'last':>8} {'median':>8} {'p95':>8}  outcome")
+        for summary in summaries:
+            flag = " REGRESSION" if summary.is_regression else ""
+            print(
+                f"{display_url(summary.clone_url):64} {summary.n_runs:5} {summary.n_failed:6} "
+                f"{summary.last_duration:8.1f} {summary.median_duration:8.1f} {summary.p95_duration:8.1f}  "
+                f"{summary.last_outcome}{flag}"
+            )
@@ -0,0 +1,26 @@
+from django.core.management.base import BaseCommand
+
+from indexer.worker import reclassify_committed_files
+
+
+class Command(BaseCommand):
+    requires_migrations_checks = True
+    help = "Apply the current ignore patterns to files already indexed and update the commit stats"  # noqa: A003,VNE003
+
+    def add_arguments(self, parser):
+        parser.add_argument(
+            "--dry-run",
+            action="store_true",
+            default=False,
+            help="Count the files that would change without updating them",
+        )
+        parser.add_argument(
+            "--batch-size",
+            dest="batch_size",
+            type=int,
+            default=500,
+            help="Number of distinct paths updated in one statement",
+        )
+
+    def handle(self, *args, **options):
+        reclassify_committed_files(batch_size=options["batch_size"], dry_run=options["dry_run"])
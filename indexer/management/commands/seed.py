@@ -0,0 +1,72 @@
+from django.core.management.base import BaseCommand, CommandError
+
+from indexer.seed import SeedSpec, seed_dataset
+from indexer.utils import log
+from indexer.worker import update_commit_stats
+
+
+class Command(BaseCommand):
+    requires_migrations_checks = True
+    help = "Generate a synthetic dataset of repositories, commits, files and merge requests"  # noqa: A003,VNE003
+
+    def add_arguments(self, parser):
+        defaults = SeedSpec()
+        parser.add_argument("--authors", dest="n_authors", type=int, default=defaults.n_authors)
+        parser.add_argument("--repos", dest="n_repos", type=int, default=defaults.n_repos)
+        parser.add_argument("--commits", dest="n_commits", type=int, default=defaults.n_commits)
+        parser.add_argument(
+            "--files-per-commit",
+            dest="files_per_commit",
+            type=int,
+            default=defaults.files_per_commit,
+            help="Average number of files changed per commit",
+        )
+        parser.add_argument(
+            "--merge-requests-per-repo",
+            dest="merge_requests_per_repo",
+            type=int,
+            default=defaults.merge_requests_per_repo,
+        )
+        parser.add_argument(
+            "--fork-ratio",
+            dest="fork_ratio",
+            type=float,
+            default=defaults.fork_ratio,
+            help="Share of commits also linked to a 2nd repository",
+        )
+        parser.add_argument(
+            "--seed",
+            dest="seed",
+            type=int,
+            default=defaults.seed,
+            help="Random seed, use a different one to add more data to a seeded database",
+        )
+        parser.add_argument("--batch-size", dest="batch_size", type=int, default=defaults.batch_size)
+        parser.add_argument(
+            "--skip-stats",
+            dest="skip_stats",
+            action="store_true",
+            default=False,
+            help="Do not update the commit stats after seeding",
+        )
+
+    def handle(self, *args, **options):
+        spec = SeedSpec(
+            n_authors=options["n_authors"],
+            n_repos=options["n_repos"],
+            n_commits=options["n_commits"],
+            files_per_commit=options["files_per_commit"],
+            merge_requests_per_repo=options["merge_requests_per_repo"],
+            fork_ratio=options["fork_ratio"],
+            seed=options["seed"],
+            batch_size=options["batch_size"],
+        )
+        try:
+            counts = seed_dataset(spec)
+        except ValueError as e:
+            raise CommandError(str(e))
+
+        if not options["skip_stats"]:
+            update_commit_stats()
+
+        log("seeded " + ", ".join(f"{n_rows:,} {table}" for table, n_rows in counts.items()))
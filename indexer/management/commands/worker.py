@@ -0,0 +1,61 @@
+from django.core.management.base import BaseCommand
+
+from indexer.jobs import run_worker
+
+
+class Command(BaseCommand):
+    requires_migrations_checks = True
+    help = "Claim and run index jobs from the queue, any number of workers can run concurrently"  # noqa: A003,VNE003
+
+    def add_arguments(self, parser):
+        parser.add_argument(
+            "--owner",
+            dest="owner",
+            default="",
+            help="Name of the worker holding the job leases, defaults to hostname:pid",
+        )
+        parser.add_argument(
+            "--lease",
+            dest="lease",
+            type=int,
+            default=600,
+            help="Seconds a claimed job is leased for, the lease is renewed while the job is running",
+        )
+        parser.add_argument(
+            "--max-jobs",
+            dest="max_jobs",
+            type=int,
+            default=0,
+            help="Exit after running this many jobs, 0 for no limit",
+        )
+        parser.add_argument(
+            "--wait",
+            action="store_true",
+            default=False,
+            help="Wait for new jobs instead of exiting when the queue is empty",
+        )
+        parser.add_argument(
+            "--workers",
+            dest="workers",
+            type=int,
+            default=1,
+            help="Number of processes used to extract commits from a single repository",
+        )
+        parser.add_argument(
+            "--queue-size",
+            dest="queue_size",
+            type=int,
+            default=0,
+            help="Extract commits in a background thread, up to this many commits ahead of database writes",
+        )
+
+    def handle(self, *args, **options):
+        run_worker(
+            owner=options["owner"],
+            lease_seconds=options["lease"],
+            max_jobs=options["max_jobs"],
+            wait=options["wait"],
+            show_progress=True,
+            n_workers=options["workers"],
+            queue_size=options["queue_size"],
+        )
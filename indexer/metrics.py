@@ -0,0 +1,192 @@
+import json
+import os
+import re
+import traceback
+from collections import defaultdict
+from contextlib import contextmanager
+from time import perf_counter
+from typing import Any, Generator, Iterable, Iterator, Optional, TypeVar
+
+from django.conf import settings
+from django.db import connection
+
+from .utils import log, peak_rss, timestamp
+
+T = TypeVar("T")
+
+_PROMETHEUS_PREFIX_ = "git_indexer"
+_PROJECT_DIR_ = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+
+
+class QueryCounter:
+    """
+    count and time the queries executed on the connection of the current thread.
+
+    queries slower than slow_ms are logged with the line of project code that issued them.
+    tests use it to assert query budgets:
+
+        with QueryCounter() as queries:
+            client.get("/indexer/search?query=repo")
+        assert queries.count <= 5
+    """
+
+    def __init__(self, label: str = "", slow_ms: Optional[float] = None) -> None:
+        self.label = label
+        self.slow_ms = settings.INDEXER_SLOW_QUERY_MS if slow_ms is None else slow_ms
+        self.count = 0
+        self.seconds = 0.0
+        self.slow: list[tuple[float, str, str]] = []
+
+    def __enter__(self) -> "QueryCounter":
+        self._wrapper = connection.execute_wrapper(self)
+        self._wrapper.__enter__()
+        return self
+
+    def __exit__(self, *exc_info: Any) -> None:
+        self._wrapper.__exit__(*exc_info)
+
+    def __call__(self, execute, sql, params, many, context):
+        start_t = perf_counter()
+        try:
+            return execute(sql, params, many, context)
+        finally:
+            duration = perf_counter() - start_t
+            self.count += 1
+            self.seconds += duration
+            if self.slow_ms >= 0 and duration * 1000 >= self.slow_ms:
+                call_site = _call_site_()
+                self.slow.append((duration, call_site, sql))
+                log(f"slow query {duration * 1000:,.0f} ms {self.label} at {call_site}: {sql[:200]}")
+
+
+class IndexMetrics:
+    """
+    cumulative timers and counters of indexing one repository.
+
+    phases are timed with perf_counter only, so that timing the hot loop costs well
+    under a microsecond per phase. database queries are counted by a wrapper installed
+    on the connection of the current thread while the metrics are running.
+    """
+
+    def __init__(self, name: str, repo: str = "") -> None:
+        self.name = name
+        self.repo = repo
+        self.outcome = ""
+        self.phases: dict[str, float] = defaultdict(float)
+        self.counters: dict[str, int] = defaultdict(int)
+        self.elapsed = 0.0
+        # time spent in queries, overlaps the phases
+        self.db_seconds = 0.0
+        self.repo_id: Optional[int] = None
+        self.peak_rss_mb = 0
+
+    @contextmanager
+    def running(self) -> Generator["IndexMetrics", None, None]:
+        """measure the block, then log the metrics as a json line"""
+        start_t = perf_counter()
+        queries = QueryCounter(self.repo)
+        try:
+            with queries:
+                yield self
+        finally:
+            self.elapsed += perf_counter() - start_t
+            self.counters["db_queries"] += queries.count
+            self.db_seconds += queries.seconds
+            self.peak_rss_mb = peak_rss()
+            self.log_json()
+
+    @contextmanager
+    def phase(self, name: str) -> Generator[None, None, None]:
+        start_t = perf_counter()
+        try:
+            yield
+        finally:
+            self.phases[name] += perf_counter() - start_t
+
+    def timed(self, iterator: Iterator[T], name: str) -> Generator[T, None, None]:
+        """yield from the iterator, adding the time spent waiting for each item to the phase"""
+        try:
+            while True:
+                start_t = perf_counter()
+                try:
+                    item = next(iterator)
+                except StopIteration:
+                    return
+                finally:
+                    self.phases[name] += perf_counter() - start_t
+                yield item
+        finally:
+            close = getattr(iterator, "close", None)
+            if close:
+                close()
+
+    def add(self, name: str, value: int = 1) -> None:
+        self.counters[name] += value
+
+    def rate(self, name: str) -> float:
+        return self.counters[name] / self.elapsed if self.elapsed > 0 else 0.0
+
+    def as_dict(self) -> dict[str, Any]:
+        return {
+            "ts": timestamp(),
+            "metrics": self.name,
+            "repo": self.repo,
+            "outcome": self.outcome,
+            "elapsed": round(self.elapsed, 3),
+            "phases": {name: round(seconds, 3) for name, seconds in self.phases.items()},
+            "db_seconds": round(self.db_seconds, 3),
+            "counters": dict(self.counters),
+            "peak_rss_mb": self.peak_rss_mb,
+            "commits_per_sec": round(self.rate("commits"), 2),
+            "files_per_sec": round(self.rate("files"), 2),
+        }
+
+    def log_json(self) -> None:
+        print(json.dumps(self.as_dict()))
+
+
+def write_prometheus(path: str, all_metrics: Iterable[IndexMetrics]) -> None:
+    """
+    write the metrics in prometheus text format, e.g. for the textfile collector of node_exporter.
+    the file is replaced atomically so that the collector never reads a partial file.
+    """
+    samples: dict[str, list[str]] = defaultdict(list)
+    for metrics in all_metrics:
+        labels = f'job="{metrics.name}",repo="{_escape_(metrics.repo)}"'
+        samples["duration_seconds"].append(f"{{{labels}}} {metrics.elapsed:.3f}")
+        samples["db_seconds"].append(f"{{{labels}}} {metrics.db_seconds:.3f}")
+        for phase, seconds in metrics.phases.items():
+            samples["phase_seconds"].append(f'{{{labels},phase="{phase}"}} {seconds:.3f}')
+        for counter, value in metrics.counters.items():
+            samples[f"{_metric_name_(counter)}_total"].append(f"{{{labels}}} {value}")
+
+    lines = []
+    for name, values in samples.items():
+        kind = "counter" if name.endswith("_total") else "gauge"
+        lines.append(f"# TYPE {_PROMETHEUS_PREFIX_}_{name} {kind}")
+        lines.extend(f"{_PROMETHEUS_PREFIX_}_{name}{value}" for value in values)
+
+    tmp_path = f"{path}.{os.getpid()}.tmp"
+    with open(tmp_path, "w") as f:
+        f.write("\n".join(lines) + "\n")
+    os.replace(tmp_path, path)
+
+
+def _metric_name_(name: str) -> str:
+    return re.sub(r"[^a-zA-Z0-9_]", "_", name)
+
+
+def _escape_(value: str) -> str:
+    return value.replace("\\", "\\\\").replace('"', '\\"').replace("\n", "\\n")
+
+
+def _call_site_() -> str:
+    """the innermost frame of project code outside of this module, i.e. the code that ran the query"""
+    for frame in reversed(traceback.extract_stack()):
+        if (
+            frame.filename.startswith(_PROJECT_DIR_)
+            and frame.filename != __file__
+            and "site-packages" not in frame.filename
+        ):
+            return f"{os.path.relpath(frame.filename, _PROJECT_DIR_)}:{frame.lineno} in {frame.name}"
+    return "unknown"
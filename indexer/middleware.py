@@ -0,0 +1,49 @@
+from typing import Callable, Iterator, cast
+
+from django.conf import settings
+from django.http import HttpRequest, HttpResponse, StreamingHttpResponse
+
+from .metrics import QueryCounter
+from .utils import log
+
+
+class QueryCountMiddleware:
+    """
+    count and time the queries of each request, the totals are returned in the
+    X-DB-Queries and X-DB-Time-Ms headers. requests with more queries than
+    INDEXER_REQUEST_QUERY_BUDGET are logged, slow queries are logged by QueryCounter.
+    the queries of a streaming response run while the body is sent, after the headers,
+    so they are counted until the stream finishes and only logged, without the headers.
+    the queries of an async stream run outside of the connection wrapper and are not counted.
+    """
+
+    def __init__(self, get_response: Callable[[HttpRequest], HttpResponse]) -> None:
+        self.get_response = get_response
+
+    def __call__(self, request: HttpRequest) -> HttpResponse:
+        with QueryCounter(request.path) as queries:
+            response = self.get_response(request)
+
+        if isinstance(response, StreamingHttpResponse):
+            if not response.is_async:
+                content = cast(Iterator[bytes], response.streaming_content)
+                response.streaming_content = _counted_(request, content, queries)
+            return response
+
+        response["X-DB-Queries"] = str(queries.count)
+        response["X-DB-Time-Ms"] = f"{queries.seconds * 1000:.1f}"
+        _check_budget_(request, queries)
+        return response
+
+
+def _counted_(request: HttpRequest, content: Iterator[bytes], queries: QueryCounter) -> Iterator[bytes]:
+    try:
+        with queries:
+            yield from content
+    finally:
+        _check_budget_(request, queries)
+
+
+def _check_budget_(request: HttpRequest, queries: QueryCounter) -> None:
+    if queries.count > settings.INDEXER_REQUEST_QUERY_BUDGET:
+        log(f"### {request.method} {request.path} ran {queries.count} queries in {queries.seconds * 1000:,.0f} ms")
@@ -0,0 +1,18 @@
+# Generated by Django 4.2.3 on 2026-10-19 01:57
+
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ("indexer", "0002_alter_mergerequest_source_sha_and_more"),
+    ]
+
+    operations = [
+        migrations.AddField(
+            model_name="commit",
+            name="is_stats_only",
+            field=models.BooleanField(default=False),
+        ),
+    ]
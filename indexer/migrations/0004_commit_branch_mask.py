@@ -0,0 +1,56 @@
+# Generated by Django 4.2.3 on 2026-10-19 02:02
+
+from django.db import migrations, models
+
+# the bit layout as of this migration, changes to indexer.utils must not change what it writes
+BRANCH_CATEGORIES = {
+    "main": 1,
+    "develop": 2,
+    "feature": 4,
+    "bugfix": 8,
+    "hotfix": 16,
+    "release": 32,
+    "other": 64,
+}
+BRANCH_ALIASES = {
+    "master": "main",
+    "dev": "develop",
+    "feat": "feature",
+    "features": "feature",
+    "fix": "bugfix",
+    "bug": "bugfix",
+    "releases": "release",
+}
+
+
+def branch_mask(branches):
+    mask = 0
+    for name in branches.split(","):
+        name = name.strip().lower()
+        if name:
+            name = BRANCH_ALIASES.get(name, name)
+            mask |= BRANCH_CATEGORIES.get(name, BRANCH_CATEGORIES["other"])
+    return mask
+
+
+def populate_branch_mask(apps, schema_editor):
+    # there are far fewer distinct branch strings than commits
+    Commit = apps.get_model("indexer", "Commit")
+    for branches in Commit.objects.values_list("branches", flat=True).distinct().iterator():
+        Commit.objects.filter(branches=branches).update(branch_mask=branch_mask(branches))
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ("indexer", "0003_commit_is_stats_only"),
+    ]
+
+    operations = [
+        migrations.AddField(
+            model_name="commit",
+            name="branch_mask",
+            field=models.IntegerField(db_index=True, default=0),
+        ),
+        migrations.RunPython(populate_branch_mask, migrations.RunPython.noop),
+    ]
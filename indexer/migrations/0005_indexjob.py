@@ -0,0 +1,40 @@
+# Generated by Django 4.2.3 on 2026-10-19 02:05
+
+import django.db.models.deletion
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ("indexer", "0004_commit_branch_mask"),
+    ]
+
+    operations = [
+        migrations.CreateModel(
+            name="IndexJob",
+            fields=[
+                ("id", models.BigAutoField(auto_created=True, primary_key=True, serialize=False, verbose_name="ID")),
+                ("kind", models.CharField(default="commits", max_length=20)),
+                ("status", models.CharField(default="pending", max_length=10)),
+                ("not_before", models.DateTimeField(null=True)),
+                ("lease_owner", models.CharField(default="", max_length=128)),
+                ("lease_expires_at", models.DateTimeField(null=True)),
+                ("heartbeat_at", models.DateTimeField(null=True)),
+                ("attempts", models.IntegerField(default=0)),
+                ("last_error", models.CharField(default="", max_length=2048)),
+                ("created_at", models.DateTimeField(auto_now_add=True)),
+                ("updated_at", models.DateTimeField(auto_now=True)),
+                (
+                    "repo",
+                    models.ForeignKey(
+                        on_delete=django.db.models.deletion.CASCADE, related_name="index_jobs", to="indexer.repository"
+                    ),
+                ),
+            ],
+            options={
+                "db_table": "index_jobs",
+                "indexes": [models.Index(fields=["status", "not_before"], name="index_jobs_status_df0b28_idx")],
+            },
+        ),
+    ]
@@ -0,0 +1,18 @@
+# Generated by Django 4.2.3 on 2026-10-19 02:07
+
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ("indexer", "0005_indexjob"),
+    ]
+
+    operations = [
+        migrations.AddField(
+            model_name="repository",
+            name="index_duration",
+            field=models.FloatField(null=True),
+        ),
+    ]
@@ -0,0 +1,66 @@
+# Generated by Django 4.2.3 on 2026-10-19 02:15
+
+import django.db.models.deletion
+import django.utils.timezone
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ("indexer", "0006_repository_index_duration"),
+    ]
+
+    operations = [
+        migrations.CreateModel(
+            name="IndexRun",
+            fields=[
+                ("id", models.BigAutoField(auto_created=True, primary_key=True, serialize=False, verbose_name="ID")),
+                ("command", models.CharField(max_length=32)),
+                ("arguments", models.CharField(default="", max_length=1024)),
+                ("host", models.CharField(default="", max_length=128)),
+                ("started_at", models.DateTimeField(default=django.utils.timezone.now)),
+                ("finished_at", models.DateTimeField(null=True)),
+                ("n_repos", models.IntegerField(default=0)),
+                ("n_commits", models.IntegerField(default=0)),
+            ],
+            options={
+                "db_table": "index_runs",
+            },
+        ),
+        migrations.CreateModel(
+            name="IndexRunRepo",
+            fields=[
+                ("id", models.BigAutoField(auto_created=True, primary_key=True, serialize=False, verbose_name="ID")),
+                ("kind", models.CharField(max_length=32)),
+                ("outcome", models.CharField(max_length=20)),
+                ("duration", models.FloatField(default=0.0)),
+                ("n_new_commits", models.IntegerField(default=0)),
+                ("n_branch_updates", models.IntegerField(default=0)),
+                ("n_files", models.IntegerField(default=0)),
+                ("n_merge_requests", models.IntegerField(default=0)),
+                ("n_db_queries", models.IntegerField(default=0)),
+                ("peak_rss_mb", models.IntegerField(default=0)),
+                ("created_at", models.DateTimeField(default=django.utils.timezone.now)),
+                (
+                    "repo",
+                    models.ForeignKey(
+                        null=True,
+                        on_delete=django.db.models.deletion.CASCADE,
+                        related_name="index_runs",
+                        to="indexer.repository",
+                    ),
+                ),
+                (
+                    "run",
+                    models.ForeignKey(
+                        on_delete=django.db.models.deletion.CASCADE, related_name="repos", to="indexer.indexrun"
+                    ),
+                ),
+            ],
+            options={
+                "db_table": "index_run_repos",
+                "indexes": [models.Index(fields=["repo", "created_at"], name="index_run_r_repo_id_0f6546_idx")],
+            },
+        ),
+    ]
@@ -0,0 +1,59 @@
+# Generated by Django 4.2.3 on 2026-10-19 02:27
+
+import django.db.models.deletion
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ("indexer", "0007_indexrun"),
+    ]
+
+    operations = [
+        migrations.CreateModel(
+            name="RollupWatermark",
+            fields=[
+                ("id", models.BigAutoField(auto_created=True, primary_key=True, serialize=False, verbose_name="ID")),
+                ("name", models.CharField(max_length=32, unique=True)),
+                ("last_link_id", models.BigIntegerField(default=0)),
+                ("updated_at", models.DateTimeField(auto_now=True)),
+            ],
+            options={
+                "db_table": "rollup_watermarks",
+            },
+        ),
+        migrations.CreateModel(
+            name="DailyRollup",
+            fields=[
+                ("id", models.BigAutoField(auto_created=True, primary_key=True, serialize=False, verbose_name="ID")),
+                ("day", models.DateField()),
+                ("file_type", models.CharField(max_length=128)),
+                ("n_commits", models.IntegerField(default=0)),
+                ("n_files_changed", models.IntegerField(default=0)),
+                ("n_files_ignored", models.IntegerField(default=0)),
+                ("n_lines_changed", models.IntegerField(default=0)),
+                ("n_lines_ignored", models.IntegerField(default=0)),
+                (
+                    "author",
+                    models.ForeignKey(
+                        on_delete=django.db.models.deletion.CASCADE, related_name="rollups", to="indexer.author"
+                    ),
+                ),
+                (
+                    "repo",
+                    models.ForeignKey(
+                        on_delete=django.db.models.deletion.CASCADE, related_name="rollups", to="indexer.repository"
+                    ),
+                ),
+            ],
+            options={
+                "db_table": "daily_rollups",
+                "indexes": [models.Index(fields=["repo", "day"], name="daily_rollu_repo_id_788240_idx")],
+            },
+        ),
+        migrations.AddConstraint(
+            model_name="dailyrollup",
+            constraint=models.UniqueConstraint(fields=("day", "author", "repo", "file_type"), name="daily_rollup_key"),
+        ),
+    ]
@@ -0,0 +1,55 @@
+# Generated by Django 4.2.3 on 2026-10-19 02:50
+
+from django.db import migrations, models
+from django.db.models import Count, Min
+
+
+def merge_duplicate_authors(apps, schema_editor):
+    # concurrent index processes could create the same author more than once, the first one is kept
+    Author = apps.get_model("indexer", "Author")
+    Commit = apps.get_model("indexer", "Commit")
+    DailyRollup = apps.get_model("indexer", "DailyRollup")
+    RollupWatermark = apps.get_model("indexer", "RollupWatermark")
+
+    # the materialised commit data, see worker.refresh_commit_data, refers to the authors too
+    has_mat = "all_commit_data_mat" in schema_editor.connection.introspection.table_names()
+
+    duplicates = (
+        Author.objects.values("name", "email").annotate(n=Count("id"), first_id=Min("id")).filter(n__gt=1).iterator()
+    )
+    n_merged = 0
+    for duplicate in duplicates:
+        others = Author.objects.filter(name=duplicate["name"], email=duplicate["email"]).exclude(
+            id=duplicate["first_id"]
+        )
+        other_ids = list(others.values_list("id", flat=True))
+        Commit.objects.filter(author_id__in=other_ids).update(author_id=duplicate["first_id"])
+        if has_mat:
+            with schema_editor.connection.cursor() as cursor:
+                cursor.execute(
+                    "update all_commit_data_mat set author_id = %s where author_id in ({})".format(
+                        ",".join(["%s"] * len(other_ids))
+                    ),
+                    [duplicate["first_id"]] + other_ids,
+                )
+        n_merged += others.delete()[0]
+
+    if n_merged:
+        # the rollups are keyed by author, rebuild all of them with the next refresh
+        DailyRollup.objects.all().delete()
+        RollupWatermark.objects.update(last_link_id=0)
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ("indexer", "0008_dailyrollup"),
+    ]
+
+    operations = [
+        migrations.RunPython(merge_duplicate_authors, migrations.RunPython.noop),
+        migrations.AddConstraint(
+            model_name="author",
+            constraint=models.UniqueConstraint(fields=("name", "email"), name="author_name_email"),
+        ),
+    ]
@@ -0,0 +1,52 @@
+# Generated by Django 4.2.3 on 2026-10-19 11:40
+
+from django.db import migrations, models
+from django.db.models import Count, Min
+
+
+def delete_duplicate_links(apps, schema_editor):
+    # overlapping index runs of the same repository could link a commit to it more than once
+    RepositoryCommitLink = apps.get_model("indexer", "RepositoryCommitLink")
+    DailyRollup = apps.get_model("indexer", "DailyRollup")
+    RollupWatermark = apps.get_model("indexer", "RollupWatermark")
+
+    # the materialised commit data, see worker.refresh_commit_data, has the rows of the duplicates too
+    has_mat = "all_commit_data_mat" in schema_editor.connection.introspection.table_names()
+
+    duplicates = (
+        RepositoryCommitLink.objects.values("repo_id", "commit_id")
+        .annotate(n=Count("id"), first_id=Min("id"))
+        .filter(n__gt=1)
+        .iterator()
+    )
+    n_deleted = 0
+    for duplicate in duplicates:
+        links = RepositoryCommitLink.objects.filter(repo_id=duplicate["repo_id"], commit_id=duplicate["commit_id"])
+        n_deleted += links.exclude(id=duplicate["first_id"]).delete()[0]
+        if has_mat:
+            # added again from the view by the next refresh
+            with schema_editor.connection.cursor() as cursor:
+                cursor.execute(
+                    "delete from all_commit_data_mat where sha = %s and repo_id = %s",
+                    [duplicate["commit_id"], duplicate["repo_id"]],
+                )
+
+    if n_deleted:
+        # the rollups counted the duplicates, rebuild all of them with the next refresh
+        DailyRollup.objects.all().delete()
+        RollupWatermark.objects.update(last_link_id=0)
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ("indexer", "0009_author_name_email"),
+    ]
+
+    operations = [
+        migrations.RunPython(delete_duplicate_links, migrations.RunPython.noop),
+        migrations.AddConstraint(
+            model_name="repositorycommitlink",
+            constraint=models.UniqueConstraint(fields=("repo", "commit"), name="repo_to_commits_repo_commit"),
+        ),
+    ]
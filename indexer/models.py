@@ -2,6 +2,7 @@ import os
 import re
 
 from django.db import models
+from django.utils import timezone
 from django_stubs_ext.db.models import TypedModelMeta
 
 from indexer.utils import redact_http_url
@@ -12,6 +13,8 @@ _REPO_TYPES_ = ["gitlab", "gitlab_private", "github", "local", "other"]
 class Author(models.Model):
     class Meta(TypedModelMeta):
         db_table = "authors"
+        # processes indexing at the same time create the authors of shared commits
+        constraints = [models.UniqueConstraint(fields=["name", "email"], name="author_name_email")]
 
     name = models.CharField(max_length=128)
     email = models.CharField(max_length=1024)
@@ -39,6 +42,8 @@ class Repository(models.Model):
     is_active = models.BooleanField(default=True)
     last_indexed_at = models.DateTimeField(null=True)
     last_commit_at = models.DateTimeField(null=True)
+    # seconds taken by the last index_commits run, used to estimate the next run
+    index_duration = models.FloatField(null=True)
 
     # relationships
     commits = models.ManyToManyField(
@@ -104,6 +109,8 @@ class Commit(models.Model):
 
     sha = models.CharField(max_length=40, primary_key=True)
     branches = models.CharField(max_length=1024, default="")
+    # bitmask of utils.BRANCH_CATEGORIES for the branches above
+    branch_mask = models.IntegerField(default=0, db_index=True)
     message = models.CharField(max_length=2048, default="")
     created_at = models.DateTimeField(null=True)
 
@@ -121,6 +128,9 @@ class Commit(models.Model):
     n_lines_ignored = models.IntegerField(default=0)
     n_files_changed = models.IntegerField(default=0)
     n_files_ignored = models.IntegerField(default=0)
+    # files of very large commits are indexed with line counts only,
+    # code metrics are pending until analyze_stats_only_commits is run
+    is_stats_only = models.BooleanField(default=False)
 
     # relationships
     author = models.ForeignKey(Author, related_name="commits", on_delete=models.PROTECT)
@@ -180,6 +190,8 @@ class RepositoryCommitLink(models.Model):
     class Meta(TypedModelMeta):
         # table name is chosen to be compatible with existing schema predates this project
         db_table = "repo_to_commits"
+        # overlapping index runs of the same repository link the same commits
+        constraints = [models.UniqueConstraint(fields=["repo", "commit"], name="repo_to_commits_repo_commit")]
 
     commit = models.ForeignKey(Commit, on_delete=models.DO_NOTHING)
     repo = models.ForeignKey(Repository, on_delete=models.DO_NOTHING)
@@ -213,6 +225,125 @@ class MergeRequest(models.Model):
     repo = models.ForeignKey(Repository, related_name="merge_requests", on_delete=models.CASCADE)
 
 
+class IndexJob(models.Model):
+    """
+    a unit of indexing work for one repository, claimed by workers under a lease.
+    a worker renews the lease while the job is running, jobs with an expired lease
+    were left behind by a crashed worker and can be claimed again.
+    """
+
+    class Meta(TypedModelMeta):
+        db_table = "index_jobs"
+        indexes = [models.Index(fields=["status", "not_before"])]
+
+    KINDS = ["commits", "merge_requests"]
+    STATUSES = ["pending", "running", "done", "failed"]
+
+    kind = models.CharField(max_length=20, default="commits")
+    status = models.CharField(max_length=10, default="pending")
+    # the job is not claimed before this time, used to back off retries
+    not_before = models.DateTimeField(null=True)
+    lease_owner = models.CharField(max_length=128, default="")
+    lease_expires_at = models.DateTimeField(null=True)
+    heartbeat_at = models.DateTimeField(null=True)
+    attempts = models.IntegerField(default=0)
+    last_error = models.CharField(max_length=2048, default="")
+    created_at = models.DateTimeField(auto_now_add=True)
+    updated_at = models.DateTimeField(auto_now=True)
+
+    # relationships
+    repo = models.ForeignKey(Repository, related_name="index_jobs", on_delete=models.CASCADE)
+
+    def __str__(self) -> str:
+        return f"IndexJob(id={self.id}, kind={self.kind}, status={self.status}, repo_id={self.repo_id})"
+
+
+class IndexRun(models.Model):
+    """one invocation of the index or worker command"""
+
+    class Meta(TypedModelMeta):
+        db_table = "index_runs"
+
+    command = models.CharField(max_length=32)
+    arguments = models.CharField(max_length=1024, default="")
+    host = models.CharField(max_length=128, default="")
+    started_at = models.DateTimeField(default=timezone.now)
+    finished_at = models.DateTimeField(null=True)
+    n_repos = models.IntegerField(default=0)
+    n_commits = models.IntegerField(default=0)
+
+    def __str__(self) -> str:
+        return f"IndexRun(id={self.id}, command={self.command}, started_at={self.started_at})"
+
+
+class IndexRunRepo(models.Model):
+    """outcome and cost of indexing one repository in a run"""
+
+    class Meta(TypedModelMeta):
+        db_table = "index_run_repos"
+        indexes = [models.Index(fields=["repo", "created_at"])]
+
+    # index_commits or index_merge_requests
+    kind = models.CharField(max_length=32)
+    # ok, timeout, inactive, GitCommandError, DatabaseError or Exception
+    outcome = models.CharField(max_length=20)
+    duration = models.FloatField(default=0.0)
+    n_new_commits = models.IntegerField(default=0)
+    n_branch_updates = models.IntegerField(default=0)
+    n_files = models.IntegerField(default=0)
+    n_merge_requests = models.IntegerField(default=0)
+    n_db_queries = models.IntegerField(default=0)
+    # peak of the process so far, repositories indexed earlier by the same process count too
+    peak_rss_mb = models.IntegerField(default=0)
+    created_at = models.DateTimeField(default=timezone.now)
+
+    # relationships
+    run = models.ForeignKey(IndexRun, related_name="repos", on_delete=models.CASCADE)
+    repo = models.ForeignKey(Repository, related_name="index_runs", null=True, on_delete=models.CASCADE)
+
+    def __str__(self) -> str:
+        return f"IndexRunRepo(id={self.id}, run_id={self.run_id}, repo_id={self.repo_id}, outcome={self.outcome})"
+
+
+class DailyRollup(models.Model):
+    """
+    commits and lines changed per day, author, repository and file type, maintained by rollups.refresh_rollups.
+    n_commits counts the commits changing files of the file type, a commit changing
+    several file types is counted once for each of them.
+    """
+
+    class Meta(TypedModelMeta):
+        db_table = "daily_rollups"
+        constraints = [models.UniqueConstraint(fields=["day", "author", "repo", "file_type"], name="daily_rollup_key")]
+        indexes = [models.Index(fields=["repo", "day"])]
+
+    day = models.DateField()
+    file_type = models.CharField(max_length=128)
+    n_commits = models.IntegerField(default=0)
+    n_files_changed = models.IntegerField(default=0)
+    n_files_ignored = models.IntegerField(default=0)
+    n_lines_changed = models.IntegerField(default=0)
+    n_lines_ignored = models.IntegerField(default=0)
+
+    # relationships
+    author = models.ForeignKey(Author, related_name="rollups", on_delete=models.CASCADE)
+    repo = models.ForeignKey(Repository, related_name="rollups", on_delete=models.CASCADE)
+
+    def __str__(self) -> str:
+        return f"DailyRollup(day={self.day}, author_id={self.author_id}, repo_id={self.repo_id}, {self.file_type})"
+
+
+class RollupWatermark(models.Model):
+    """the last repo_to_commits row included in the rollups, newer links are rolled up by the next refresh"""
+
+    class Meta(TypedModelMeta):
+        db_table = "rollup_watermarks"
+
+    name = models.CharField(max_length=32, unique=True)
+    last_link_id = models.BigIntegerField(default=0)
+    updated_at = models.DateTimeField(auto_now=True)
+
+
 def ensure_repository(url: str, repo_type: str) -> Repository:
     base_url = redact_http_url(url)
     repo, _ = Repository.objects.get_or_create(clone_url=base_url, repo_type=repo_type)
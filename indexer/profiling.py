@@ -0,0 +1,69 @@
+import cProfile
+import io
+import os
+import pstats
+import re
+import tracemalloc
+from contextlib import contextmanager
+from typing import Generator
+
+from .utils import log
+
+
+def profile_name(clone_url: str) -> str:
+    """file name for the profile of a repository, e.g. https://gitlab.com/group/repo.git => gitlab.com_group_repo"""
+    name = re.sub(r"^\w+://([^/]*@)?", "", clone_url)
+    name = re.sub(r"\.git$", "", name.strip("/"))
+    return re.sub(r"[^\w.-]+", "_", name)
+
+
+@contextmanager
+def profiled(name: str, output_dir: str, top_n: int = 25) -> Generator[None, None, None]:
+    """
+    profile the cpu time and memory allocations of the block. writes <name>.prof, which can be
+    loaded with pstats or snakeviz, and <name>.txt with the top_n functions by cumulative time
+    and the top_n lines by allocated memory.
+
+    only the current thread is profiled by cProfile, allocations are traced for all threads.
+    """
+    os.makedirs(output_dir, exist_ok=True)
+    base_path = os.path.join(output_dir, name)
+
+    was_tracing = tracemalloc.is_tracing()
+    if not was_tracing:
+        tracemalloc.start()
+    profiler = cProfile.Profile()
+    profiler.enable()
+    try:
+        yield
+    finally:
+        profiler.disable()
+        snapshot = tracemalloc.take_snapshot()
+        _, peak = tracemalloc.get_traced_memory()
+        if not was_tracing:
+            tracemalloc.stop()
+
+        profiler.dump_stats(f"{base_path}.prof")
+        with open(f"{base_path}.txt", "w") as f:
+            f.write(_summary_(profiler, snapshot, peak, top_n))
+        log(f"profile of {name} written to {base_path}.prof and {base_path}.txt")
+
+
+def _summary_(profiler: cProfile.Profile, snapshot: tracemalloc.Snapshot, peak: int, top_n: int) -> str:
+    out = io.StringIO()
+    out.write(f"top {top_n} functions by cumulative time\n\n")
+    stats = pstats.Stats(profiler, stream=out)
+    stats.sort_stats(pstats.SortKey.CUMULATIVE).print_stats(top_n)
+
+    snapshot = snapshot.filter_traces(
+        [
+            tracemalloc.Filter(False, tracemalloc.__file__),
+            tracemalloc.Filter(False, "<frozen importlib._bootstrap>"),
+        ]
+    )
+    out.write(f"\ntop {top_n} lines by allocated memory, peak traced memory {peak / 1048576:,.1f} MB\n\n")
+    for stat in snapshot.statistics("lineno")[:top_n]:
+        frame = stat.traceback[0]
+        out.write(f"{stat.size / 1024:12,.1f} KB {stat.count:9,} blocks  {frame.filename}:{frame.lineno}\n")
+
+    return out.getvalue()
@@ -0,0 +1,135 @@
+import csv
+from collections import defaultdict
+from datetime import date, datetime, time, timedelta
+from typing import Iterable, Optional
+
+from django.db import transaction
+from django.db.models import Count, Max, Q, Sum
+from django.db.models.functions import Coalesce, TruncDate
+from django.utils.timezone import make_aware
+
+from .models import CommittedFile, DailyRollup, RepositoryCommitLink, RollupWatermark
+from .utils import log
+
+_WATERMARK_ = "daily_rollups"
+_DAY_BATCH_SIZE_ = 200
+_SHA_BATCH_SIZE_ = 500
+_ROLLUP_BATCH_SIZE_ = 1000
+
+ROLLUP_COLUMNS = {
+    "day": "day",
+    "author__real_name": "real_name",
+    "author__real_email": "real_email",
+    "author__company": "company",
+    "author__team": "team",
+    "author__author_group": "author_group",
+    "repo__repo_name": "repo_name",
+    "repo__repo_group": "repo_group",
+    "repo__component": "component",
+    "file_type": "file_type",
+    "n_commits": "n_commits",
+    "n_files_changed": "n_files_changed",
+    "n_files_ignored": "n_files_ignored",
+    "n_lines_changed": "n_lines_changed",
+    "n_lines_ignored": "n_lines_ignored",
+}
+
+
+def refresh_rollups(shas: Optional[Iterable[str]] = None) -> int:
+    """
+    recompute the daily rollups of the repository days of the given commits, or of the
+    commits linked to a repository since the last refresh when shas is None.
+    returns the number of repository days recomputed
+    """
+    days_by_repo: dict[int, set[date]] = defaultdict(set)
+    watermark, last_link_id = None, 0
+    if shas is None:
+        watermark, _ = RollupWatermark.objects.get_or_create(name=_WATERMARK_)
+        # links added while refreshing are left to the next refresh
+        last_link_id = RepositoryCommitLink.objects.aggregate(Max("id"))["id__max"] or 0
+        _add_days_(
+            days_by_repo, RepositoryCommitLink.objects.filter(id__gt=watermark.last_link_id, id__lte=last_link_id)
+        )
+    else:
+        shas = list(shas)
+        for i in range(0, len(shas), _SHA_BATCH_SIZE_):
+            _add_days_(days_by_repo, RepositoryCommitLink.objects.filter(commit_id__in=shas[i : i + _SHA_BATCH_SIZE_]))
+
+    with transaction.atomic():
+        for repo_id, days in days_by_repo.items():
+            sorted_days = sorted(days)
+            for i in range(0, len(sorted_days), _DAY_BATCH_SIZE_):
+                _rollup_days_(repo_id, sorted_days[i : i + _DAY_BATCH_SIZE_])
+        if watermark is not None:
+            watermark.last_link_id = last_link_id
+            watermark.save()
+
+    n_days = sum(len(days) for days in days_by_repo.values())
+    if n_days:
+        log(f"refreshed the daily rollups of {n_days:,} days in {len(days_by_repo):,} repositories")
+    return n_days
+
+
+def export_rollups(csv_file: str) -> None:
+    rows = DailyRollup.objects.order_by("day", "repo_id", "author_id", "file_type").values_list(*ROLLUP_COLUMNS)
+
+    n_rows = 0
+    with open(csv_file, "w", newline="") as csvfile:
+        writer = csv.writer(csvfile)
+        writer.writerow(ROLLUP_COLUMNS.values())
+        for row in rows.iterator(chunk_size=_ROLLUP_BATCH_SIZE_):
+            n_rows += 1
+            writer.writerow(row)
+        log(f"exported {n_rows} rollups to {csv_file}")
+
+
+def _add_days_(days_by_repo: dict[int, set[date]], links) -> None:
+    days = (
+        links.filter(commit__created_at__isnull=False)
+        .annotate(day=TruncDate("commit__created_at"))
+        .values_list("repo_id", "day")
+        .distinct()
+    )
+    for repo_id, day in days:
+        days_by_repo[repo_id].add(day)
+
+
+def _rollup_days_(repo_id: int, days: list[date]) -> None:
+    DailyRollup.objects.filter(repo_id=repo_id, day__in=days).delete()
+
+    ignored, changed = Q(is_superfluous=True), Q(is_superfluous=False)
+    rows = (
+        CommittedFile.objects.filter(
+            commit__repos__id=repo_id,
+            # the range narrows the scan to the batch, the days may be sparse within it
+            commit__created_at__gte=make_aware(datetime.combine(days[0], time.min)),
+            commit__created_at__lt=make_aware(datetime.combine(days[-1] + timedelta(days=1), time.min)),
+        )
+        .annotate(day=TruncDate("commit__created_at"))
+        .filter(day__in=days)
+        .values("day", "commit__author_id", "file_type")
+        .annotate(
+            total_commits=Count("commit_id", distinct=True),
+            total_files_changed=Count("id", filter=changed),
+            total_files_ignored=Count("id", filter=ignored),
+            total_lines_changed=Coalesce(Sum("n_lines_changed", filter=changed), 0),
+            total_lines_ignored=Coalesce(Sum("n_lines_changed", filter=ignored), 0),
+        )
+    )
+    DailyRollup.objects.bulk_create(
+        [
+            DailyRollup(
+                repo_id=repo_id,
+                author_id=row["commit__author_id"],
+                day=row["day"],
+                file_type=row["file_type"],
+                n_commits=row["total_commits"],
+                n_files_changed=row["total_files_changed"],
+                n_files_ignored=row["total_files_ignored"],
+                n_lines_changed=row["total_lines_changed"],
+                n_lines_ignored=row["total_lines_ignored"],
+            )
+            for row in rows
+        ],
+        batch_size=_ROLLUP_BATCH_SIZE_,
+    )
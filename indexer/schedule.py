@@ -0,0 +1,148 @@
+import heapq
+import multiprocessing
+import os
+from concurrent.futures import ProcessPoolExecutor, as_completed
+from contextlib import nullcontext
+from time import perf_counter
+from typing import Optional
+
+import django
+from django.db import connections
+from git import Git
+from git.exc import GitCommandError
+
+from .metrics import IndexMetrics
+from .models import Repository
+from .profiling import profile_name, profiled
+from .utils import ShaIndex, display_url, log, redact_http_url
+from .worker import index_commits
+
+# rough cost of extracting and saving one commit, only used to rank repositories
+_SECONDS_PER_COMMIT_ = 0.05
+
+# the known shas of a worker process, sent once when the process starts instead of with every repository
+_known_shas_: Optional[ShaIndex] = None
+
+
+def estimate_work(clone_url: str, repo_type: str) -> Optional[float]:
+    """
+    estimate the seconds index_commits will take for a repository without cloning it.
+    local repositories count the commits since the last indexed commit, others use the
+    duration of the previous run. returns None when there is nothing to go by.
+    """
+    repo = Repository.objects.filter(clone_url=redact_http_url(clone_url), repo_type=repo_type).first()
+
+    if os.path.isdir(clone_url):
+        args = ["--count", "--all"]
+        if repo and repo.last_commit_at:
+            args.append(f"--since={repo.last_commit_at.isoformat()}")
+        try:
+            return int(Git(clone_url).rev_list(*args)) * _SECONDS_PER_COMMIT_
+        except (GitCommandError, ValueError):
+            pass
+
+    if repo and repo.index_duration is not None:
+        return repo.index_duration
+
+    return None
+
+
+def largest_first(estimates: dict[str, Optional[float]]) -> list[str]:
+    """order by estimated work, descending. repositories without an estimate go first, they are likely never indexed"""
+
+    def work(url: str) -> float:
+        estimate = estimates[url]
+        return float("inf") if estimate is None else estimate
+
+    return sorted(estimates, key=work, reverse=True)
+
+
+def predict_makespan(durations: list[float], n_jobs: int) -> float:
+    """wall clock time of running the durations in the given order, each one on the first process that becomes free"""
+    finish_times = [0.0] * max(n_jobs, 1)
+    for duration in durations:
+        heapq.heapreplace(finish_times, finish_times[0] + duration)
+    return max(finish_times)
+
+
+def index_largest_first(
+    repo_urls: list[str],
+    repo_type: str,
+    n_jobs: int,
+    all_metrics: Optional[list[IndexMetrics]] = None,
+    profile_dir: str = "",
+    profile_top: int = 25,
+    **kwargs,
+) -> int:
+    """
+    index many repositories with n_jobs processes, the ones with most work first, so that a
+    large repository does not start last and hold up the whole run. kwargs are passed to index_commits.
+    the metrics of each repository are appended to all_metrics when given.
+    each repository is profiled into profile_dir when given, see profiling.profiled.
+    known_shas in kwargs is sent to each process once, when it starts.
+    """
+    if all_metrics is None:
+        all_metrics = []
+
+    estimates = {url: estimate_work(url, repo_type) for url in repo_urls}
+    ordered = largest_first(estimates)
+
+    # repositories without an estimate are assumed to be as large as the largest known one
+    known = [estimate for estimate in estimates.values() if estimate is not None]
+    largest, durations = max(known, default=0.0), []
+    for url in ordered:
+        estimate = estimates[url]
+        durations.append(largest if estimate is None else estimate)
+    log(
+        f"indexing {len(ordered)} repositories with {n_jobs} processes, "
+        f"predicted makespan {predict_makespan(durations, n_jobs):,.0f} seconds "
+        f"({len(ordered) - len(known)} repositories without estimate)"
+    )
+
+    start_t, n_commits = perf_counter(), 0
+    if n_jobs <= 1:
+        for url in ordered:
+            n_indexed, metrics = _index_repo_(url, repo_type, kwargs, profile_dir, profile_top)
+            n_commits += n_indexed
+            all_metrics.append(metrics)
+    else:
+        # connections cannot be shared with the child processes
+        connections.close_all()
+        context = multiprocessing.get_context("spawn")
+        known_shas = kwargs.pop("known_shas", None)
+        with ProcessPoolExecutor(
+            max_workers=n_jobs, mp_context=context, initializer=_init_worker_, initargs=(known_shas,)
+        ) as executor:
+            futures = {
+                executor.submit(_index_repo_, url, repo_type, kwargs, profile_dir, profile_top): url for url in ordered
+            }
+            for future in as_completed(futures):
+                try:
+                    n_indexed, metrics = future.result()
+                    n_commits += n_indexed
+                    all_metrics.append(metrics)
+                except Exception as e:
+                    print(f"Exception indexing repository {display_url(futures[future])} => {str(e)}")
+
+    elapsed = perf_counter() - start_t
+    log(f"indexed {n_commits} commits in {len(ordered)} repositories, actual makespan {elapsed:,.0f} seconds")
+    return n_commits
+
+
+def _init_worker_(known_shas: Optional[ShaIndex]) -> None:
+    global _known_shas_
+    django.setup()
+    _known_shas_ = known_shas
+
+
+def _index_repo_(
+    url: str, repo_type: str, kwargs: dict, profile_dir: str, profile_top: int
+) -> tuple[int, IndexMetrics]:
+    if _known_shas_ is not None:
+        # shared by the repositories indexed by this process, it also learns the commits they add
+        kwargs = {**kwargs, "known_shas": _known_shas_}
+    # the metrics are returned to the parent process
+    metrics = IndexMetrics("index_commits", redact_http_url(url))
+    with profiled(profile_name(url), profile_dir, profile_top) if profile_dir else nullcontext():
+        n_indexed = index_commits(url, repo_type, metrics=metrics, **kwargs)
+    return n_indexed, metrics
@@ -0,0 +1,186 @@
+import hashlib
+import random
+from dataclasses import dataclass
+from datetime import datetime, timedelta, timezone
+from typing import Iterator
+
+from .models import (
+    Author,
+    Commit,
+    CommittedFile,
+    MergeRequest,
+    Repository,
+    RepositoryCommitLink,
+)
+from .utils import branch_mask, log, should_exclude_from_stats
+
+_START_ = datetime(2022, 1, 1, tzinfo=timezone.utc)
+_DAYS_ = 730
+_BRANCHES_ = ["main", "develop", "feature", "bugfix", "main,release", "develop,feature", "hotfix,main"]
+_MODULES_ = ["account", "payment", "ledger", "customer", "card", "loan", "auth", "notify", "report", "audit"]
+_PATH_TEMPLATES_ = [
+    "src/main/java/com/company/{module}/service/{name}Service.java",
+    "src/test/java/com/company/{module}/{name}Test.java",
+    "src/main/resources/{module}/application-{name}.yaml",
+    "app/src/components/{module}/{name}.tsx",
+    "app/src/styles/_{name}.scss",
+    "vendor/github.com/{module}/{name}/{name}.go",
+    "web/node_modules/{module}/lib/{name}.js",
+    "web/package-lock.json",
+    "docs/{module}/{name}.md",
+    "README.md",
+]
+
+
+@dataclass
+class SeedSpec:
+    n_authors: int = 200
+    n_repos: int = 100
+    n_commits: int = 20000
+    files_per_commit: int = 8
+    merge_requests_per_repo: int = 20
+    # share of commits also linked to a 2nd repository, e.g. a fork
+    fork_ratio: float = 0.1
+    seed: int = 42
+    batch_size: int = 5000
+
+
+def seed_dataset(spec: SeedSpec) -> dict[str, int]:
+    """
+    bulk generate a realistic dataset, returns the number of rows created per table.
+    the hashes depend on the seed, use a different seed to add more data to a seeded database.
+    """
+    rng = random.Random(spec.seed)
+    if Commit.objects.filter(sha=_sha_(spec.seed, 0)).exists():
+        raise ValueError(f"the database is already seeded with seed {spec.seed}")
+
+    authors = Author.objects.bulk_create(
+        [
+            Author(
+                name=f"user{spec.seed}_{seq}",
+                email=f"user{spec.seed}_{seq}@example.com",
+                real_name=f"User {seq}",
+                # some people commit with several emails
+                real_email=f"user{spec.seed}_{seq // 2}@example.com",
+                company=rng.choice(["acme", "initech", "globex"]),
+                team=rng.choice(_MODULES_),
+            )
+            for seq in range(spec.n_authors)
+        ],
+        batch_size=spec.batch_size,
+    )
+    repos = Repository.objects.bulk_create(
+        [
+            Repository(
+                repo_type=repo_type,
+                clone_url=f"https://{repo_type}.com/seed{spec.seed}/repo-{seq}.git",
+                repo_group=rng.choice(_MODULES_),
+            )
+            for seq, repo_type in ((seq, rng.choice(["gitlab", "github"])) for seq in range(spec.n_repos))
+        ],
+        batch_size=spec.batch_size,
+    )
+    # skewed, a few authors and repositories have most of the commits
+    author_weights = [1.0 / (rank + 1) for rank in range(len(authors))]
+    repo_weights = [1.0 / (rank + 1) ** 0.5 for rank in range(len(repos))]
+    paths = [
+        template.format(module=rng.choice(_MODULES_), name=rng.choice(_MODULES_) + str(rng.randint(0, 500)))
+        for template in rng.choices(_PATH_TEMPLATES_, k=5000)
+    ]
+
+    counts = {"authors": len(authors), "repositories": len(repos), "commits": 0, "files": 0, "links": 0}
+    for start in range(0, spec.n_commits, spec.batch_size):
+        seqs = range(start, min(start + spec.batch_size, spec.n_commits))
+        commits, links = [], []
+        files: list[CommittedFile] = []
+        for seq in seqs:
+            commit = _commit_(rng, spec.seed, seq, rng.choices(authors, weights=author_weights)[0])
+            commits.append(commit)
+            for repo in _repos_of_commit_(rng, repos, repo_weights, spec.fork_ratio):
+                links.append(RepositoryCommitLink(repo=repo, commit=commit))
+            files.extend(_files_(rng, commit, paths, spec.files_per_commit))
+
+        Commit.objects.bulk_create(commits, batch_size=spec.batch_size)
+        RepositoryCommitLink.objects.bulk_create(links, batch_size=spec.batch_size)
+        CommittedFile.objects.bulk_create(files, batch_size=spec.batch_size)
+        counts["commits"] += len(commits)
+        counts["links"] += len(links)
+        counts["files"] += len(files)
+        log(f"seeded {counts['commits']:,} commits and {counts['files']:,} files")
+
+    merge_requests = MergeRequest.objects.bulk_create(_merge_requests_(rng, repos, spec), batch_size=spec.batch_size)
+    counts["merge_requests"] = len(merge_requests)
+    return counts
+
+
+def _sha_(seed: int, seq: int) -> str:
+    return hashlib.sha1(f"seed:{seed}:{seq}".encode()).hexdigest()
+
+
+def _commit_(rng: random.Random, seed: int, seq: int, author: Author) -> Commit:
+    branches = rng.choice(_BRANCHES_)
+    n_insertions, n_deletions = rng.randint(0, 400), rng.randint(0, 200)
+    return Commit(
+        sha=_sha_(seed, seq),
+        author=author,
+        message=f"{rng.choice(['fix', 'add', 'refactor', 'update'])} {rng.choice(_MODULES_)} #{seq}",
+        created_at=_START_ + timedelta(minutes=rng.randint(0, _DAYS_ * 1440)),
+        branches=branches,
+        branch_mask=branch_mask(branches),
+        is_merge=rng.random() < 0.05,
+        n_insertions=n_insertions,
+        n_deletions=n_deletions,
+        n_lines=n_insertions + n_deletions,
+    )
+
+
+def _repos_of_commit_(
+    rng: random.Random, repos: list[Repository], weights: list[float], fork_ratio: float
+) -> list[Repository]:
+    repo = rng.choices(repos, weights=weights)[0]
+    if rng.random() < fork_ratio:
+        fork = rng.choice(repos)
+        if fork != repo:
+            return [repo, fork]
+    return [repo]
+
+
+def _files_(rng: random.Random, commit: Commit, paths: list[str], files_per_commit: int) -> Iterator[CommittedFile]:
+    n_files = max(1, int(rng.expovariate(1.0 / files_per_commit)))
+    for file_path in set(rng.choices(paths, k=n_files)):
+        flag = should_exclude_from_stats(file_path)
+        n_added, n_deleted = rng.randint(0, 200), rng.randint(0, 100)
+        yield CommittedFile(
+            commit=commit,
+            commit_sha=commit.sha,
+            change_type=rng.choice(["ADD", "MODIFY", "MODIFY", "MODIFY", "DELETE"]),
+            file_path=file_path,
+            file_name=file_path.split("/")[-1],
+            n_lines_added=n_added,
+            n_lines_deleted=n_deleted,
+            n_lines_changed=n_added + n_deleted,
+            n_lines_of_code=rng.randint(10, 2000),
+            n_methods=rng.randint(0, 50),
+            n_methods_changed=rng.randint(0, 5),
+            is_on_exclude_list=flag,
+            is_superfluous=flag,
+        )
+
+
+def _merge_requests_(rng: random.Random, repos: list[Repository], spec: SeedSpec) -> Iterator[MergeRequest]:
+    for repo in repos:
+        for seq in range(spec.merge_requests_per_repo):
+            created_at = _START_ + timedelta(minutes=rng.randint(0, _DAYS_ * 1440))
+            is_merged = rng.random() < 0.8
+            yield MergeRequest(
+                repo=repo,
+                request_id=str(seq + 1),
+                title=f"merge request {seq + 1}",
+                state="merged" if is_merged else "closed",
+                source_branch=f"feature/{rng.choice(_MODULES_)}-{seq}",
+                target_branch="main",
+                created_at=created_at,
+                updated_at=created_at + timedelta(hours=rng.randint(1, 72)),
+                merged_at=created_at + timedelta(hours=rng.randint(1, 72)) if is_merged else None,
+                is_merged=is_merged,
+            )
@@ -92,7 +92,151 @@ STATS_SQL = [
         """,  # convert is_merge to integer to make it compatible to the existing schema that I cannot change.
 ]
 
+# the same stats as the updates in STATS_SQL, for a batch of commits
+# {shas} is replaced with the placeholders of the parameters
+COMMIT_STATS_SQL = """
+    update commits
+    set n_lines_changed = (
+            select COALESCE(sum(n_lines_changed),0)
+            from committed_files
+            where committed_files.commit_id = commits.sha
+            and is_superfluous is false
+        ),
+        n_files_changed = (
+            select count(1)
+            from committed_files
+            where committed_files.commit_id = commits.sha
+            and is_superfluous is false
+        ),
+        n_lines_ignored = (
+            select COALESCE(sum(n_lines_changed),0)
+            from committed_files
+            where committed_files.commit_id = commits.sha
+            and is_superfluous is true
+        ),
+        n_files_ignored = (
+            select count(1)
+            from committed_files
+            where committed_files.commit_id = commits.sha
+            and is_superfluous is true
+        )
+    where sha in ({shas})
+"""
+
+# the columns of all_commit_data from commits, committed_files and repo_to_commits, kept in a table
+# when INDEXER_MATERIALIZE_COMMIT_DATA is set. the columns of authors and repositories change without
+# the commit changing, e.g. last_indexed_at on every run, so they are joined from their tables by
+# the all_commit_data_fast view, which has the same columns as all_commit_data.
+_MATERIALIZED_COLUMNS_ = """
+    author_id,
+    sha,
+    commit_date,
+    is_merge,
+    commit_n_lines,
+    commit_n_files,
+    commit_n_insertions,
+    commit_n_deletions,
+    commit_n_lines_changed,
+    commit_n_lines_ignored,
+    commit_n_files_changed,
+    commit_n_files_ignored,
+    committed_file_id,
+    change_type,
+    file_path,
+    file_name,
+    file_type,
+    n_lines_added,
+    n_lines_deleted,
+    n_lines_changed,
+    n_lines_of_code,
+    n_methods,
+    n_methods_changed,
+    is_on_exclude_list,
+    is_superfluous,
+    repo_id
+"""
+
+# built from the view created by STATS_SQL
+MATERIALIZE_SQL = [
+    "drop view if exists all_commit_data_fast",
+    "drop table if exists all_commit_data_mat",
+    f"create table all_commit_data_mat as select {_MATERIALIZED_COLUMNS_} from all_commit_data",
+    "create index all_commit_data_mat_sha_repo on all_commit_data_mat (sha, repo_id)",
+    """
+        create view all_commit_data_fast
+        as
+        select
+            authors.id as author_id,
+            authors.name,
+            authors.email,
+            authors.real_name,
+            authors.real_email,
+            authors.company,
+            authors.team,
+            authors.author_group,
+            mat.sha,
+            mat.commit_date,
+            mat.is_merge,
+            mat.commit_n_lines,
+            mat.commit_n_files,
+            mat.commit_n_insertions,
+            mat.commit_n_deletions,
+            mat.commit_n_lines_changed,
+            mat.commit_n_lines_ignored,
+            mat.commit_n_files_changed,
+            mat.commit_n_files_ignored,
+            mat.committed_file_id,
+            mat.change_type,
+            mat.file_path,
+            mat.file_name,
+            mat.file_type,
+            mat.n_lines_added,
+            mat.n_lines_deleted,
+            mat.n_lines_changed,
+            mat.n_lines_of_code,
+            mat.n_methods,
+            mat.n_methods_changed,
+            mat.is_on_exclude_list,
+            mat.is_superfluous,
+            repo.repo_name,
+            repo.repo_group,
+            repo.repo_type,
+            repo.component,
+            repo.clone_url,
+            repo.id as repo_id,
+            repo.is_active as repo_inlude_in_stats,
+            repo.last_indexed_at
+        from all_commit_data_mat mat
+            inner join authors on authors.id = mat.author_id
+            inner join repositories repo on repo.id = mat.repo_id
+    """,
+]
+
+# commits with files that are linked to a repository but have no rows in all_commit_data_mat yet,
+# i.e. commits added since the last refresh
+UNMATERIALIZED_SHAS_SQL = """
+    select distinct rtc.commit_id
+    from repo_to_commits rtc
+    where exists (
+        select 1 from committed_files
+        where committed_files.commit_id = rtc.commit_id
+    )
+    and not exists (
+        select 1 from all_commit_data_mat mat
+        where mat.sha = rtc.commit_id and mat.repo_id = rtc.repo_id
+    )
+"""
+
+# replace the rows of a batch of commits, {shas} is replaced with the placeholders of the parameters
+REFRESH_COMMIT_DATA_SQL = [
+    "delete from all_commit_data_mat where sha in ({shas})",
+    f"insert into all_commit_data_mat select {_MATERIALIZED_COLUMNS_} from all_commit_data where sha in ({{shas}})",
+]
+
+# one partition of the export, ordered so that unchanged data produces the same file
+PARTITION_SQL = " select * from {table} where {where} order by committed_file_id, repo_id"
 
 QUERY_SQL = {
     "all_commit_data": " select * from all_commit_data limit 1000000",
+    "all_commit_data_fast": " select * from all_commit_data_fast limit 1000000",
 }
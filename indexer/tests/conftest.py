@@ -5,6 +5,7 @@ import tempfile
 import zipfile
 from datetime import datetime, timezone
 
+import git
 import pytest
 from django.conf import settings
 from django.core.management import call_command
@@ -69,6 +70,31 @@ def local_repo(tmp_path):
     shutil.rmtree(repo_base)
 
 
+@pytest.fixture
+def vendor_repo(tmp_path):
+    """a repo with 2 commits, each changes both source code and vendored files"""
+    repo_path = str(tmp_path / "vendor_repo")
+    repo = git.Repo.init(repo_path)
+    with repo.config_writer() as config:
+        config.set_value("user", "name", "Me")
+        config.set_value("user", "email", "me@example.com")
+
+    for seq in range(1, 3):
+        files = {
+            "src/app.py": "".join(f"def func_{i}():\n    return {i}\n\n" for i in range(seq * 2)),
+            "vendor/lib/lib.go": "".join(f"func F{i}() int {{ return {i} }}\n" for i in range(seq * 50)),
+            "web/package-lock.json": "{\n" + "".join(f'  "pkg{i}": "1.0.{seq}",\n' for i in range(seq * 20)) + "}\n",
+        }
+        for path, content in files.items():
+            os.makedirs(os.path.dirname(os.path.join(repo_path, path)), exist_ok=True)
+            with open(os.path.join(repo_path, path), "w") as f:
+                f.write(content)
+        repo.git.add(A=True)
+        repo.index.commit(f"commit {seq}")
+
+    return repo_path
+
+
 def seed_data():
     from indexer.models import Author, Commit, CommittedFile, Repository  # noqa: E402
 
@@ -0,0 +1,86 @@
+# please see conftest.py for seed data
+import json
+
+from indexer import middleware
+from indexer.metrics import QueryCounter
+from indexer.models import Commit
+from indexer.rollups import refresh_rollups
+
+
+def _get_(client, path, **params):
+    response = client.get(f"/indexer/api/{path}", params)
+    assert response.status_code == 200
+    assert response["Content-Type"] == "application/x-ndjson"
+    rows = [json.loads(line) for line in b"".join(response.streaming_content).decode().splitlines()]
+    return rows, response
+
+
+def test_commits(client, db):
+    rows, _ = _get_(client, "commits", repo="repo", author="mini@me")
+    assert {row["sha"] for row in rows} == set(Commit.objects.values_list("sha", flat=True))
+    assert rows[0]["author_email"] == "mini@me"
+
+    rows, _ = _get_(client, "commits", repo="no-such-repo")
+    assert rows == []
+
+
+def test_streamed_queries_are_counted(client, db, settings, mocker):
+    settings.INDEXER_REQUEST_QUERY_BUDGET = 0
+    log = mocker.patch.object(middleware, "log")
+    with QueryCounter() as queries:
+        response = client.get("/indexer/api/commits", {"repo": "repo"})
+        assert not log.called and "X-DB-Queries" not in response
+        b"".join(response.streaming_content)
+
+    # the rows are queried while the body is streamed
+    log.assert_called_once()
+    assert f"ran {queries.count} queries" in log.call_args[0][0]
+
+
+def test_commits_by_branch_and_date(client, db):
+    Commit.objects.filter(sha="feb3a2837630c0e51447fc1d7e68d86f964a8440").update(branches="main", branch_mask=1)
+
+    rows, _ = _get_(client, "commits", branch="main", since="2000-01-01")
+    assert [row["sha"] for row in rows] == ["feb3a2837630c0e51447fc1d7e68d86f964a8440"]
+
+    rows, _ = _get_(client, "commits", until="2000-01-01T00:00:00Z")
+    assert rows == []
+
+
+def test_keyset_pagination(client, db):
+    shas, params = [], {"limit": 1}
+    for _ in range(10):
+        rows, response = _get_(client, "commits", **params)
+        shas.extend(row["sha"] for row in rows)
+        if "Link" not in response:
+            break
+        params = {"limit": 1, "after": rows[-1]["sha"]}
+        assert f"after={rows[-1]['sha']}" in response["Link"]
+
+    assert shas == sorted(Commit.objects.values_list("sha", flat=True))
+
+
+def test_files_merge_requests_and_rollups(client, db):
+    rows, _ = _get_(client, "files", repo="repo", branch="other")
+    assert rows == []
+    rows, _ = _get_(client, "files", author="mini@me")
+    assert {row["file_name"] for row in rows} >= {"README.md", "package.json"}
+
+    rows, _ = _get_(client, "merge_requests", repo="repo")
+    assert "MR1" in {row["request_id"] for row in rows}
+
+    refresh_rollups()
+    rows, _ = _get_(client, "rollups", author="mini@me")
+    assert rows and all(row["repo_name"] == "repo" for row in rows)
+
+
+def test_bad_requests(client, db):
+    for path, params in [
+        ("commits", {"branch": "trunk"}),
+        ("commits", {"since": "last week"}),
+        ("commits", {"limit": 0}),
+        ("files", {"after": "abc"}),
+        ("merge_requests", {"author": "mini@me"}),
+    ]:
+        response = client.get(f"/indexer/api/{path}", params)
+        assert response.status_code == 400 and "error" in response.json()
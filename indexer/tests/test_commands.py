@@ -1,11 +1,32 @@
+import csv
+import gzip
+import io
 import os
 import shlex
 
 import pytest
-from django.core.management import call_command
+from django.core.management import CommandError, call_command
+from django.db import connection
 
+from indexer.extract import ExtractOptions
 from indexer.management.commands.index import enumberate_from_file
-from indexer.worker import export_all_data, update_commit_stats
+from indexer.models import (
+    Author,
+    Commit,
+    CommittedFile,
+    IndexJob,
+    MergeRequest,
+    Repository,
+)
+from indexer.profiling import profile_name
+from indexer.worker import (
+    analyze_stats_only_commits,
+    export_all_data,
+    index_commits,
+    refresh_commit_data,
+    update_commit_stats,
+    write_all_data,
+)
 
 
 def invoke_command(cmdline: str) -> None:
@@ -46,8 +67,110 @@ def test_enumberate_from_file(tmp_path):
     assert len(repos) == 1 and "repo1" in repos[0]
 
 
+def test_enqueue_dry_run(db, local_repo):
+    n_repos = Repository.objects.count()
+    invoke_command(f"index --source local --query {local_repo} --filter * --enqueue --dry-run")
+    assert Repository.objects.count() == n_repos
+    assert not IndexJob.objects.exists()
+
+    invoke_command(f"index --source local --query {local_repo} --filter * --enqueue")
+    assert IndexJob.objects.count() == Repository.objects.count() - n_repos > 0
+
+
 def test_export_csv(tmp_path, db):
     update_commit_stats()  # this creates the view we need
     tmp_f = (tmp_path / "test.csv").as_posix()
     export_all_data(tmp_f)
     assert os.path.isfile(tmp_f) and os.stat(tmp_f).st_size > 0
+
+
+def test_export_csv_gz(tmp_path, db):
+    update_commit_stats()
+    csv_file = (tmp_path / "test.csv").as_posix()
+    n_rows = export_all_data(csv_file)
+    assert n_rows > 0
+
+    # the same content, compressed the same way every time
+    out = io.BytesIO()
+    assert write_all_data(out, compress=True) == n_rows
+    with open(csv_file, "rb") as f:
+        assert gzip.decompress(out.getvalue()) == f.read()
+    assert export_all_data(csv_file + ".gz") == n_rows
+    with open(csv_file + ".gz", "rb") as f:
+        assert f.read() == out.getvalue()
+
+
+def test_export_materialized_commit_data(tmp_path, db, local_repo, settings):
+    settings.INDEXER_MATERIALIZE_COMMIT_DATA = True
+    update_commit_stats()  # creates the view, then the table from it
+    n_rows = _n_rows_("all_commit_data_mat")
+    assert n_rows == _n_rows_("all_commit_data")
+
+    # only the new commits are added to the table
+    assert index_commits(local_repo + "/repo1", "local") == 2
+    update_commit_stats()
+    assert _n_rows_("all_commit_data_mat") == _n_rows_("all_commit_data") > n_rows
+    assert refresh_commit_data() == 0
+
+    tmp_f = (tmp_path / "test.csv").as_posix()
+    export_all_data(tmp_f)
+    with open(tmp_f) as f:
+        assert sum(1 for _ in f) == _n_rows_("all_commit_data") + 1
+    assert _export_(settings, materialized=True) == _export_(settings, materialized=False)
+
+
+def test_materialized_commit_data_follows_changes(db, vendor_repo, settings):
+    settings.INDEXER_MATERIALIZE_COMMIT_DATA = True
+    assert index_commits(vendor_repo, "local", options=ExtractOptions(max_files=2)) == 2
+    update_commit_stats()
+
+    # the files of stats only commits are replaced, the repository is indexed again and renamed
+    assert analyze_stats_only_commits(vendor_repo, "local") == 2
+    index_commits(vendor_repo, "local")
+    Author.objects.update(team="platform")
+    Repository.objects.update(repo_group="apps")
+    update_commit_stats()
+    assert _export_(settings, materialized=True) == _export_(settings, materialized=False)
+
+
+def _export_(settings, materialized: bool) -> list[list[str]]:
+    settings.INDEXER_MATERIALIZE_COMMIT_DATA = materialized
+    out = io.BytesIO()
+    write_all_data(out, where="1 = 1")
+    # sqlite does not keep the boolean type of the columns copied into a table, postgres does
+    booleans = {"False": "0", "True": "1"}
+    return [[booleans.get(value, value) for value in row] for row in csv.reader(io.StringIO(out.getvalue().decode()))]
+
+
+def _n_rows_(table: str) -> int:
+    with connection.cursor() as cursor:
+        cursor.execute(f"select count(1) from {table}")
+        return cursor.fetchone()[0]
+
+
+def test_index_with_profile(db, local_repo, tmp_path):
+    profile_dir = str(tmp_path / "profiles")
+    call_command("index", source="local", query=local_repo, filter="*repo1", profile=True, profile_dir=profile_dir)
+
+    name = profile_name(local_repo + "/repo1")
+    assert os.path.isfile(f"{profile_dir}/{name}.prof")
+    with open(f"{profile_dir}/{name}.txt") as f:
+        summary = f.read()
+    assert "index_commits" in summary and "by allocated memory" in summary
+
+
+def test_seed(db):
+    n_commits = Commit.objects.count()
+    call_command("seed", n_authors=5, n_repos=3, n_commits=50, files_per_commit=4, batch_size=20, seed=7)
+
+    assert Commit.objects.count() == n_commits + 50
+    assert Repository.objects.filter(clone_url__contains="/seed7/").count() == 3
+    assert MergeRequest.objects.filter(repo__clone_url__contains="/seed7/").count() == 60
+    assert CommittedFile.objects.filter(
+        commit_sha__in=Commit.objects.filter(author__name__startswith="user7_")
+    ).exists()
+    # the stats are updated after seeding
+    assert Commit.objects.filter(author__name__startswith="user7_", n_files_changed__gt=0).exists()
+
+    with pytest.raises(CommandError):
+        call_command("seed", n_commits=10, seed=7)
@@ -0,0 +1,122 @@
+import gzip
+import io
+import json
+import os
+from datetime import datetime, timezone
+
+import pytest
+from django.db import DatabaseError
+
+from indexer import export
+from indexer.export import MANIFEST, export_partitioned, partitions
+from indexer.models import Commit, CommittedFile, Repository
+from indexer.worker import index_commits, update_commit_stats, write_all_data
+
+
+def test_export_partitioned(db, local_repo, tmp_path):
+    index_commits(local_repo + "/repo1", "local")
+    update_commit_stats()
+    output_dir = str(tmp_path / "all_commit_data")
+
+    entries = export_partitioned(output_dir, "month")
+    assert len(entries) > 1 and all(entry["changed"] for entry in entries)
+    with open(os.path.join(output_dir, MANIFEST)) as f:
+        assert json.load(f)["partitions"] == entries
+
+    # the partitions add up to the whole export
+    n_rows = 0
+    for entry in entries:
+        with gzip.open(os.path.join(output_dir, entry["file"]), "rt") as f:
+            n_rows += sum(1 for _ in f) - 1
+        assert n_rows > 0 and entry["rows"] > 0
+    assert n_rows == sum(entry["rows"] for entry in entries) == write_all_data(io.BytesIO())
+
+    # nothing changed
+    assert not any(entry["changed"] for entry in export_partitioned(output_dir, "month"))
+
+    CommittedFile.objects.filter(file_name="App.js").update(n_lines_added=42)
+    changed = [entry["name"] for entry in export_partitioned(output_dir, "month") if entry["changed"]]
+    assert len(changed) == 1
+
+
+def test_export_partitioned_after_index(db, local_repo, tmp_path, mocker):
+    index_commits(local_repo + "/repo1", "local")
+    update_commit_stats()
+    output_dir = str(tmp_path / "all_commit_data")
+    upload = mocker.patch.object(export, "upload_file", return_value=True)
+    export_partitioned(output_dir, "month", upload=True)
+    assert upload.call_count > 1
+
+    # indexing again sets last_indexed_at, no commits are new so nothing is uploaded but the manifest
+    upload.reset_mock()
+    assert index_commits(local_repo + "/repo1", "local") == 0
+    update_commit_stats()
+    assert not any(entry["changed"] for entry in export_partitioned(output_dir, "month", upload=True))
+    upload.assert_called_once_with(os.path.join(output_dir, MANIFEST), f"all_commit_data/{MANIFEST}")
+
+
+def test_export_partitioned_failure(db, local_repo, tmp_path, mocker):
+    index_commits(local_repo + "/repo1", "local")
+    update_commit_stats()
+    output_dir = str(tmp_path / "all_commit_data")
+    export_partitioned(output_dir, "month")
+    before = {name: open(os.path.join(output_dir, name), "rb").read() for name in os.listdir(output_dir)}
+
+    # a partition fails half way, the previous manifest and files are kept
+    def write_then_fail(*args, **kwargs):
+        if write.call_count == 2:
+            raise DatabaseError("connection lost")
+        return write_all_data(*args, **kwargs)
+
+    write = mocker.patch.object(export, "write_all_data", side_effect=write_then_fail)
+    with pytest.raises(DatabaseError):
+        export_partitioned(output_dir, "month")
+    assert write.call_count == 2
+    assert {name: open(os.path.join(output_dir, name), "rb").read() for name in os.listdir(output_dir)} == before
+
+    # in the worker processes, which cannot see the in memory test database
+    mocker.stopall()
+    with pytest.raises(RuntimeError, match="failed to export partitions"):
+        export_partitioned(output_dir, "month", n_jobs=2)
+    assert {name: open(os.path.join(output_dir, name), "rb").read() for name in os.listdir(output_dir)} == before
+
+
+def test_partitions_by_month_in_utc(db, local_repo, tmp_path):
+    index_commits(local_repo + "/repo1", "local")
+    update_commit_stats()
+    # 00:30 on the 1st of january in Asia/Singapore, the time zone of the settings
+    sha = Commit.objects.filter(n_files_changed__gt=0).values_list("sha", flat=True)[0]
+    Commit.objects.filter(sha=sha).update(created_at=datetime(2022, 12, 31, 16, 30, tzinfo=timezone.utc))
+
+    # the loader scopes a month partition by the UTC month of commit_date
+    entries = {entry["name"]: entry for entry in export_partitioned(str(tmp_path), "month")}
+    assert "2023-01" not in entries
+    with gzip.open(os.path.join(tmp_path, entries["2022-12"]["file"]), "rt") as f:
+        assert sha in f.read()
+
+
+def test_export_partitioned_by_repo_group(db, local_repo, tmp_path):
+    index_commits(local_repo + "/repo1", "local")
+    update_commit_stats()
+    output_dir = str(tmp_path / "all_commit_data")
+    Repository.objects.update(repo_group="payments/cards")
+    assert [entry["name"] for entry in export_partitioned(output_dir, "repo_group")] == ["payments%2Fcards"]
+
+    # the group without rows is kept as a header only file, so that loading it clears the group
+    Repository.objects.update(repo_group="")
+    entries = {entry["name"]: entry for entry in export_partitioned(output_dir, "repo_group")}
+    assert entries["no-group"]["rows"] > 0
+    assert entries["payments%2Fcards"]["rows"] == 0 and entries["payments%2Fcards"]["changed"]
+    with gzip.open(os.path.join(output_dir, entries["payments%2Fcards"]["file"]), "rt") as f:
+        assert len(f.readlines()) == 1
+
+    # the partitions of another kind are not carried over
+    assert all(entry["rows"] > 0 for entry in export_partitioned(output_dir, "month"))
+
+
+def test_partitions_by_repo_group(db):
+    assert [partition.name for partition in partitions("repo_group")] == ["no-group"]
+    Repository.objects.update(repo_group="2023-01")
+    assert [partition.name for partition in partitions("repo_group")] == ["%32023-01"]
+    with pytest.raises(ValueError):
+        partitions("week")
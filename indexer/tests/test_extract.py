@@ -0,0 +1,109 @@
+import os
+from datetime import datetime
+
+import git
+
+from indexer.extract import (
+    ExtractCache,
+    ExtractOptions,
+    commit_record,
+    partition,
+    traverse,
+)
+from indexer.utils import set_ignore_patterns
+
+
+def _files_by_path_(record):
+    return {f.file_path: f for f in record.files}
+
+
+def test_skip_ignored_diffs(vendor_repo):
+    options = ExtractOptions(skip_ignored_diffs=True)
+    for git_commit in traverse(vendor_repo, datetime.min):
+        full = _files_by_path_(commit_record(git_commit))
+        lean = _files_by_path_(commit_record(git_commit, options=options))
+
+        assert full.keys() == lean.keys()
+        for path, file_record in full.items():
+            assert lean[path].change_type == file_record.change_type
+            assert lean[path].n_lines_added == file_record.n_lines_added
+            assert lean[path].n_lines_deleted == file_record.n_lines_deleted
+
+        # source code still gets the code metrics, vendored files don't
+        assert lean["src/app.py"] == full["src/app.py"]
+        assert lean["src/app.py"].n_methods > 0
+        assert lean["vendor/lib/lib.go"].n_methods == 0 and full["vendor/lib/lib.go"].n_methods > 0
+
+
+def test_stats_only_for_large_commits(vendor_repo):
+    options = ExtractOptions(max_files=2)
+    for git_commit in traverse(vendor_repo, datetime.min):
+        full = commit_record(git_commit)
+        record = commit_record(git_commit, options=options)
+
+        assert record.stats_only and not full.stats_only
+        assert record.n_files == full.n_files == 3
+        assert {f.file_path: f.n_lines_added for f in record.files} == {
+            f.file_path: f.n_lines_added for f in full.files
+        }
+        assert all(f.n_methods == 0 for f in record.files)
+
+    assert not commit_record(git_commit, options=ExtractOptions(max_files=3, max_lines=10000)).stats_only
+
+
+def test_renames_in_all_paths(vendor_repo):
+    # rename a vendored file with a small change, and a source file without any
+    repo = git.Repo(vendor_repo)
+    with open(os.path.join(vendor_repo, "vendor/lib/lib.go"), "a") as f:
+        f.write("func G() int { return 0 }\n")
+    repo.git.mv("vendor/lib/lib.go", "vendor/lib/lib2.go")
+    repo.git.mv("src/app.py", "src/main.py")
+    repo.git.add(A=True)
+    repo.index.commit("rename")
+
+    git_commit = list(traverse(vendor_repo, datetime.min))[-1]
+    full = _files_by_path_(commit_record(git_commit))
+    assert {path: f.change_type for path, f in full.items()} == {
+        "vendor/lib/lib2.go": "RENAME",
+        "src/main.py": "RENAME",
+    }
+    for options in [ExtractOptions(skip_ignored_diffs=True), ExtractOptions(max_files=1)]:
+        files = _files_by_path_(commit_record(git_commit, options=options))
+        assert files.keys() == full.keys()
+        for path, file_record in full.items():
+            assert files[path].change_type == file_record.change_type
+            assert files[path].n_lines_added == file_record.n_lines_added
+            assert files[path].n_lines_deleted == file_record.n_lines_deleted
+
+
+def test_extract_cache(vendor_repo, tmp_path, mocker):
+    options = ExtractOptions(cache_path=str(tmp_path / "cache.db"))
+    records = [commit_record(git_commit, options=options) for git_commit in traverse(vendor_repo, datetime.min)]
+
+    # 2nd extraction reads the cache without diffing the commits
+    diff = mocker.patch("indexer.extract._file_record_")
+    cached = [commit_record(git_commit, options=options) for git_commit in traverse(vendor_repo, datetime.min)]
+    assert diff.call_count == 0
+    assert cached == records
+
+    # the cache is keyed by the kind of metrics extracted
+    options.skip_ignored_diffs = True
+    assert ExtractCache.shared(options.cache_path).get(records[0].sha, options.tier) is None
+
+    # and by the ignore patterns deciding which diffs are skipped
+    mocker.stopall()
+    skipped = commit_record(next(traverse(vendor_repo, datetime.min)), options=options)
+    tier = options.tier
+    try:
+        set_ignore_patterns([])
+        assert options.tier != tier
+        assert ExtractCache.shared(options.cache_path).get(skipped.sha, options.tier) is None
+    finally:
+        set_ignore_patterns(None)
+    assert options.tier == tier
+
+
+def test_partition():
+    assert partition([], 4) == []
+    assert partition(["a", "b", "c"], 5) == [["a"], ["b"], ["c"]]
+    assert partition(list("abcdefg"), 3) == [list("abc"), list("def"), list("g")]
@@ -0,0 +1,69 @@
+from django.core.management import call_command
+
+from indexer.ledger import finish_run, record_repo, start_run, summarize
+from indexer.metrics import IndexMetrics
+from indexer.models import CommittedFile, IndexRun, IndexRunRepo, ensure_repository
+from indexer.worker import index_commits
+
+
+def _record_(run, repo, duration, outcome="ok"):
+    metrics = IndexMetrics("index_commits", repo.clone_url)
+    metrics.repo_id, metrics.elapsed, metrics.outcome = repo.id, duration, outcome
+    return record_repo(run, metrics)
+
+
+def test_index_command_records_run(db, local_repo):
+    call_command("index", source="local", query=local_repo, filter="*repo1*")
+
+    run = IndexRun.objects.get(command="index")
+    assert run.finished_at and run.n_repos == 2 and run.n_commits == 5
+
+    rows = {row.repo.repo_name: row for row in run.repos.all()}
+    assert rows["repo1"].outcome == rows["repo1_clone"].outcome == "ok"
+    assert rows["repo1"].n_new_commits == 2 and rows["repo1_clone"].n_new_commits == 3
+    # commits shared by the 2 repos are extracted once
+    clone = ensure_repository(local_repo + "/repo1_clone", "local")
+    assert (
+        rows["repo1"].n_files + rows["repo1_clone"].n_files == CommittedFile.objects.filter(commit__repos=clone).count()
+    )
+    assert rows["repo1"].peak_rss_mb > 0 and rows["repo1"].n_db_queries > 0
+
+
+def test_record_metrics(db, local_repo):
+    run = start_run("index")
+    metrics = IndexMetrics("index_commits")
+    index_commits(local_repo + "/repo1", "local", metrics=metrics)
+    row = record_repo(run, metrics)
+    finish_run(run, 1, 2)
+
+    assert row.repo == ensure_repository(local_repo + "/repo1", "local")
+    assert row.duration == metrics.elapsed and row.n_new_commits == 2
+
+
+def test_summarize(db, local_repo):
+    steady = ensure_repository(local_repo + "/repo1", "local")
+    slower = ensure_repository(local_repo + "/repo1_clone", "local")
+
+    run = start_run("index")
+    for duration in [20.0, 22.0, 21.0]:
+        _record_(run, steady, duration)
+        _record_(run, slower, duration)
+    _record_(run, steady, 23.0)
+    _record_(run, slower, 50.0)
+    _record_(run, slower, 0.0, "timeout")
+
+    summaries = {summary.repo_id: summary for summary in summarize()}
+    assert not summaries[steady.id].is_regression
+    assert summaries[steady.id].n_runs == 4 and summaries[steady.id].median_duration == 21.5
+
+    assert summaries[slower.id].n_failed == 1 and summaries[slower.id].last_outcome == "timeout"
+    assert summaries[slower.id].p95_duration == 50.0
+    # the last successful run is compared to the ones before it, the timeout after it does not hide it
+    assert IndexRunRepo.objects.filter(repo=slower).count() == 5
+    assert [s.repo_id for s in summarize() if s.is_regression] == [slower.id]
+
+    # back to normal
+    _record_(run, slower, 21.0)
+    assert [s.repo_id for s in summarize() if s.is_regression] == []
+
+    call_command("index_summary", regressions_only=True)
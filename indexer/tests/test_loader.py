@@ -0,0 +1,105 @@
+import os
+import sqlite3
+import sys
+
+import pytest
+from django.conf import settings
+
+sys.path.insert(0, os.path.abspath(settings.BASE_DIR / "gcp/cloud_function"))
+
+from loader import (  # type: ignore [import] # noqa: E402
+    BigQueryDialect,
+    SQLiteDialect,
+    partition_of,
+    scope_of,
+)
+
+_COLUMNS_ = ["committed_file_id", "repo_id", "commit_date", "repo_group", "n_lines_changed"]
+
+
+@pytest.fixture
+def warehouse():
+    db = sqlite3.connect(":memory:", isolation_level=None)
+    for table in ["all_commit_data", "staging"]:
+        db.execute(f"create table {table} ({', '.join(_COLUMNS_)})")
+    db.executemany(
+        "insert into all_commit_data values (?, ?, ?, ?, ?)",
+        [
+            (1, 1, "2023-01-05 10:00:00+00:00", "a", 10),
+            (2, 1, "2023-01-06 10:00:00+00:00", "a", 20),
+            (3, 1, "2023-02-01 10:00:00+00:00", "b", 30),
+            (4, 1, None, "b", 40),
+        ],
+    )
+    yield db
+    db.close()
+
+
+def _load_(db, rows, scope, partition=None):
+    db.execute("delete from staging")
+    db.executemany("insert into staging values (?, ?, ?, ?, ?)", rows)
+    for statement in SQLiteDialect().load("all_commit_data", "staging", _COLUMNS_, scope, partition):
+        db.execute(statement)
+    return db.execute("select committed_file_id, n_lines_changed from all_commit_data order by 1").fetchall()
+
+
+def test_load_month(warehouse):
+    # 1 is updated, 5 is added, 2 is gone from january, other months are untouched
+    rows = [(1, 1, "2023-01-05 10:00:00+00:00", "a", 11), (5, 1, "2023-01-07 10:00:00+00:00", "a", 50)]
+    assert _load_(warehouse, rows, "month", "2023-01") == [(1, 11), (3, 30), (4, 40), (5, 50)]
+
+    # loading the same partition again changes nothing
+    assert _load_(warehouse, rows, "month", "2023-01") == [(1, 11), (3, 30), (4, 40), (5, 50)]
+
+
+def test_load_month_boundary(warehouse):
+    # 00:30 on the 1st of january in Asia/Singapore, in the december partition of the export
+    warehouse.execute("insert into all_commit_data values (6, 1, '2022-12-31 16:30:00+00:00', 'a', 60)")
+    rows = [(1, 1, "2023-01-05 10:00:00+00:00", "a", 11), (2, 1, "2023-01-06 10:00:00+00:00", "a", 20)]
+    assert _load_(warehouse, rows, "month", "2023-01") == [(1, 11), (2, 20), (3, 30), (4, 40), (6, 60)]
+
+    # the rows of a month are deleted when they are all gone from its partition
+    assert _load_(warehouse, [], "month", "2023-01") == [(3, 30), (4, 40), (6, 60)]
+    assert _load_(warehouse, [], "month", "") == [(3, 30), (6, 60)]
+    with pytest.raises(ValueError):
+        SQLiteDialect().delete_missing("all_commit_data", "staging", "month")
+
+
+def test_load_repo_group_and_full(warehouse):
+    assert _load_(warehouse, [(3, 1, "2023-02-01 10:00:00+00:00", "b", 33)], "repo_group", "b") == [
+        (1, 10),
+        (2, 20),
+        (3, 33),
+    ]
+    # a group without rows left is cleared by its empty partition, the name is quoted as a literal
+    warehouse.execute("insert into all_commit_data values (5, 2, null, 'it''s', 50)")
+    assert _load_(warehouse, [], "repo_group", "it's") == [(1, 10), (2, 20), (3, 33)]
+    assert _load_(warehouse, [], "repo_group", "a") == [(3, 33)]
+    assert _load_(warehouse, [(2, 1, "2023-01-06 10:00:00+00:00", "a", 22)], None) == [(2, 22)]
+
+
+def test_bigquery_statements():
+    statements = BigQueryDialect().load("p.d.all_commit_data", "p.d.staging", _COLUMNS_, "month", "2023-01")
+    assert statements[0] == "BEGIN TRANSACTION" and statements[-1] == "COMMIT TRANSACTION"
+    assert statements[1].startswith("MERGE `p.d.all_commit_data` t USING `p.d.staging` s")
+    assert "t.committed_file_id = s.committed_file_id AND t.repo_id = s.repo_id" in statements[1]
+    assert "COALESCE(FORMAT_TIMESTAMP('%Y-%m', t.commit_date), '') = '2023-01'" in statements[2]
+    assert BigQueryDialect().literal("it's a \\") == "'it\\'s a \\\\'"
+
+
+def test_scope_of():
+    assert scope_of("all_commit_data.csv") is None and scope_of("all_commit_data.csv.gz") is None
+    assert scope_of("all_commit_data/all_commit_data-2023-01.csv.gz") == "month"
+    assert scope_of("all_commit_data/all_commit_data-no-date.csv.gz") == "month"
+    assert scope_of("all_commit_data/all_commit_data-payments.csv.gz") == "repo_group"
+    with pytest.raises(ValueError):
+        scope_of("all_commit_data/manifest.json")
+
+    assert partition_of("all_commit_data/all_commit_data-2023-01.csv.gz") == "2023-01"
+    assert partition_of("all_commit_data/all_commit_data-no-date.csv.gz") == ""
+    assert partition_of("all_commit_data/all_commit_data-no-group.csv.gz") == ""
+    assert partition_of("all_commit_data/all_commit_data-payments%2Fcards.csv.gz") == "payments/cards"
+    # a group that looks like a month
+    assert scope_of("all_commit_data/all_commit_data-%32023-01.csv.gz") == "repo_group"
+    assert partition_of("all_commit_data/all_commit_data-%32023-01.csv.gz") == "2023-01"
+    assert partition_of("all_commit_data.csv.gz") is None
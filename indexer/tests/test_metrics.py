@@ -0,0 +1,66 @@
+import json
+
+from indexer.metrics import IndexMetrics, QueryCounter, write_prometheus
+from indexer.models import Repository
+from indexer.worker import index_commits
+
+
+def test_index_commits_metrics(db, local_repo, capsys):
+    metrics = IndexMetrics("index_commits", "repo1")
+    assert index_commits(local_repo + "/repo1", "local", metrics=metrics) == 2
+
+    assert metrics.outcome == "ok"
+    assert metrics.counters["commits"] == 2 and metrics.counters["files"] == 5
+    assert metrics.counters["db_queries"] > 0
+    assert {"load", "extract", "authors", "db_write", "links"} <= metrics.phases.keys()
+    assert sum(metrics.phases.values()) <= metrics.elapsed
+    assert metrics.rate("commits") > 0
+
+    # one json line per repository
+    lines = [line for line in capsys.readouterr().out.splitlines() if line.startswith("{")]
+    assert json.loads(lines[-1])["counters"]["commits"] == 2
+
+
+def test_index_commits_query_budget(db, local_repo):
+    metrics = IndexMetrics("index_commits", "repo1")
+    n_commits = index_commits(local_repo + "/repo1", "local", metrics=metrics)
+    # a new author takes a savepoint around its insert, so that a concurrent insert can be recovered from
+    assert metrics.counters["db_queries"] <= 6 + 10 * n_commits
+
+    # nothing new to index
+    metrics = IndexMetrics("index_commits", "repo1")
+    assert index_commits(local_repo + "/repo1", "local", metrics=metrics) == 0
+    assert metrics.counters["db_queries"] <= 6
+
+
+def test_query_counter_slow_queries(db, capsys):
+    with QueryCounter("test", slow_ms=0) as queries:
+        assert Repository.objects.count() > 0
+    assert queries.count == 1 and queries.seconds > 0
+    _, call_site, sql = queries.slow[0]
+    assert call_site.startswith("indexer/tests/test_metrics.py:") and "COUNT" in sql
+    assert "slow query" in capsys.readouterr().out
+
+
+def test_timed():
+    metrics = IndexMetrics("test")
+    assert list(metrics.timed(iter(range(3)), "wait")) == [0, 1, 2]
+    assert "wait" in metrics.phases
+
+
+def test_write_prometheus(tmp_path):
+    metrics = IndexMetrics("index_commits", 'https://gitlab.com/group/"repo".git')
+    metrics.elapsed = 1.5
+    metrics.phases["extract"] = 1.25
+    metrics.add("commits", 10)
+
+    path = str(tmp_path / "indexer.prom")
+    write_prometheus(path, [metrics])
+    with open(path) as f:
+        lines = f.read().splitlines()
+
+    labels = 'job="index_commits",repo="https://gitlab.com/group/\\"repo\\".git"'
+    assert "# TYPE git_indexer_commits_total counter" in lines
+    assert f"git_indexer_commits_total{{{labels}}} 10" in lines
+    assert f'git_indexer_phase_seconds{{{labels},phase="extract"}} 1.250' in lines
+    assert f"git_indexer_duration_seconds{{{labels}}} 1.500" in lines
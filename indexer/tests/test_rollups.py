@@ -0,0 +1,45 @@
+import csv
+
+from indexer.models import CommittedFile, DailyRollup, RollupWatermark
+from indexer.rollups import export_rollups, refresh_rollups
+from indexer.worker import index_commits, update_commit_stats
+
+
+def test_refresh_rollups(db, local_repo):
+    assert refresh_rollups() > 0
+    n_rollups = DailyRollup.objects.count()
+    # nothing linked since the last refresh
+    assert refresh_rollups() == 0
+
+    assert index_commits(local_repo + "/repo1", "local") == 2
+    assert refresh_rollups() > 0
+    assert DailyRollup.objects.count() > n_rollups
+
+    # the rollups add up to the committed files of each repository
+    rollups = DailyRollup.objects.filter(repo__clone_url__endswith="repo1")
+    files = CommittedFile.objects.filter(commit__repos__clone_url__endswith="repo1")
+    assert sum(r.n_files_changed + r.n_files_ignored for r in rollups) == files.count()
+    assert sum(r.n_lines_changed + r.n_lines_ignored for r in rollups) == sum(f.n_lines_changed for f in files)
+
+
+def test_refresh_rollups_of_commits(db):
+    refresh_rollups()
+    rollup = DailyRollup.objects.get(repo__clone_url="https://gitlab.com/dummy/repo.git", file_type="json")
+    assert rollup.n_files_changed == 1 and rollup.n_files_ignored == 0
+
+    CommittedFile.objects.filter(file_name="package.json").update(is_superfluous=True)
+    update_commit_stats(["feb3a2837630c0e51447fc1d7e68d86f964a8440"])
+    rollup = DailyRollup.objects.get(repo__clone_url="https://gitlab.com/dummy/repo.git", file_type="json")
+    assert rollup.n_files_changed == 0 and rollup.n_files_ignored == 1
+    assert RollupWatermark.objects.get().last_link_id > 0
+
+
+def test_export_rollups(db, tmp_path):
+    refresh_rollups()
+    csv_file = str(tmp_path / "rollups.csv")
+    export_rollups(csv_file)
+
+    with open(csv_file) as f:
+        rows = list(csv.DictReader(f))
+    assert len(rows) == DailyRollup.objects.count()
+    assert {"day", "real_email", "repo_name", "file_type", "n_commits", "n_lines_changed"} <= rows[0].keys()
@@ -0,0 +1,80 @@
+from concurrent.futures import Future
+
+from indexer import schedule
+from indexer.models import Repository, ensure_repository
+from indexer.schedule import (
+    _SECONDS_PER_COMMIT_,
+    estimate_work,
+    index_largest_first,
+    largest_first,
+    predict_makespan,
+)
+from indexer.worker import load_known_shas
+
+
+def test_estimate_work(db, local_repo):
+    repo1_clone = local_repo + "/repo1_clone"
+    assert estimate_work(repo1_clone, "local") == 3 * _SECONDS_PER_COMMIT_
+
+    # remote repositories use the duration of the previous run
+    assert estimate_work("https://github.com/group/project.git", "github") is None
+    repo = ensure_repository("https://github.com/group/project.git", "github")
+    repo.index_duration = 12.5
+    repo.save()
+    assert estimate_work("https://github.com/group/project.git", "github") == 12.5
+
+
+def test_largest_first():
+    assert largest_first({"small": 1.0, "unknown": None, "large": 10.0}) == ["unknown", "large", "small"]
+
+    # longest first keeps the large job from starting last
+    assert predict_makespan([1.0, 1.0, 1.0, 1.0, 4.0], 2) == 6.0
+    assert predict_makespan([4.0, 1.0, 1.0, 1.0, 1.0], 2) == 4.0
+    assert predict_makespan([], 2) == 0.0
+
+
+def test_index_largest_first(db, local_repo):
+    urls = [local_repo + "/repo1", local_repo + "/repo1_clone", local_repo + "/empty_repo"]
+    assert index_largest_first(urls, "local", 1) == 5
+
+    repo = Repository.objects.get(clone_url=local_repo + "/repo1_clone", repo_type="local")
+    assert repo.commits.count() == 3
+    assert repo.index_duration is not None
+
+
+class _InlineExecutor_:
+    # runs the worker initializer and the tasks in this process, which can see the in memory test database
+    instances: list["_InlineExecutor_"] = []
+
+    def __init__(self, max_workers, mp_context, initializer, initargs):
+        initializer(*initargs)
+        self.initargs, self.submitted = initargs, []
+        self.instances.append(self)
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, *args):
+        pass
+
+    def submit(self, fn, *args):
+        self.submitted.append(args)
+        future = Future()
+        future.set_result(fn(*args))
+        return future
+
+
+def test_index_largest_first_sends_known_shas_once(db, local_repo, mocker, monkeypatch):
+    monkeypatch.setattr(schedule, "_known_shas_", None)
+    mocker.patch.object(schedule, "ProcessPoolExecutor", _InlineExecutor_)
+    mocker.patch.object(schedule, "connections")
+    known_shas = load_known_shas()
+    n_known = len(known_shas)
+
+    urls = [local_repo + "/repo1", local_repo + "/repo1_clone"]
+    assert index_largest_first(urls, "local", 2, known_shas=known_shas) == 5
+    executor = _InlineExecutor_.instances[-1]
+    # the index goes to the worker process once, not with every repository
+    assert executor.initargs == (known_shas,)
+    assert all("known_shas" not in kwargs for _, _, kwargs, _, _ in executor.submitted)
+    assert len(executor.submitted) == 2 and len(known_shas) == n_known + 3
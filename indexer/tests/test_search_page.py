@@ -3,6 +3,10 @@
 
 from urllib.parse import urlencode
 
+import pytest
+
+from indexer.metrics import QueryCounter
+
 
 def test_search_by_hash(client, db):
     sha = "feb3a2837630c0e51447fc1d7e68d86f964a8440"
@@ -29,3 +33,21 @@ def test_search_by_bad_hash(client, db):
     response = client.get(f"/indexer/search?query={sha}")
     assert response.status_code == 200
     assert b"cannot find commit" in response.content
+
+
+@pytest.mark.parametrize(
+    "query, budget",
+    [
+        ("feb3a2837630c0e51447fc1d7e68d86f964a8440", 2),
+        ("mini@me", 3),
+        ("repo", 3),
+        ("no-such-repo", 1),
+    ],
+)
+def test_search_query_budget(client, db, query, budget):
+    # the number of queries must not grow with the number of commits shown
+    with QueryCounter() as queries:
+        response = client.get("/indexer/search", {"query": query})
+    assert response.status_code == 200
+    assert queries.count <= budget
+    assert int(response["X-DB-Queries"]) == queries.count
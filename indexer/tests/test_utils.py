@@ -1,19 +1,29 @@
+import io
 import os
 
 import pytest
+from django.db import DatabaseError
 
 from indexer.utils import (
+    BRANCH_CATEGORIES,
+    ShaIndex,
+    branch_mask,
+    branch_masks_including,
     clone_url2mirror_path,
     display_url,
     enumerate_github_repos,
     enumerate_gitlab_repos,
     enumerate_local_repos,
     gitlab_ts_to_datetime,
+    ignore_patterns,
     match_any,
     normalize_branches,
+    prefetch,
     redact_http_url,
+    set_ignore_patterns,
     should_exclude_from_stats,
     upload_file,
+    upload_stream,
 )
 
 
@@ -84,6 +94,25 @@ def test_ignore_patterns():
     assert not should_exclude_from_stats("vscode/settings.json")
 
 
+def test_configure_ignore_patterns(settings, tmp_path):
+    patterns_file = tmp_path / "ignore_patterns.txt"
+    patterns_file.write_text("# generated code\n^gen/\n\n^build/\n")
+    settings.INDEXER_IGNORE_PATTERNS_FILE = str(patterns_file)
+    try:
+        set_ignore_patterns(None)
+        assert ignore_patterns() == ["^gen/", "^build/"]
+        assert should_exclude_from_stats("gen/api.py")
+        assert not should_exclude_from_stats("vendor/librar/stuff/blah.go")
+
+        set_ignore_patterns([])
+        assert not should_exclude_from_stats("gen/api.py")
+    finally:
+        settings.INDEXER_IGNORE_PATTERNS_FILE = ""
+        set_ignore_patterns(None)
+
+    assert should_exclude_from_stats("vendor/librar/stuff/blah.go")
+
+
 def test_match_any():
     assert match_any("/Users/lee/tmp/shared/bbx/company/bbx-cookiecutter-springboot3.git", "*/bbx/*/bbx*")
     assert not match_any("/Users/lee/tmp/shared/bbx/cookiecutter-springboot3.git", "*/bbx/bbx*")
@@ -141,6 +170,51 @@ def test_normalize_branches():
             "some_random_long_branch_name",
         ]
     )
+    # the result does not depend on the order of branches
+    assert normalize_branches(["origin/develop", "feature/x"]) == normalize_branches(["feature/y", "origin/develop"])
+
+
+def test_prefetch():
+    assert list(prefetch(iter(range(100)), 3)) == list(range(100))
+
+    def failing():
+        yield 1
+        raise ValueError("boom")
+
+    items = prefetch(failing(), 1)
+    assert next(items) == 1
+    with pytest.raises(ValueError):
+        next(items)
+
+    # the producer is stopped when the consumer stops early
+    items = prefetch(iter(range(100)), 1)
+    assert next(items) == 0
+    items.close()
+
+
+def test_sha_index():
+    shas = ["feb3a2837630c0e51447fc1d7e68d86f964a8440", "ee474544052762d314756bb7439d6dab73221d3d", "short"]
+    index = ShaIndex(shas)
+    assert len(index) == 3
+    assert all(sha in index for sha in shas)
+    assert "e2c8b79813b95c93e5b06c5a82e4c417d5020762" not in index
+    assert "not a hash not a hash not a hash not a " not in index
+
+    index.add("e2c8b79813b95c93e5b06c5a82e4c417d5020762")
+    assert "e2c8b79813b95c93e5b06c5a82e4c417d5020762" in index
+    assert "e2c8b79813b95c93e5b06c5a82e4c417d5020762" not in ShaIndex()
+
+
+def test_branch_mask():
+    assert branch_mask("") == 0
+    assert branch_mask("master") == branch_mask("main") == BRANCH_CATEGORIES["main"]
+    assert branch_mask("bugfix,feature,master,release,some_rando") == sum(
+        BRANCH_CATEGORIES[name] for name in ["bugfix", "feature", "main", "release", "other"]
+    )
+
+    masks = branch_masks_including("feature")
+    assert len(masks) == 64
+    assert branch_mask("develop,feature") in masks and branch_mask("develop") not in masks
 
 
 def test_redact_http_url():
@@ -176,3 +250,68 @@ def test_clone_url2mirror_path():
 
     with pytest.raises(ValueError):
         clone_url2mirror_path("ssl://whatever.company/project/repo.git", "/parent_dir")
+
+
+class _FakeBlob_:
+    def __init__(self, bucket, name):
+        self.bucket, self.name = bucket, name
+
+    def open(self, mode, chunk_size=None, ignore_flush=None):  # noqa: A003
+        assert mode == "wb" and chunk_size % (256 * 1024) == 0 and ignore_flush
+        return _FakeWriter_(self.bucket.blobs, self.name)
+
+    def delete(self):
+        del self.bucket.blobs[self.name]
+
+
+class _FakeWriter_(io.BytesIO):
+    # like BlobWriter, closing completes the upload even when leaving the block with an exception
+    def __init__(self, blobs, name):
+        super().__init__()
+        self.blobs, self.name = blobs, name
+
+    def close(self):
+        self.blobs[self.name] = self.getvalue()
+        super().close()
+
+
+class _FakeBucket_:
+    name = "fake"
+
+    def __init__(self):
+        self.blobs = {}
+
+    def blob(self, name):
+        return _FakeBlob_(self, name)
+
+    def rename_blob(self, blob, new_name):
+        self.blobs[new_name] = self.blobs.pop(blob.name)
+
+
+def test_upload_stream():
+    bucket = _FakeBucket_()
+
+    def write(out):
+        out.write(b"a,b\n1,2\n")
+        return 1
+
+    assert upload_stream("data.csv", write, bucket=bucket)
+    assert bucket.blobs == {"data.csv": b"a,b\n1,2\n"}
+
+
+def test_upload_stream_failed():
+    bucket = _FakeBucket_()
+
+    def write(out):
+        out.write(b"a,b\n")
+        raise DatabaseError("connection lost")
+
+    # nothing truncated is left in the bucket, the error is raised to the caller
+    with pytest.raises(DatabaseError):
+        upload_stream("data.csv", write, bucket=bucket)
+    assert bucket.blobs == {}
+
+
+@pytest.mark.skipif(os.environ.get("STORAGE_EMULATOR_HOST") is None, reason="fake storage server not running")
+def test_upload_stream_to_emulator():
+    assert upload_stream("test_file.temp", lambda out: out.write(b"uploaded in chunks\n") and 1)
@@ -0,0 +1,81 @@
+import hashlib
+import hmac
+import os
+
+import pytest
+
+from indexer.models import IndexJob, Repository
+
+_SECRET_ = "webhook-secret"
+
+
+@pytest.fixture
+def webhook_secret(settings):
+    settings.INDEXER_WEBHOOK_SECRET = _SECRET_
+    settings.INDEXER_WEBHOOK_DEBOUNCE = 60
+    return _SECRET_
+
+
+def _payload_(name: str) -> bytes:
+    with open(os.path.join(os.path.dirname(__file__), f"../../test_data/webhooks/{name}.json"), "rb") as f:
+        return f.read()
+
+
+def _post_gitlab_(client, name, event, token=_SECRET_):
+    return client.post(
+        "/indexer/webhook/gitlab",
+        _payload_(name),
+        content_type="application/json",
+        HTTP_X_GITLAB_EVENT=event,
+        HTTP_X_GITLAB_TOKEN=token,
+    )
+
+
+def _post_github_(client, name, event, secret=_SECRET_):
+    body = _payload_(name)
+    signature = "sha256=" + hmac.new(secret.encode(), body, hashlib.sha256).hexdigest()
+    return client.post(
+        "/indexer/webhook/github",
+        body,
+        content_type="application/json",
+        HTTP_X_GITHUB_EVENT=event,
+        HTTP_X_HUB_SIGNATURE_256=signature,
+    )
+
+
+def test_gitlab_push(client, db, webhook_secret):
+    response = _post_gitlab_(client, "gitlab_push", "Push Hook")
+    assert response.status_code == 202
+
+    job = IndexJob.objects.get(id=response.json()["job"])
+    assert job.kind == "commits" and job.status == "pending"
+    assert job.repo.clone_url == "https://gitlab.com/dummy/repo.git"
+
+    # a burst of pushes is indexed once
+    assert _post_gitlab_(client, "gitlab_push", "Push Hook").json()["job"] == job.id
+    assert IndexJob.objects.count() == 1
+
+
+def test_gitlab_merge_request_for_new_repo(client, db, webhook_secret):
+    response = _post_gitlab_(client, "gitlab_merge_request", "Merge Request Hook")
+    assert response.status_code == 202
+    assert response.json()["kind"] == "merge_requests"
+    assert Repository.objects.filter(clone_url="https://gitlab.com/dummy/new-project.git", repo_type="gitlab").exists()
+
+
+def test_github_events(client, db, webhook_secret):
+    assert _post_github_(client, "github_push", "push").json()["kind"] == "commits"
+    assert _post_github_(client, "github_pull_request", "pull_request").json()["kind"] == "merge_requests"
+    assert _post_github_(client, "github_push", "ping").status_code == 204
+    assert IndexJob.objects.filter(repo__clone_url="https://github.com/super/repo.git").count() == 2
+
+
+def test_invalid_secret(client, db, webhook_secret, settings):
+    assert _post_gitlab_(client, "gitlab_push", "Push Hook", token="wrong").status_code == 403
+    assert _post_github_(client, "github_push", "push", secret="wrong").status_code == 403
+    assert client.get("/indexer/webhook/gitlab").status_code == 405
+
+    # webhooks are disabled without a secret
+    settings.INDEXER_WEBHOOK_SECRET = ""
+    assert _post_gitlab_(client, "gitlab_push", "Push Hook", token="").status_code == 403
+    assert not IndexJob.objects.exists()
@@ -2,16 +2,31 @@ import os
 import random
 import string
 from datetime import datetime
+from types import SimpleNamespace
 
 import git
 import pytest
 from django.utils.timezone import make_aware
 
-from indexer.models import Repository, RepositoryCommitLink, ensure_repository
+from indexer import worker
+from indexer.extract import ExtractOptions, commit_record, traverse
+from indexer.metrics import IndexMetrics
+from indexer.models import (
+    Commit,
+    CommittedFile,
+    Repository,
+    RepositoryCommitLink,
+    ensure_repository,
+)
+from indexer.utils import branch_masks_including, ignore_patterns, set_ignore_patterns
 from indexer.worker import (
+    analyze_stats_only_commits,
     index_commits,
     index_github_pull_requests,
     index_gitlab_merge_requests,
+    load_known_shas,
+    reclassify_committed_files,
+    update_commit_stats,
 )
 
 
@@ -98,6 +113,142 @@ def test_index_local_repo(db, local_repo):
     assert rows_after - rows_before == 5 + n_new_commits
 
 
+def test_index_local_repo_in_parallel(db, local_repo):
+    repo1_clone = local_repo + "/repo1_clone"
+    assert index_commits(repo1_clone, "local", n_workers=2) == 3
+
+    repo = ensure_repository(repo1_clone, "local")
+    commits = repo.commits.all()
+    assert len(commits) == 3
+    assert all(commit.author_id for commit in commits)
+    assert repo.commits.filter(branch_mask__in=branch_masks_including("main")).count() == 2
+    assert sum(len(commit.files.all()) for commit in commits) > 0
+
+    # commits already linked to the repo are not indexed again
+    assert index_commits(repo1_clone, "local", n_workers=2) == 0
+
+
+def test_index_local_repo_pipelined(db, local_repo):
+    repo1 = local_repo + "/repo1"
+    assert index_commits(repo1, "local") == 2
+
+    # commits shared with repo1 are linked, not created again
+    repo1_clone = local_repo + "/repo1_clone"
+    assert index_commits(repo1_clone, "local", queue_size=2) == 3
+    assert len(repo_hashes(repo1_clone)) == 3
+    assert CommittedFile.objects.filter(commit__sha__in=repo_hashes(repo1)).count() == 5
+
+
+def test_index_local_repo_with_known_shas(db, local_repo, mocker):
+    repo1 = local_repo + "/repo1"
+    assert index_commits(repo1, "local") == 2
+
+    # commits found in the index are linked without extracting them again
+    known_shas = load_known_shas()
+    extract = mocker.spy(worker, "commit_record")
+    repo1_clone = local_repo + "/repo1_clone"
+    assert index_commits(repo1_clone, "local", known_shas=known_shas) == 3
+    assert extract.call_count == 1
+    assert len(repo_hashes(repo1_clone)) == 3
+    assert all(sha in known_shas for sha in repo_hashes(repo1_clone))
+
+
+def test_index_local_repo_without_known_shas(db, local_repo, mocker):
+    repo1 = local_repo + "/repo1"
+    assert index_commits(repo1, "local") == 2
+
+    # only the commits of the repository are looked up, the hashes of all commits are not loaded
+    load = mocker.spy(worker, "load_known_shas")
+    extract = mocker.spy(worker, "commit_record")
+    repo1_clone = local_repo + "/repo1_clone"
+    assert index_commits(repo1_clone, "local") == 3
+    assert load.call_count == 0
+    assert extract.call_count == 1
+    assert len(repo_hashes(repo1_clone)) == 3
+
+
+def test_index_stats_only_commits(db, vendor_repo):
+    assert index_commits(vendor_repo, "local", options=ExtractOptions(max_files=2)) == 2
+
+    repo = ensure_repository(vendor_repo, "local")
+    assert repo.commits.filter(is_stats_only=True).count() == 2
+    assert not CommittedFile.objects.filter(commit__repos=repo, n_methods__gt=0).exists()
+
+    # full analysis replaces the files of stats only commits
+    assert analyze_stats_only_commits(vendor_repo, "local") == 2
+    assert repo.commits.filter(is_stats_only=True).count() == 0
+    assert CommittedFile.objects.filter(commit__repos=repo).count() == 6
+    assert CommittedFile.objects.filter(commit__repos=repo, n_methods__gt=0).exists()
+
+
+def test_analyze_stats_only_commits_error(db, vendor_repo, mocker):
+    assert index_commits(vendor_repo, "local", options=ExtractOptions(max_files=2)) == 2
+
+    # an error is reported like when indexing, the commit is left for the next run
+    mocker.patch.object(worker, "extract_chunk", side_effect=ValueError("bad commit"))
+    assert analyze_stats_only_commits(vendor_repo, "local") == 0
+    assert ensure_repository(vendor_repo, "local").commits.filter(is_stats_only=True).count() == 2
+
+
+def test_index_branch_updates(db, local_repo):
+    repo1 = local_repo + "/repo1"
+    assert index_commits(repo1, "local") == 2
+
+    repo = ensure_repository(repo1, "local")
+    branches = list(repo.commits.order_by("sha").values_list("sha", "branches", "branch_mask"))
+    repo.commits.all().update(branches="stale", branch_mask=-1)
+
+    # only the branches are updated for commits seen before
+    assert index_commits(repo1, "local", index_all=True) == 2
+    assert list(repo.commits.order_by("sha").values_list("sha", "branches", "branch_mask")) == branches
+
+
+def test_new_commit_inserted_once(db, vendor_repo):
+    git_commit = next(traverse(vendor_repo, datetime.min))
+    record = commit_record(git_commit)
+
+    # a commit inserted by another process is not duplicated
+    commit = worker._new_commit_(record)
+    assert worker._new_commit_(record) == commit
+    assert commit.files.count() == 3
+
+
+def test_overlapping_index_runs_link_once(db, local_repo, mocker):
+    repo1 = local_repo + "/repo1"
+    assert index_commits(repo1, "local") == 2
+    n_links = RepositoryCommitLink.objects.count()
+
+    # a run that loaded the commits of the repository before the first one linked them
+    mocker.patch.object(Repository, "commits", SimpleNamespace(all=lambda: []))
+    metrics = IndexMetrics("index_commits", repo1)
+    assert index_commits(repo1, "local", index_all=True, metrics=metrics) == 2
+    assert metrics.outcome == "ok"
+    assert RepositoryCommitLink.objects.count() == n_links
+
+
+def test_reclassify_committed_files(db):
+    update_commit_stats()
+    commit = Commit.objects.get(sha="feb3a2837630c0e51447fc1d7e68d86f964a8440")
+    assert commit.n_files_ignored == 0 and commit.n_files_changed == 3
+
+    try:
+        set_ignore_patterns(ignore_patterns() + ["^README"])
+        assert reclassify_committed_files(batch_size=2, dry_run=True) == (4, 1, 1)
+        assert not CommittedFile.objects.filter(is_superfluous=True).exists()
+
+        assert reclassify_committed_files(batch_size=2) == (4, 1, 1)
+        readme = CommittedFile.objects.get(file_path="README.md")
+        assert readme.is_superfluous and readme.is_on_exclude_list
+        commit.refresh_from_db()
+        assert commit.n_files_ignored == 1 and commit.n_files_changed == 2
+    finally:
+        set_ignore_patterns(None)
+
+    # applying the same patterns again changes nothing
+    assert reclassify_committed_files()[1:] == (1, 1)
+    assert reclassify_committed_files()[1:] == (0, 0)
+
+
 def repo_hashes(repo_url):
     repo = Repository.objects.get(clone_url=repo_url, repo_type="local")
     hashes = [c.sha for c in repo.commits.all()]
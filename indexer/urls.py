@@ -1,10 +1,15 @@
 from django.urls import path
 
-from . import views
+from . import api, views, webhooks
 
 app_name = "indexer"
 
 urlpatterns = [
     path("", views.index, name=""),
     path("search", views.search, name="search"),
+    path("webhook/<str:source>", webhooks.webhook, name="webhook"),
+    path("api/commits", api.commits, name="api_commits"),
+    path("api/files", api.files, name="api_files"),
+    path("api/merge_requests", api.merge_requests, name="api_merge_requests"),
+    path("api/rollups", api.rollups, name="api_rollups"),
 ]
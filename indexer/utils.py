@@ -1,31 +1,86 @@
 import fnmatch
 import os
+import queue
 import re
+import resource
 import sys
+import threading
 import warnings
+from bisect import bisect_left
 from datetime import datetime, timezone
-from typing import Any, Iterator, List, Optional, Tuple
+from functools import lru_cache
+from typing import (
+    Any,
+    BinaryIO,
+    Callable,
+    Generator,
+    Iterable,
+    Iterator,
+    List,
+    Optional,
+    Tuple,
+    TypeVar,
+)
 
 import gitlab
 import psutil
+from django.core.exceptions import ImproperlyConfigured
 from git import InvalidGitRepositoryError
 from github import Auth, BadCredentialsException, Github
 from pydriller.git import Git
 
 # files matches any of the regex will not be counted
-# towards commit stats
+# towards commit stats. can be replaced with settings.INDEXER_IGNORE_PATTERNS
+# or a file with one regex per line in settings.INDEXER_IGNORE_PATTERNS_FILE
 _IGNORE_PATTERNS_ = [
-    re.compile(
-        "^(vendor|Pods|target|YoutuOCWrapper|vos-app-protection|vos-processor|\\.idea|\\.vscode)/."  # noqa: E501
-    ),
-    re.compile("^[a-zA-Z0-9_]*?/Pods/"),
-    re.compile("^.*(xcodeproj|xcworkspace)/."),
-    re.compile(r".*\.(jar|pbxproj|lock|bk|bak|backup|class|swp|sum|pdf|png)$"),
-    re.compile(r"^.*/?package-lock\.json$"),
-    re.compile(r"^.*/?(\.next|node_modules|\.devcontainer)(/|$).*"),
-    re.compile(r"(^|.*/)_.*\.(js|scss)$"),
+    "^(vendor|Pods|target|YoutuOCWrapper|vos-app-protection|vos-processor|\\.idea|\\.vscode)/.",  # noqa: E501
+    "^[a-zA-Z0-9_]*?/Pods/",
+    "^.*(xcodeproj|xcworkspace)/.",
+    r".*\.(jar|pbxproj|lock|bk|bak|backup|class|swp|sum|pdf|png)$",
+    r"^.*/?package-lock\.json$",
+    r"^.*/?(\.next|node_modules|\.devcontainer)(/|$).*",
+    r"(^|.*/)_.*\.(js|scss)$",
 ]
 
+# the same paths appear in thousands of commits
+_IGNORE_CACHE_SIZE_ = 65536
+
+# bit flags for the kind of branches a commit is on, stored in Commit.branch_mask
+BRANCH_CATEGORIES = {
+    "main": 1,
+    "develop": 2,
+    "feature": 4,
+    "bugfix": 8,
+    "hotfix": 16,
+    "release": 32,
+    "other": 64,
+}
+_ALL_BRANCH_CATEGORIES_ = 127
+_BRANCH_ALIASES_ = {
+    "master": "main",
+    "dev": "develop",
+    "feat": "feature",
+    "features": "feature",
+    "fix": "bugfix",
+    "bug": "bugfix",
+    "releases": "release",
+}
+_BRANCHES_CACHE_SIZE_ = 4096
+# a multiple of 256 KB, the memory used by an upload is about one chunk
+_UPLOAD_CHUNK_SIZE_ = 8 * 1024 * 1024
+# appended to the name of an upload in progress, renamed when it is complete
+_PARTIAL_SUFFIX_ = ".partial"
+
+T = TypeVar("T")
+
+
+class _Raised:
+    def __init__(self, exc: BaseException) -> None:
+        self.exc = exc
+
+
+_END_ = object()
+
 
 def timestamp() -> str:
     return datetime.now().isoformat()[:19]
@@ -36,6 +91,13 @@ def rss() -> int:
     return int(meminfo().rss / 1024 / 1024)
 
 
+def peak_rss() -> int:
+    """return the peak rss memory usage of this process in MB"""
+    peak = resource.getrusage(resource.RUSAGE_SELF).ru_maxrss
+    # bytes on macOS, KB elsewhere
+    return int(peak / 1024 / 1024) if sys.platform == "darwin" else int(peak / 1024)
+
+
 def meminfo():
     pid = os.getpid()
     proc = psutil.Process(pid)
@@ -63,10 +125,62 @@ def should_exclude_from_stats(path: str) -> bool:
     return true if the path should be ignore
     for calculating commit stats
     """
-    for regex in _IGNORE_PATTERNS_:
-        if regex.match(path):
-            return True
-    return False
+    return _is_ignored_(path)
+
+
+def ignore_patterns() -> List[str]:
+    """the regular expressions used by should_exclude_from_stats"""
+    return _ignore_matcher_().pattern_list
+
+
+def set_ignore_patterns(patterns: Optional[List[str]]) -> None:
+    """replace the ignore patterns, None to load them from settings again"""
+    global _ignore_matcher_instance_
+    _ignore_matcher_instance_ = _IgnoreMatcher(patterns) if patterns is not None else None
+    _is_ignored_.cache_clear()
+
+
+class _IgnoreMatcher:
+    """all ignore patterns compiled into a single regex, so that a path is scanned once"""
+
+    def __init__(self, patterns: List[str]) -> None:
+        self.pattern_list = list(patterns)
+        # never matches when there is no pattern
+        combined = "|".join(f"(?:{pattern})" for pattern in patterns) or "(?!)"
+        self.regex = re.compile(combined)
+
+
+_ignore_matcher_instance_: Optional[_IgnoreMatcher] = None
+
+
+def _ignore_matcher_() -> _IgnoreMatcher:
+    global _ignore_matcher_instance_
+    if _ignore_matcher_instance_ is None:
+        _ignore_matcher_instance_ = _IgnoreMatcher(_load_ignore_patterns_())
+    return _ignore_matcher_instance_
+
+
+def _load_ignore_patterns_() -> List[str]:
+    try:
+        from django.conf import settings
+
+        patterns = getattr(settings, "INDEXER_IGNORE_PATTERNS", None)
+        patterns_file = getattr(settings, "INDEXER_IGNORE_PATTERNS_FILE", "")
+    except ImproperlyConfigured:
+        # used outside of django, e.g. in a benchmark script
+        patterns, patterns_file = None, ""
+
+    if patterns_file:
+        with open(patterns_file, "r") as f:
+            lines = [line.strip() for line in f.readlines()]
+            patterns = [line for line in lines if line and not line.startswith("#")]
+
+    return list(patterns) if patterns is not None else _IGNORE_PATTERNS_
+
+
+@lru_cache(maxsize=_IGNORE_CACHE_SIZE_)
+def _is_ignored_(path: str) -> bool:
+    return _ignore_matcher_().regex.match(path) is not None
 
 
 def enumerate_local_repos(base_dir: str) -> Iterator[Tuple[str, Any]]:
@@ -136,6 +250,56 @@ def display_url(clone_url: str, max_length: int = 64) -> str:
 
 
 def upload_file(source_file: str, destination: str) -> bool:
+    bucket = _gcs_bucket_()
+    if bucket is None:
+        return False
+
+    try:
+        blob = bucket.blob(destination)
+        blob.upload_from_filename(source_file)
+
+        stats = os.stat(source_file)
+        log(f"uploaded {source_file} to gs://{bucket.name}/{destination}, size {int(stats.st_size/1048576)} MB")
+        return True
+    except Exception as e:
+        print(f"Failed to upload {source_file} to gs://{bucket.name}/{destination}: {e}")
+        return False
+
+
+def upload_stream(destination: str, write: Callable[[BinaryIO], int], bucket: Any = None) -> bool:
+    """
+    upload what write writes to the binary stream it is given, in chunks of a resumable upload,
+    so that neither a local file nor the whole content in memory is needed. write returns the
+    number of rows written. set STORAGE_EMULATOR_HOST to upload to a local fake server.
+
+    returns False when uploading is not configured. when the upload fails, the exception is
+    raised and nothing is written to destination: the content is uploaded to a temporary
+    object, which is only renamed to destination once write has succeeded.
+    """
+    if bucket is None:
+        bucket = _gcs_bucket_()
+        if bucket is None:
+            return False
+
+    # closing the stream completes the upload even when write failed half way
+    blob = bucket.blob(f"{destination}{_PARTIAL_SUFFIX_}")
+    try:
+        with blob.open("wb", chunk_size=_UPLOAD_CHUNK_SIZE_, ignore_flush=True) as out:
+            n_rows = write(out)
+        bucket.rename_blob(blob, destination)
+    except Exception as e:
+        print(f"Failed to upload to gs://{bucket.name}/{destination}: {e}")
+        try:
+            blob.delete()
+        except Exception:
+            pass
+        raise
+
+    log(f"uploaded {n_rows} rows to gs://{bucket.name}/{destination}")
+    return True
+
+
+def _gcs_bucket_() -> Any:
     with warnings.catch_warnings():
         # google cloud uses deprecated apis
         # suppress the warning locally
@@ -143,26 +307,19 @@ def upload_file(source_file: str, destination: str) -> bool:
         from google.cloud import storage  # type: ignore [attr-defined] # noqa: E402
 
     # env variable GOOGLE_APPLICATION_CREDENTIALS must be point to
-    # a service account json file
-    if os.environ.get("GOOGLE_APPLICATION_CREDENTIALS") is None:
-        return False
+    # a service account json file, a fake server needs no credentials
+    if os.environ.get("GOOGLE_APPLICATION_CREDENTIALS") is None and os.environ.get("STORAGE_EMULATOR_HOST") is None:
+        return None
 
     bucket_name = os.environ.get("GS_BUCKET_NAME", "vinolab")
     try:
-        storage_client = storage.Client()
-        bucket = storage_client.bucket(bucket_name)
-        blob = bucket.blob(destination)
-        blob.upload_from_filename(source_file)
-
-        stats = os.stat(source_file)
-        log(f"uploaded {source_file} to gs://{bucket_name}/{destination}, size {int(stats.st_size/1048576)} MB")
-        return True
+        return storage.Client().bucket(bucket_name)
     except Exception as e:
-        print(f"Failed to upload {source_file} to gs://{bucket_name}/{destination}: {e}")
-        return False
+        print(f"Failed to connect to gs://{bucket_name}: {e}")
+        return None
 
 
-def normalize_branches(branches: List[str]) -> str:
+def normalize_branches(branches: Iterable[str]) -> str:
     """
     normalize list of branch names into a string with comma sperated branches names
     branch names will be shorted by the following logic:
@@ -171,6 +328,12 @@ def normalize_branches(branches: List[str]) -> str:
     the main purpose of this function is to determine is the type of branches a commit is one,
     e.g. main, master, develop, feature, bugfix, etc.
     """
+    # most commits are on the same few sets of branches, the result does not depend on the order
+    return _normalize_branches_(frozenset(branches))
+
+
+@lru_cache(maxsize=_BRANCHES_CACHE_SIZE_)
+def _normalize_branches_(branches: frozenset[str]) -> str:
     tmp = {}
     for branch in branches:
         if "->" in branch:
@@ -182,6 +345,29 @@ def normalize_branches(branches: List[str]) -> str:
     return ",".join(keys)[:1024]
 
 
+def branch_mask(branches: str) -> int:
+    """
+    convert the output of normalize_branches to a bitmask of BRANCH_CATEGORIES,
+    e.g. "develop,feature" => BRANCH_CATEGORIES["develop"] | BRANCH_CATEGORIES["feature"]
+    """
+    mask = 0
+    for name in branches.split(","):
+        name = name.strip().lower()
+        if name:
+            name = _BRANCH_ALIASES_.get(name, name)
+            mask |= BRANCH_CATEGORIES.get(name, BRANCH_CATEGORIES["other"])
+    return mask
+
+
+def branch_masks_including(category: str) -> List[int]:
+    """
+    all the bitmask values that include the category, so that filtering on a branch category
+    can use the index on Commit.branch_mask, e.g. Commit.objects.filter(branch_mask__in=...)
+    """
+    bit = BRANCH_CATEGORIES[category]
+    return [mask for mask in range(1, _ALL_BRANCH_CATEGORIES_ + 1) if mask & bit]
+
+
 def redact_http_url(url: str) -> str:
     return re.sub(r"(?<=://)[^/]*@", "", url)
 
@@ -214,3 +400,92 @@ def clone_url2mirror_path(clone_url: str, dest_path: str) -> tuple[str, str]:
     repo_dir = os.path.basename(path)
 
     return parent_path, repo_dir
+
+
+def prefetch(iterator: Iterator[T], maxsize: int) -> Generator[T, None, None]:
+    """
+    run the iterator in a background thread and yield its items through a bounded queue,
+    so that producing the next items overlaps with consuming the current one.
+    the producer blocks when maxsize items are waiting to be consumed.
+    exceptions raised by the iterator are re-raised to the consumer.
+    """
+    items: queue.Queue = queue.Queue(maxsize=maxsize)
+    stop = threading.Event()
+
+    def put(item: Any) -> bool:
+        while not stop.is_set():
+            try:
+                items.put(item, timeout=0.1)
+                return True
+            except queue.Full:
+                continue
+        return False
+
+    def produce() -> None:
+        try:
+            for item in iterator:
+                if not put(item):
+                    return
+            put(_END_)
+        except BaseException as e:
+            put(_Raised(e))
+
+    producer = threading.Thread(target=produce, daemon=True)
+    producer.start()
+    try:
+        while True:
+            item = items.get()
+            if item is _END_:
+                return
+            if isinstance(item, _Raised):
+                raise item.exc
+            yield item
+    finally:
+        # tell the producer to stop when the consumer is done early
+        stop.set()
+        producer.join()
+
+
+class ShaIndex:
+    """
+    compact set of commit hashes.
+
+    hashes are stored as 20 bytes binary digests in one sorted bytes object and searched
+    by bisection, which takes about 20 bytes per commit instead of around 100 bytes in a
+    set of strings. hashes added after the index is built are kept in a small set.
+    """
+
+    _DIGEST_SIZE_ = 20
+
+    def __init__(self, shas: Iterable[str] = ()) -> None:
+        digests, others = [], set()
+        for sha in shas:
+            if len(sha) == self._DIGEST_SIZE_ * 2:
+                digests.append(bytes.fromhex(sha))
+            else:
+                others.add(sha)
+        digests.sort()
+        self._digests = b"".join(digests)
+        self._size = len(digests)
+        self._added = others
+
+    def __len__(self) -> int:
+        return self._size + len(self._added)
+
+    def __contains__(self, sha: object) -> bool:
+        if sha in self._added:
+            return True
+        if not isinstance(sha, str) or len(sha) != self._DIGEST_SIZE_ * 2:
+            return False
+        try:
+            digest = bytes.fromhex(sha)
+        except ValueError:
+            return False
+        pos = bisect_left(range(self._size), digest, key=self._digest_at)
+        return pos < self._size and self._digest_at(pos) == digest
+
+    def add(self, sha: str) -> None:
+        self._added.add(sha)
+
+    def _digest_at(self, pos: int) -> bytes:
+        return self._digests[pos * self._DIGEST_SIZE_ : (pos + 1) * self._DIGEST_SIZE_]
@@ -25,7 +25,7 @@ def search(request: HttpRequest) -> HttpResponse:
 
     if query and len(query) == 40 and re.match(r"[0-9a-f]{40}", query):
         try:
-            commits = [Commit.objects.get(sha=query)]
+            commits = [Commit.objects.prefetch_related("repos").get(sha=query)]
         except Commit.DoesNotExist:
             message = f"cannot find commit {query}"
 
@@ -61,4 +61,5 @@ def index(request: HttpRequest) -> HttpResponse:
 
 
 def _commits_by_filter_(kwargs: dict[str, Any]) -> Iterable[Commit]:
-    return Commit.objects.filter(**kwargs).order_by("-n_lines_changed")[:_PAGE_SIZE_]
+    # the template shows the first repository of every commit
+    return Commit.objects.filter(**kwargs).prefetch_related("repos").order_by("-n_lines_changed")[:_PAGE_SIZE_]
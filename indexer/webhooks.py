@@ -0,0 +1,76 @@
+import hashlib
+import hmac
+import json
+from typing import Optional
+
+from django.conf import settings
+from django.http import HttpRequest, HttpResponse, JsonResponse
+from django.views.decorators.csrf import csrf_exempt
+from django.views.decorators.http import require_POST
+
+from indexer.jobs import schedule_job
+from indexer.models import Repository, ensure_repository
+from indexer.utils import redact_http_url
+
+# event header value => kind of index job
+_GITLAB_EVENTS_ = {"Push Hook": "commits", "Merge Request Hook": "merge_requests"}
+_GITHUB_EVENTS_ = {"push": "commits", "pull_request": "merge_requests"}
+
+
+@csrf_exempt
+@require_POST
+def webhook(request: HttpRequest, source: str) -> HttpResponse:
+    """
+    receive push and merge request events from gitlab or github, then queue an
+    index job for the repository. the job is run by the worker command.
+    """
+    secret = settings.INDEXER_WEBHOOK_SECRET
+    if not secret:
+        return HttpResponse("webhook secret not configured", status=403)
+
+    if source == "gitlab":
+        verified = hmac.compare_digest(request.headers.get("X-Gitlab-Token", ""), secret)
+        kind = _GITLAB_EVENTS_.get(request.headers.get("X-Gitlab-Event", ""))
+    elif source == "github":
+        verified = _verify_github_signature_(request, secret)
+        kind = _GITHUB_EVENTS_.get(request.headers.get("X-GitHub-Event", ""))
+    else:
+        return HttpResponse(f"unknown source {source}", status=404)
+
+    if not verified:
+        return HttpResponse("invalid secret", status=403)
+
+    if kind is None:
+        # ping and other events we're not interested in
+        return HttpResponse(status=204)
+
+    try:
+        payload = json.loads(request.body)
+    except ValueError:
+        return HttpResponse("invalid payload", status=400)
+
+    clone_url = _clone_url_(source, payload)
+    if not clone_url:
+        return HttpResponse("repository not found in payload", status=400)
+
+    repo = Repository.objects.filter(clone_url=redact_http_url(clone_url)).first()
+    if repo is None:
+        repo = ensure_repository(clone_url, source)
+    if not repo.is_active:
+        return HttpResponse(status=204)
+
+    job = schedule_job(repo, kind, settings.INDEXER_WEBHOOK_DEBOUNCE)
+    return JsonResponse({"job": job.id, "kind": kind, "not_before": job.not_before}, status=202)
+
+
+def _verify_github_signature_(request: HttpRequest, secret: str) -> bool:
+    signature = request.headers.get("X-Hub-Signature-256", "")
+    expected = "sha256=" + hmac.new(secret.encode(), request.body, hashlib.sha256).hexdigest()
+    return hmac.compare_digest(signature, expected)
+
+
+def _clone_url_(source: str, payload: dict) -> Optional[str]:
+    if source == "gitlab":
+        return payload.get("project", {}).get("git_http_url")
+    else:
+        return payload.get("repository", {}).get("clone_url")
@@ -1,28 +1,79 @@
 import csv
+import gzip
+import io
+import multiprocessing
 import traceback
+from concurrent.futures import ProcessPoolExecutor, as_completed
+from contextlib import ExitStack
 from datetime import datetime, timezone
+from typing import (
+    IO,
+    Any,
+    BinaryIO,
+    Callable,
+    Generator,
+    Iterable,
+    Optional,
+    Sequence,
+    cast,
+)
 
-from django.db import DatabaseError, connection
+from django.conf import settings
+from django.db import DatabaseError, IntegrityError, connection, transaction
+from django.db.models import Q
 from django.utils.timezone import is_aware, make_aware
 from git.exc import GitCommandError
 from github import Repository
 from gitlab.v4.objects import projects
-from pydriller import Repository as PyDrillerRepository
-from pydriller.domain.commit import Commit as PyDrillerCommit
 
-from .models import Author, Commit, CommittedFile, MergeRequest, ensure_repository
-from .sql import QUERY_SQL, STATS_SQL
+from .extract import (
+    CommitRecord,
+    ExtractOptions,
+    FileRecord,
+    commit_record,
+    extract_chunk,
+    local_clone,
+    partition,
+    traverse,
+)
+from .metrics import IndexMetrics
+from .models import (
+    Author,
+    Commit,
+    CommittedFile,
+    MergeRequest,
+    RepositoryCommitLink,
+    ensure_repository,
+)
+from .rollups import refresh_rollups
+from .sql import (
+    COMMIT_STATS_SQL,
+    MATERIALIZE_SQL,
+    PARTITION_SQL,
+    QUERY_SQL,
+    REFRESH_COMMIT_DATA_SQL,
+    STATS_SQL,
+    UNMATERIALIZED_SHAS_SQL,
+)
 from .utils import (
+    ShaIndex,
+    branch_mask,
     display_url,
     gitlab_ts_to_datetime,
     log,
-    normalize_branches,
+    prefetch,
     redact_http_url,
     should_exclude_from_stats,
 )
 
 GITLAB_TIMETSAMP_FORMAT = "%Y-%m-%dT%H:%M:%S.%fZ"
 
+_LINK_BATCH_SIZE_ = 500
+_FILE_BATCH_SIZE_ = 1000
+_STATS_BATCH_SIZE_ = 500
+_BRANCH_BATCH_SIZE_ = 500
+_EXPORT_BATCH_SIZE_ = 5000
+
 #
 # notes about timezone handling
 #
@@ -36,227 +87,497 @@ GITLAB_TIMETSAMP_FORMAT = "%Y-%m-%dT%H:%M:%S.%fZ"
 
 
 def index_commits(
-    clone_url: str, git_repo_type: str = "", show_progress: bool = False, index_all: bool = False, timeout: int = 28800
+    clone_url: str,
+    git_repo_type: str = "",
+    show_progress: bool = False,
+    index_all: bool = False,
+    timeout: int = 28800,
+    n_workers: int = 1,
+    queue_size: int = 0,
+    known_shas: Optional[ShaIndex] = None,
+    options: Optional[ExtractOptions] = None,
+    metrics: Optional[IndexMetrics] = None,
 ) -> int:
-    n_branch_updates, n_new_commits = 0, 0
-    log_url = display_url(redact_http_url(clone_url))
+    """
+    index commits of a repository into the database.
 
-    try:
-        repo = ensure_repository(clone_url, git_repo_type)
-        if repo is None:
-            log(f"### cannot create repostitory object for {log_url}")
-            return 0
+    when n_workers > 1, the commits are split into chunks that are extracted in parallel
+    by worker processes, while this process remains the single writer to the database.
 
-        if repo.is_active is False:
-            log(f"### skipping inactive repository {log_url}")
-            return 0
+    otherwise, when queue_size > 0, commits are extracted by a background thread that runs
+    ahead of the database writes by up to queue_size commits.
 
-        log(f"starting to index {log_url}")
-        start_t = datetime.now()
+    known_shas holds the hashes of all commits in the database. commits found in it are
+    linked to the repository without extracting them again. when indexing many repositories,
+    load it once with load_known_shas() and pass it to every call. without it, only the
+    commits of this repository are looked up in the database, in batches.
 
-        # use list comprehension to force loading of commits
-        old_commits = {}
-        for commit in repo.commits.all():
-            old_commits[commit.sha] = commit
+    options controls how much of each commit is extracted, see ExtractOptions.
 
-        if repo.last_commit_at and not index_all:
-            index_since = repo.last_commit_at
-        else:
-            index_since = datetime.min
-
-        for git_commit in PyDrillerRepository(
-            clone_url,
-            include_refs=True,
-            include_remotes=True,
-            since=index_since,
-        ).traverse_commits():
-            # impose some timeout to avoid spending tons of time on very large repositories
-            if (datetime.now() - start_t).seconds > timeout:  # pragma: no cover
-                print(f"### indexing not done after {timeout} seconds, aborting {log_url}")
-                break
+    the time spent in each phase and the counters are collected in metrics, which are
+    logged as a json line at the end.
+    """
+    n_branch_updates, n_new_commits = 0, 0
+    log_url = display_url(redact_http_url(clone_url))
+    if metrics is None:
+        metrics = IndexMetrics("index_commits", redact_http_url(clone_url))
 
-            if git_commit.hash in old_commits:
-                # we've seen this commit before, just compare branches and update
-                # if needed
-                commit = old_commits[git_commit.hash]
-                new_branches = normalize_branches(git_commit.branches)
-                if new_branches != commit.branches:
-                    commit.branches = new_branches
-                    commit.save()
-                    n_branch_updates += 1
+    with metrics.running(), ExitStack() as clones:
+        try:
+            repo = ensure_repository(clone_url, git_repo_type)
+            if repo is None:
+                log(f"### cannot create repostitory object for {log_url}")
+                return 0
+            metrics.repo_id = repo.id
+
+            if repo.is_active is False:
+                log(f"### skipping inactive repository {log_url}")
+                metrics.outcome = "inactive"
+                return 0
+
+            log(f"starting to index {log_url}")
+            start_t = datetime.now()
+
+            with metrics.phase("load"):
+                # use list comprehension to force loading of commits
+                old_commits = {}
+                for commit in repo.commits.all():
+                    old_commits[commit.sha] = commit
+
+                if repo.last_commit_at and not index_all:
+                    index_since = repo.last_commit_at
+                else:
+                    index_since = datetime.min
+
+                if known_shas is None:
+                    # the repository is traversed twice, clone it once for both
+                    clone_url = clones.enter_context(local_clone(clone_url))
+                    known_shas = _known_shas_of_(clone_url, index_since, old_commits)
+
+            if n_workers > 1:
+                records = _parallel_records_(clone_url, index_since, old_commits, known_shas, options, n_workers)
+            elif queue_size > 0:
+                records = prefetch(
+                    _serial_records_(clone_url, index_since, old_commits, known_shas, options), queue_size
+                )
             else:
-                # check if the same repo is already linked to another repo
-                try:
-                    commit = Commit.objects.get(sha=git_commit.hash)
-                except Commit.DoesNotExist:
-                    commit = _new_commit_(git_commit)
-                repo.commits.add(commit)
-
-                if repo.last_commit_at is None or (commit.created_at and commit.created_at > repo.last_commit_at):
-                    repo.last_commit_at = commit.created_at
+                records = _serial_records_(clone_url, index_since, old_commits, known_shas, options)
+            # time spent waiting for git and the code analysis, not overlapped with the writes
+            records = metrics.timed(records, "extract")
+
+            new_links, branch_updates = [], []
+            metrics.outcome = "ok"
+            for record in records:
+                # impose some timeout to avoid spending tons of time on very large repositories
+                if (datetime.now() - start_t).seconds > timeout:  # pragma: no cover
+                    print(f"### indexing not done after {timeout} seconds, aborting {log_url}")
+                    metrics.outcome = "timeout"
+                    records.close()
+                    break
+
+                if record.sha in old_commits:
+                    # we've seen this commit before, just compare branches and update
+                    # if needed
+                    commit = old_commits[record.sha]
+                    if record.branches != commit.branches:
+                        commit.branches = record.branches
+                        commit.branch_mask = branch_mask(record.branches)
+                        branch_updates.append(commit)
+                        if len(branch_updates) >= _BRANCH_BATCH_SIZE_:
+                            with metrics.phase("branches"):
+                                _update_branches_(branch_updates)
+                            branch_updates = []
+                        n_branch_updates += 1
+                else:
+                    if record.files is not None:
+                        _new_commit_(record, metrics)
+                        known_shas.add(record.sha)
+                    else:
+                        metrics.add("linked")
+                    # commits already indexed from another repo only need to be linked
+                    new_links.append(RepositoryCommitLink(repo=repo, commit_id=record.sha))
+                    if len(new_links) >= _LINK_BATCH_SIZE_:
+                        with metrics.phase("links"):
+                            RepositoryCommitLink.objects.bulk_create(new_links, ignore_conflicts=True)
+                        new_links = []
+
+                    created_at = _aware_(record.created_at)
+                    if repo.last_commit_at is None or created_at > repo.last_commit_at:
+                        repo.last_commit_at = created_at
+
+                    n_new_commits += 1
+
+                nn = n_new_commits + n_branch_updates
+                if nn > 0 and nn % 200 == 0 and show_progress:
+                    log(f"indexed {n_new_commits:5,} new commits and {n_branch_updates:5,} branch updates")
+
+            with metrics.phase("links"):
+                RepositoryCommitLink.objects.bulk_create(new_links, ignore_conflicts=True)
+            with metrics.phase("branches"):
+                _update_branches_(branch_updates)
+            metrics.add("branch_updates", n_branch_updates)
+
+            if (n_new_commits + n_branch_updates) > 0:
+                log(
+                    f"indexed {n_new_commits:5,} new commits and {n_branch_updates:5,} branch updates in the repository"
+                )
+
+            repo.last_indexed_at = datetime.utcnow().replace(tzinfo=timezone.utc)
+            repo.index_duration = (datetime.now() - start_t).total_seconds()
+            repo.save()
+
+            return n_new_commits + n_branch_updates
+
+        except GitCommandError as e:
+            metrics.outcome = "GitCommandError"
+            print(f"{e._cmdline} returned {e.stderr} for {log_url}")
+        except DatabaseError as e:
+            metrics.outcome = "DatabaseError"
+            exc = traceback.format_exc()
+            print(f"DatabaseError indexing repository {log_url} => {str(e)}\n{exc}")
+        except Exception as e:  # pragma: no cover
+            metrics.outcome = "Exception"
+            exc = traceback.format_exc()
+            print(f"Exception indexing repository {log_url} => {str(e)}\n{exc}")
 
-                n_new_commits += 1
+    return 0
 
-            nn = n_new_commits + n_branch_updates
-            if nn > 0 and nn % 200 == 0 and show_progress:
-                log(f"indexed {n_new_commits:5,} new commits and {n_branch_updates:5,} branch updates")
 
-        if (n_new_commits + n_branch_updates) > 0:
-            log(f"indexed {n_new_commits:5,} new commits and {n_branch_updates:5,} branch updates in the repository")
+def load_known_shas() -> ShaIndex:
+    """load the hashes of all commits in the database into a compact in memory index"""
+    return ShaIndex(Commit.objects.values_list("sha", flat=True).iterator(chunk_size=10000))
+
+
+def _known_shas_of_(path_to_repo: str, since: datetime, old_commits: dict[str, Commit]) -> ShaIndex:
+    """the hashes of the new commits of a repository that are already in the database"""
+    shas = [git_commit.hash for git_commit in traverse(path_to_repo, since) if git_commit.hash not in old_commits]
+    found: list[str] = []
+    for i in range(0, len(shas), _LINK_BATCH_SIZE_):
+        found.extend(Commit.objects.filter(sha__in=shas[i : i + _LINK_BATCH_SIZE_]).values_list("sha", flat=True))
+    return ShaIndex(found)
+
+
+def _serial_records_(
+    clone_url: str,
+    since: datetime,
+    old_commits: dict[str, Commit],
+    known_shas: ShaIndex,
+    options: Optional[ExtractOptions],
+) -> Generator[CommitRecord, None, None]:
+    # does not use the database, so that it can run in a background thread
+    for git_commit in traverse(clone_url, since):
+        if git_commit.hash in old_commits:
+            yield commit_record(git_commit, full=False)
+        elif git_commit.hash in known_shas:
+            # the same commit is already linked to another repo, skip the extraction
+            yield CommitRecord(sha=git_commit.hash, created_at=git_commit.committer_date)
+        else:
+            yield commit_record(git_commit, options=options)
+
+
+def _parallel_records_(
+    clone_url: str,
+    since: datetime,
+    old_commits: dict[str, Commit],
+    known_shas: ShaIndex,
+    options: Optional[ExtractOptions],
+    n_workers: int,
+) -> Generator[CommitRecord, None, None]:
+    """
+    split the commits of a repository into contiguous chunks of the rev-list and extract them
+    in worker processes. results are yielded as chunks complete, so the order is not maintained.
+    """
+    with local_clone(clone_url) as path_to_repo:
+        seen_shas, new_shas = [], []
+        for git_commit in traverse(path_to_repo, since):
+            if git_commit.hash in old_commits:
+                seen_shas.append(git_commit.hash)
+            elif git_commit.hash in known_shas:
+                yield CommitRecord(sha=git_commit.hash, created_at=git_commit.committer_date)
+            else:
+                new_shas.append(git_commit.hash)
 
-        repo.last_indexed_at = datetime.utcnow().replace(tzinfo=timezone.utc)
-        repo.save()
+        # use more chunks than workers so that a slow chunk does not hold up the others
+        n_chunks = n_workers * 4
+        executor = ProcessPoolExecutor(max_workers=n_workers, mp_context=multiprocessing.get_context("spawn"))
+        try:
+            futures = [
+                executor.submit(extract_chunk, path_to_repo, chunk, full, options)
+                for shas, full in [(new_shas, True), (seen_shas, False)]
+                for chunk in partition(shas, n_chunks)
+            ]
+            for future in as_completed(futures):
+                yield from future.result()
+        finally:
+            executor.shutdown(wait=True, cancel_futures=True)
+
+
+def index_gitlab_merge_requests(
+    project: projects.Project, show_progress: bool = False, metrics: Optional[IndexMetrics] = None
+) -> int:
+    n_requests = 0
+    log_url = display_url(project.http_url_to_repo)
 
-        return n_new_commits + n_branch_updates
+    if metrics is None:
+        metrics = IndexMetrics("index_merge_requests", redact_http_url(project.http_url_to_repo))
 
-    except GitCommandError as e:
-        print(f"{e._cmdline} returned {e.stderr} for {log_url}")
-    except DatabaseError as e:
-        exc = traceback.format_exc()
-        print(f"DatabaseError indexing repository {log_url} => {str(e)}\n{exc}")
-    except Exception as e:  # pragma: no cover
-        exc = traceback.format_exc()
-        print(f"Exception indexing repository {log_url} => {str(e)}\n{exc}")
+    with metrics.running():
+        try:
+            repo = ensure_repository(project.http_url_to_repo, "gitlab")
+            if repo is None:
+                log(f"### cannot create repostitory object for {log_url}")
+                return 0
+            metrics.repo_id = repo.id
+
+            if repo.is_active is False:
+                log(f"### skipping inactive repository {log_url}")
+                metrics.outcome = "inactive"
+                return 0
+
+            log(f"starting to index merge requests for {log_url}")
+
+            known_ids = _merge_request_ids_(repo.id)
+            with metrics.phase("api"):
+                merge_requests = project.mergerequests.list(all=True)
+            for mr in merge_requests:
+                mr_id = mr.get_id()
+
+                if mr.state not in ["closed", "merged"]:
+                    # index only closed or merged merge requests
+                    continue
+
+                if str(mr_id) in known_ids:
+                    # merge request already indexed
+                    continue
+
+                is_merged, merged_by_username, merge_commit_sha = False, None, None
+                if mr.state == "merged":
+                    is_merged, merged_by_username = True, mr.merge_user["username"]
+                    merge_commit_sha = mr.squash_commit_sha if mr.squash else mr.merge_commit_sha
+
+                with metrics.phase("db_write"):
+                    MergeRequest.objects.create(
+                        repo=repo,
+                        request_id=mr_id,
+                        state=mr.state,
+                        source_branch=mr.source_branch,
+                        target_branch=mr.target_branch,
+                        source_sha=mr.sha,
+                        merge_sha=merge_commit_sha,
+                        created_at=gitlab_ts_to_datetime(mr.created_at),
+                        merged_at=gitlab_ts_to_datetime(mr.merged_at),
+                        updated_at=gitlab_ts_to_datetime(mr.updated_at),
+                        # first_comment_at = models.CharField(max_length=32)
+                        is_merged=is_merged,
+                        merged_by_username=merged_by_username,
+                    )
+
+                n_requests += 1
+                metrics.add("merge_requests")
+
+                if n_requests > 0 and n_requests % 50 == 0 and show_progress:
+                    log(f"indexed {n_requests:3,} merge requests ")
+
+            if n_requests > 0:
+                log(f"indexed {n_requests:3,} merge requests in the repository")
+
+            metrics.outcome = "ok"
+            return n_requests
+
+        except GitCommandError as e:
+            metrics.outcome = "GitCommandError"
+            print(f"{e._cmdline} returned {e.stderr} for {log_url}")
+        except DatabaseError as e:
+            metrics.outcome = "DatabaseError"
+            exc = traceback.format_exc()
+            print(f"DatabaseError indexing repository {log_url} => {str(e)}\n{exc}")
+        except Exception as e:  # pragma: no cover
+            metrics.outcome = "Exception"
+            exc = traceback.format_exc()
+            print(f"Exception indexing repository {log_url} => {str(e)}\n{exc}")
 
     return 0
 
 
-def index_gitlab_merge_requests(project: projects.Project, show_progress: bool = False) -> int:
+def index_github_pull_requests(
+    git_repo: Repository.Repository, show_progress: bool = False, metrics: Optional[IndexMetrics] = None
+) -> int:
     n_requests = 0
-    log_url = display_url(project.http_url_to_repo)
-
-    try:
-        repo = ensure_repository(project.http_url_to_repo, "gitlab")
-        if repo is None:
-            log(f"### cannot create repostitory object for {log_url}")
-            return 0
-
-        if repo.is_active is False:
-            log(f"### skipping inactive repository {log_url}")
-            return 0
-
-        log(f"starting to index merge requests for {log_url}")
+    log_url = display_url(git_repo.clone_url)
 
-        merge_requests = project.mergerequests.list(all=True)
-        for mr in merge_requests:
-            mr_id = mr.get_id()
+    if metrics is None:
+        metrics = IndexMetrics("index_merge_requests", redact_http_url(git_repo.clone_url))
 
-            if mr.state not in ["closed", "merged"]:
-                # index only closed or merged merge requests
-                continue
+    with metrics.running():
+        try:
+            repo = ensure_repository(git_repo.clone_url, "github")
+            if repo is None:
+                log(f"### cannot create repostitory object for {log_url}")
+                return 0
+            metrics.repo_id = repo.id
+
+            if repo.is_active is False:
+                log(f"### skipping inactive repository {log_url}")
+                metrics.outcome = "inactive"
+                return 0
+
+            log(f"starting to index merge requests for {log_url}")
+
+            known_ids = _merge_request_ids_(repo.id)
+            pull_requests = git_repo.get_pulls(state="closed")
+            for pr in metrics.timed(iter(pull_requests), "api"):
+                if str(pr.number) in known_ids:
+                    # merge request already indexed
+                    continue
+
+                # TODO: pr.created_at is a naive datetime object, timezone is assumed to be UTC
+                with metrics.phase("db_write"):
+                    MergeRequest.objects.create(
+                        repo=repo,
+                        request_id=pr.number,
+                        state=pr.state,
+                        source_branch=pr.head.ref,
+                        target_branch=pr.base.ref,
+                        source_sha=pr.head.sha,  # does this value change when new commits are added to source branch?
+                        merge_sha=pr.merge_commit_sha,
+                        created_at=pr.created_at.replace(tzinfo=timezone.utc),
+                        merged_at=pr.merged_at.replace(tzinfo=timezone.utc),
+                        updated_at=pr.updated_at.replace(tzinfo=timezone.utc),
+                        # first_comment_at = ???
+                        is_merged=pr.merged,
+                        merged_by_username=pr.merged_by.login if pr.merged else None,
+                    )
+
+                n_requests += 1
+                metrics.add("merge_requests")
+
+                if n_requests > 0 and n_requests % 50 == 0 and show_progress:
+                    log(f"indexed {n_requests:3,} merge requests ")
+
+            if n_requests > 0:
+                log(f"indexed {n_requests:3,} merge requests in the repository")
+
+            metrics.outcome = "ok"
+            return n_requests
+
+        except GitCommandError as e:
+            metrics.outcome = "GitCommandError"
+            print(f"{e._cmdline} returned {e.stderr} for {log_url}")
+        except DatabaseError as e:
+            metrics.outcome = "DatabaseError"
+            exc = traceback.format_exc()
+            print(f"DatabaseError indexing repository {log_url} => {str(e)}\n{exc}")
+        except Exception as e:  # pragma: no cover
+            metrics.outcome = "Exception"
+            exc = traceback.format_exc()
+            print(f"Exception indexing repository {log_url} => {str(e)}\n{exc}")
 
-            db_obj = MergeRequest.objects.filter(request_id=mr_id, repo=repo).first()
-            if db_obj is not None:
-                # merge request already indexed
-                continue
+    return 0
 
-            is_merged, merged_by_username, merge_commit_sha = False, None, None
-            if mr.state == "merged":
-                is_merged, merged_by_username = True, mr.merge_user["username"]
-                merge_commit_sha = mr.squash_commit_sha if mr.squash else mr.merge_commit_sha
-
-            MergeRequest.objects.create(
-                repo=repo,
-                request_id=mr_id,
-                state=mr.state,
-                source_branch=mr.source_branch,
-                target_branch=mr.target_branch,
-                source_sha=mr.sha,
-                merge_sha=merge_commit_sha,
-                created_at=gitlab_ts_to_datetime(mr.created_at),
-                merged_at=gitlab_ts_to_datetime(mr.merged_at),
-                updated_at=gitlab_ts_to_datetime(mr.updated_at),
-                # first_comment_at = models.CharField(max_length=32)
-                is_merged=is_merged,
-                merged_by_username=merged_by_username,
-            ).save()
-
-            n_requests += 1
-
-            if n_requests > 0 and n_requests % 50 == 0 and show_progress:
-                log(f"indexed {n_requests:3,} merge requests ")
-
-        if n_requests > 0:
-            log(f"indexed {n_requests:3,} merge requests in the repository")
-
-        return n_requests
 
-    except GitCommandError as e:
-        print(f"{e._cmdline} returned {e.stderr} for {log_url}")
-    except DatabaseError as e:
-        exc = traceback.format_exc()
-        print(f"DatabaseError indexing repository {log_url} => {str(e)}\n{exc}")
-    except Exception as e:  # pragma: no cover
-        exc = traceback.format_exc()
-        print(f"Exception indexing repository {log_url} => {str(e)}\n{exc}")
+def _merge_request_ids_(repo_id: int) -> set[str]:
+    """ids of the merge requests already indexed, loaded once instead of a query per merge request"""
+    return set(MergeRequest.objects.filter(repo_id=repo_id).values_list("request_id", flat=True))
 
-    return 0
 
-
-def index_github_pull_requests(git_repo: Repository.Repository, show_progress: bool = False) -> int:
-    n_requests = 0
-    log_url = display_url(git_repo.clone_url)
+def analyze_stats_only_commits(clone_url: str, git_repo_type: str = "") -> int:
+    """
+    run the full extraction, including code metrics, for commits of a repository that
+    were indexed with line counts only because they exceeded ExtractOptions.max_files
+    or max_lines. their committed files are replaced.
+    """
+    log_url = display_url(redact_http_url(clone_url))
 
     try:
-        repo = ensure_repository(git_repo.clone_url, "github")
-        if repo is None:
-            log(f"### cannot create repostitory object for {log_url}")
-            return 0
-
-        if repo.is_active is False:
-            log(f"### skipping inactive repository {log_url}")
+        repo = ensure_repository(clone_url, git_repo_type)
+        shas = list(repo.commits.filter(is_stats_only=True).values_list("sha", flat=True))
+        if not shas:
             return 0
 
-        log(f"starting to index merge requests for {log_url}")
-
-        pull_requests = git_repo.get_pulls(state="closed")
-        for pr in pull_requests:
-            db_obj = MergeRequest.objects.filter(request_id=pr.number, repo=repo).first()
-            if db_obj is not None:
-                # merge request already indexed
-                continue
-
-            # TODO: pr.created_at is a naive datetime object, timezone is assumed to be UTC
-            MergeRequest.objects.create(
-                repo=repo,
-                request_id=pr.number,
-                state=pr.state,
-                source_branch=pr.head.ref,
-                target_branch=pr.base.ref,
-                source_sha=pr.head.sha,  # does this value change when new commits are added to source branch?
-                merge_sha=pr.merge_commit_sha,
-                created_at=pr.created_at.replace(tzinfo=timezone.utc),
-                merged_at=pr.merged_at.replace(tzinfo=timezone.utc),
-                updated_at=pr.updated_at.replace(tzinfo=timezone.utc),
-                # first_comment_at = ???
-                is_merged=pr.merged,
-                merged_by_username=pr.merged_by.login if pr.merged else None,
-            ).save()
-
-            n_requests += 1
-
-            if n_requests > 0 and n_requests % 50 == 0 and show_progress:
-                log(f"indexed {n_requests:3,} merge requests ")
-
-        if n_requests > 0:
-            log(f"indexed {n_requests:3,} merge requests in the repository")
-
-        return n_requests
+        log(f"analyzing {len(shas):5,} stats only commits in {log_url}")
+        analyzed: list[str] = []
+        try:
+            with local_clone(clone_url) as path_to_repo:
+                for sha in shas:
+                    record = extract_chunk(path_to_repo, [sha], True)[0]
+                    with transaction.atomic():
+                        commit = Commit.objects.get(sha=sha)
+                        commit.files.all().delete()
+                        _save_files_(commit, record.files or [])
+                        commit.is_stats_only = False
+                        commit.save(update_fields=["is_stats_only"])
+                    analyzed.append(sha)
+        finally:
+            if analyzed:
+                # the files were replaced, so are the stats, rollups and materialised rows derived from them
+                update_commit_stats(analyzed)
+
+        return len(analyzed)
 
     except GitCommandError as e:
         print(f"{e._cmdline} returned {e.stderr} for {log_url}")
     except DatabaseError as e:
         exc = traceback.format_exc()
-        print(f"DatabaseError indexing repository {log_url} => {str(e)}\n{exc}")
-    except Exception as e:  # pragma: no cover
+        print(f"DatabaseError analyzing repository {log_url} => {str(e)}\n{exc}")
+    except Exception as e:
         exc = traceback.format_exc()
-        print(f"Exception indexing repository {log_url} => {str(e)}\n{exc}")
+        print(f"Exception analyzing repository {log_url} => {str(e)}\n{exc}")
 
     return 0
 
 
-def update_commit_stats() -> None:
-    """update stats at commit level"""
+def reclassify_committed_files(batch_size: int = 500, dry_run: bool = False) -> tuple[int, int, int]:
+    """
+    apply the current ignore patterns to the is_on_exclude_list and is_superfluous flags
+    of all committed files, then update the stats of the commits whose files changed.
+    each distinct path is classified once, and rows are updated in batches of paths.
+    returns the number of distinct paths, updated files and updated commits
+    """
+    n_paths, n_files = 0, 0
+    changed_shas: set[str] = set()
+
+    def flush(batch: dict[str, bool]) -> None:
+        nonlocal n_files
+        for flag in (True, False):
+            paths = [path for path, is_ignored in batch.items() if is_ignored is flag]
+            if not paths:
+                continue
+            stale = CommittedFile.objects.filter(
+                Q(is_on_exclude_list=not flag) | Q(is_superfluous=not flag), file_path__in=paths
+            )
+            with transaction.atomic():
+                changed_shas.update(stale.values_list("commit_id", flat=True))
+                if dry_run:
+                    n_files += stale.count()
+                else:
+                    n_files += stale.update(is_on_exclude_list=flag, is_superfluous=flag)
+
+    batch: dict[str, bool] = {}
+    for path in CommittedFile.objects.values_list("file_path", flat=True).distinct().iterator(chunk_size=batch_size):
+        batch[path] = should_exclude_from_stats(path)
+        n_paths += 1
+        if len(batch) >= batch_size:
+            flush(batch)
+            batch = {}
+    flush(batch)
+
+    if changed_shas and not dry_run:
+        update_commit_stats(changed_shas)
+
+    log(f"reclassified {n_files:,} files of {len(changed_shas):,} commits in {n_paths:,} distinct paths")
+    return n_paths, n_files, len(changed_shas)
+
+
+def update_commit_stats(shas: Optional[Iterable[str]] = None) -> None:
+    """update stats at commit level, only for the given commits if shas is not None"""
+    if shas is not None:
+        shas = list(shas)
+        _update_stats_of_commits_(shas)
+        refresh_rollups(shas)
+        if settings.INDEXER_MATERIALIZE_COMMIT_DATA:
+            refresh_commit_data(shas)
+        return
+
     log("updating commit stats")
     cursor = connection.cursor()
     for statement in STATS_SQL:
@@ -266,73 +587,175 @@ def update_commit_stats() -> None:
             exc = traceback.format_exc()
             print(f"Exception execute statement {statement} => {str(e)}\n{exc}")
 
+    refresh_rollups()
+    if settings.INDEXER_MATERIALIZE_COMMIT_DATA:
+        refresh_commit_data()
+
+
+def refresh_commit_data(shas: Optional[Iterable[str]] = None, full: bool = False) -> int:
+    """
+    refresh all_commit_data_mat, the materialised all_commit_data view, read through all_commit_data_fast.
+    replaces the rows of the given commits, or adds the rows of the commits indexed since the
+    last refresh when shas is None. the table is rebuilt when full is True or it does not exist.
+    callers changing the files or stats of existing commits pass their shas, see update_commit_stats.
+    returns the number of commits refreshed, or -1 after a rebuild
+    """
+    tables = connection.introspection.table_names(include_views=True)
+    if "all_commit_data" not in tables:
+        # the view is created by update_commit_stats
+        return 0
+
+    with transaction.atomic(), connection.cursor() as cursor:
+        if full or "all_commit_data_fast" not in tables:
+            log("building all_commit_data_mat")
+            for statement in MATERIALIZE_SQL:
+                cursor.execute(statement)
+            return -1
+
+        if shas is None:
+            cursor.execute(UNMATERIALIZED_SHAS_SQL)
+            shas = [row[0] for row in cursor.fetchall()]
+        else:
+            shas = list(shas)
+
+        for i in range(0, len(shas), _STATS_BATCH_SIZE_):
+            batch = shas[i : i + _STATS_BATCH_SIZE_]
+            for statement in REFRESH_COMMIT_DATA_SQL:
+                cursor.execute(statement.format(shas=",".join(["%s"] * len(batch))), batch)
+
+    log(f"refreshed all_commit_data_mat for {len(shas):,} commits")
+    return len(shas)
 
-def _new_commit_(git_commit: PyDrillerCommit) -> Commit:
-    author, created = Author.objects.get_or_create(
-        name=git_commit.committer.name.lower(),
-        email=git_commit.committer.email.lower(),
-    )
-    if created:
-        author.real_name = author.name
-        author.real_email = author.email
-        author.save()
 
-    if is_aware(git_commit.committer_date):
-        commit_dt = git_commit.committer_date
-    else:
-        commit_dt = make_aware(git_commit.committer_date)
+def _update_branches_(commits: list[Commit]) -> None:
+    # a release branch cut can change the branches of tens of thousands of commits
+    with transaction.atomic():
+        Commit.objects.bulk_update(commits, ["branches", "branch_mask"], batch_size=_BRANCH_BATCH_SIZE_)
+
+
+def _update_stats_of_commits_(shas: list[str]) -> None:
+    with connection.cursor() as cursor:
+        for i in range(0, len(shas), _STATS_BATCH_SIZE_):
+            batch = shas[i : i + _STATS_BATCH_SIZE_]
+            cursor.execute(COMMIT_STATS_SQL.format(shas=",".join(["%s"] * len(batch))), batch)
+
+
+def _new_commit_(record: CommitRecord, metrics: Optional[IndexMetrics] = None) -> Commit:
+    if metrics is None:
+        metrics = IndexMetrics("new_commit")
+
+    with metrics.phase("authors"):
+        # processes indexing repositories at the same time can create the same author, the
+        # unique constraint on name and email makes get_or_create return the one created first
+        author, _ = Author.objects.get_or_create(
+            name=record.author_name,
+            email=record.author_email,
+            defaults={"real_name": record.author_name, "real_email": record.author_email},
+        )
 
     commit = Commit(
-        sha=git_commit.hash,
-        message=git_commit.msg[:2048],  # some commits has super long message, e.g. squash merge
+        sha=record.sha,
+        message=record.message,
         author=author,
-        is_merge=git_commit.merge,
-        branches=normalize_branches(git_commit.branches),
-        n_lines=git_commit.lines,
-        n_files=git_commit.files,
-        n_insertions=git_commit.insertions,
-        n_deletions=git_commit.deletions,
+        is_merge=record.is_merge,
+        branches=record.branches,
+        branch_mask=branch_mask(record.branches),
+        n_lines=record.n_lines,
+        n_files=record.n_files,
+        n_insertions=record.n_insertions,
+        n_deletions=record.n_deletions,
         # comment to save some time. metrics not used for now
         # dmm_unit_size=git_commit.dmm_unit_size,
         # dmm_unit_complexity=git_commit.dmm_unit_complexity,
         # dmm_unit_interfacing=git_commit.dmm_unit_interfacing,
-        created_at=commit_dt,
+        created_at=_aware_(record.created_at),
+        is_stats_only=record.stats_only,
     )
-    commit.save()
-
-    for mod in git_commit.modified_files:
-        file_path = mod.new_path or mod.old_path
-        flag = should_exclude_from_stats(file_path)
-        new_file = CommittedFile(
-            commit_sha=git_commit.hash,
-            change_type=str(mod.change_type).split(".")[1],  # enum ModificationType.ADD => "ADD"
-            file_path=file_path,
-            file_name=mod.filename,
-            n_lines_added=mod.added_lines,
-            n_lines_deleted=mod.deleted_lines,
-            n_lines_changed=mod.added_lines + mod.deleted_lines,
-            n_lines_of_code=mod.nloc if mod.nloc else 0,
-            n_methods=len(mod.methods),
-            n_methods_changed=len(mod.changed_methods),
-            is_on_exclude_list=flag,
-            is_superfluous=flag,
-            commit=commit,
+    try:
+        with metrics.phase("db_write"), transaction.atomic():
+            commit.save(force_insert=True)
+            _save_files_(commit, record.files or [])
+    except IntegrityError:
+        # another process indexing a fork of the same repository inserted the commit first
+        return Commit.objects.get(sha=record.sha)
+
+    metrics.add("commits")
+    metrics.add("files", len(record.files or []))
+    return commit
+
+
+def _save_files_(commit: Commit, file_records: list[FileRecord]) -> None:
+    new_files = []
+    for file_record in file_records:
+        flag = should_exclude_from_stats(file_record.file_path)
+        new_files.append(
+            CommittedFile(
+                commit_sha=commit.sha,
+                change_type=file_record.change_type,
+                file_path=file_record.file_path,
+                file_name=file_record.file_name,
+                n_lines_added=file_record.n_lines_added,
+                n_lines_deleted=file_record.n_lines_deleted,
+                n_lines_changed=file_record.n_lines_added + file_record.n_lines_deleted,
+                n_lines_of_code=file_record.n_lines_of_code,
+                n_methods=file_record.n_methods,
+                n_methods_changed=file_record.n_methods_changed,
+                is_on_exclude_list=flag,
+                is_superfluous=flag,
+                commit=commit,
+            )
         )
-        new_file.save()
+    # large commits can have tens of thousands of files
+    CommittedFile.objects.bulk_create(new_files, batch_size=_FILE_BATCH_SIZE_)
 
-    return commit
 
+def _aware_(dt: datetime) -> datetime:
+    return dt if is_aware(dt) else make_aware(dt)
 
-def export_all_data(csv_file: str) -> None:
-    cursor = connection.cursor()
-    result = cursor.execute(QUERY_SQL["all_commit_data"])
-    columns = [col[0] for col in cursor.description]
+
+def export_all_data(csv_file: str) -> int:
+    """export all_commit_data to a csv file, gzip compressed when the file name ends with .gz"""
+    with open(csv_file, "wb") as f:
+        n_rows = write_all_data(f, compress=csv_file.endswith(".gz"))
+    log(f"exported {n_rows} rows to {csv_file}")
+    return n_rows
+
+
+def write_all_data(
+    out: BinaryIO,
+    compress: bool = False,
+    where: str = "",
+    params: Sequence[Any] = (),
+    on_rows: Optional[Callable[[list[str], list[tuple]], None]] = None,
+) -> int:
+    """
+    write all_commit_data as csv to a binary stream, e.g. a file or an upload, and return the number of rows.
+    the rows are read in batches from a server side cursor where supported, so memory use does not grow with them.
+    where is an optional condition with placeholders for params, to export a partition of the rows.
+    on_rows is called with the column names and each batch of rows written.
+    """
+    table = "all_commit_data_fast" if settings.INDEXER_MATERIALIZE_COMMIT_DATA else "all_commit_data"
+    sql = PARTITION_SQL.format(table=table, where=where) if where else QUERY_SQL[table]
+    # no name and mtime=0, so that the same rows always compress to the same bytes
+    gz = gzip.GzipFile(filename="", fileobj=out, mode="wb", mtime=0) if compress else None
+    text = io.TextIOWrapper(cast(IO[bytes], gz or out), encoding="utf-8", newline="")
 
     n_rows = 0
-    with open(csv_file, "w", newline="") as csvfile:
-        writer = csv.writer(csvfile)
-        writer.writerow(columns)
-        for row in result.fetchall():
-            n_rows += 1
-            writer.writerow(row)
-        log(f"exported {n_rows} rows to {csv_file}")
+    try:
+        with connection.chunked_cursor() as cursor:
+            cursor.execute(sql, params)
+            writer = csv.writer(text)
+            columns = [col[0] for col in cursor.description]
+            writer.writerow(columns)
+            while rows := cursor.fetchmany(_EXPORT_BATCH_SIZE_):
+                writer.writerows(rows)
+                if on_rows is not None:
+                    on_rows(columns, rows)
+                n_rows += len(rows)
+    finally:
+        # leave the stream open for the caller
+        text.flush()
+        text.detach()
+        if gz is not None:
+            gz.close()
+    return n_rows